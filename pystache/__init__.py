@@ -6,8 +6,10 @@ TODO: add a docstring.
 
 # We keep all initialization code in a separate module.
 
-from pystache.init import parse, render, Renderer, TemplateSpec
+from pystache.init import (compile, parse, render, Renderer, Safe, SectionLambda,
+                           specialize, TemplateSpec)
 
-__all__ = ['parse', 'render', 'Renderer', 'TemplateSpec']
+__all__ = ['compile', 'parse', 'render', 'Renderer', 'Safe', 'SectionLambda', 'specialize',
+           'TemplateSpec']
 
 __version__ = '0.5.4'  # Also change in setup.py.
@@ -0,0 +1,367 @@
+# coding: utf-8
+
+"""
+Provides the asyncio support behind Renderer.render_async().
+
+The rendering process itself remains synchronous.  The functions in this
+module run it on the event loop's default executor, and let the rendering
+thread wait on the event loop whenever it encounters an awaitable context
+value.  This keeps the event loop free while templates render, and lets
+independent awaitables run concurrently.
+
+This module can be imported in any version of Python, but its functions
+require asyncio (Python 3.5 or later).
+
+"""
+
+from collections import deque
+import sys
+
+try:
+    # The asyncio module is new in Python 3.4, and inspect.isawaitable()
+    # is new in Python 3.5.
+    import asyncio
+    from concurrent.futures import Future
+    from inspect import isawaitable
+except ImportError:
+    asyncio = None
+
+from pystache.common import PystacheError
+from pystache.context import _get_value, _NOT_FOUND, ContextStack, KeyNotFoundError
+from pystache.renderengine import context_get
+
+
+# Marks the end of the pieces passed from a rendering thread.
+_END = object()
+
+# The number of pieces that a rendering thread produces ahead of the
+# consumer of an async iterator.
+_BUFFER_SIZE = 64
+
+
+def _check_asyncio():
+    if asyncio is None:
+        raise PystacheError("Asynchronous rendering requires asyncio "
+                            "(Python 3.5 or later).")
+
+
+def _get_loop():
+    try:
+        # This function is new in Python 3.7.
+        return asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        return asyncio.get_event_loop()
+
+
+class _Awaiter(object):
+
+    """
+    Resolves awaitable context values on behalf of a rendering thread.
+
+    An instance is created for each render and is used only by the thread
+    rendering it.  Its get() method is a drop-in replacement for
+    context_get() that replaces awaitables with their results.
+
+    """
+
+    def __init__(self, loop, keys):
+        """
+        Arguments:
+
+          loop: the event loop on which to await values.
+
+          keys: the names referenced by the template being rendered.
+            Awaitables stored under these names in context dictionaries
+            are awaited together.
+
+        """
+        self.loop = loop
+        self.names = set([key.split('.')[0] for key in keys])
+        # Maps id(awaitable) to an (awaitable, result) pair.  We keep a
+        # reference to each awaitable so that its id cannot be reused.
+        # Caching is needed since coroutines can only be awaited once.
+        self._results = {}
+
+    def _wait(self, awaitables):
+        """
+        Await the given awaitables concurrently, and record their results.
+
+        This method blocks the calling thread until all are done.
+
+        """
+        done = Future()
+
+        def copy_result(gathered):
+            if gathered.cancelled():
+                done.cancel()
+            elif gathered.exception() is not None:
+                done.set_exception(gathered.exception())
+            else:
+                done.set_result(gathered.result())
+
+        # This function runs in the event loop's thread.
+        def start():
+            try:
+                gathered = asyncio.gather(*awaitables)
+            except Exception:
+                done.set_exception(sys.exc_info()[1])
+                return
+            gathered.add_done_callback(copy_result)
+
+        self.loop.call_soon_threadsafe(start)
+        results = done.result()
+
+        for awaitable, result in zip(awaitables, results):
+            self._results[id(awaitable)] = (awaitable, result)
+
+    def _find_pending(self, stack):
+        """
+        Return the awaitables not yet awaited among the referenced values
+        of the dictionaries in the given context stack.
+
+        """
+        pending = []
+        for item in stack._stack:
+            if not isinstance(item, dict):
+                continue
+            for name in self.names:
+                if name not in item:
+                    continue
+                value = item[name]
+                if isawaitable(value) and id(value) not in self._results:
+                    pending.append(value)
+        return pending
+
+    def _await(self, value, stack):
+        while isawaitable(value):
+            entry = self._results.get(id(value))
+            if entry is None:
+                pending = [value]
+                for other in self._find_pending(stack):
+                    if other is not value:
+                        pending.append(other)
+                self._wait(pending)
+                entry = self._results[id(value)]
+            value = entry[1]
+        return value
+
+    def resolve(self, value, stack):
+        """
+        Return the given value with any awaitables replaced by their results.
+
+        If the value is a list or tuple, the awaitables among its items are
+        awaited concurrently, and a new list is returned.
+
+        """
+        value = self._await(value, stack)
+
+        if isinstance(value, (list, tuple)):
+            awaitables = [item for item in value if isawaitable(item)]
+            if awaitables:
+                pending = [item for item in awaitables if id(item) not in self._results]
+                if pending:
+                    self._wait(pending)
+                value = [self._await(item, stack) for item in value]
+
+        return value
+
+    def get(self, stack, name):
+        """
+        Resolve a name against a context stack like context_get().
+
+        Awaitables are resolved at each part of a dotted name.
+
+        """
+        if name == '.':
+            return self.resolve(context_get(stack, name), stack)
+
+        parts = name.split('.')
+
+        try:
+            result = context_get(stack, parts[0])
+        except KeyNotFoundError:
+            raise KeyNotFoundError(name, "first part")
+        result = self.resolve(result, stack)
+
+        for part in parts[1:]:
+            result = _get_value(result, part)
+            if result is _NOT_FOUND:
+                raise KeyNotFoundError(name, "missing %s" % repr(part))
+            result = self.resolve(result, stack)
+
+        return result
+
+
+class _AsyncIterator(object):
+
+    """
+    An asynchronous iterator over the pieces produced by a rendering thread.
+
+    The rendering thread runs ahead of the consumer by at most
+    _BUFFER_SIZE pieces: it produces pieces in batches, each started on
+    the event loop's default executor when the consumer has taken the
+    pieces of the batch before.  If the iterator is closed with aclose(),
+    or a call to __anext__() is cancelled, no further batch is started and
+    the rendering is stopped.
+
+    """
+
+    def __init__(self, loop, pieces):
+        self._loop = loop
+        self._pieces = pieces
+        self._buffer = deque()
+        self._waiter = None
+        self._finished = False
+        self._closed = False
+        # Whether a batch is being produced.
+        self._running = False
+        # The future that aclose() returned while a batch was running.
+        self._stopped = None
+
+        self._start_batch()
+
+    def _start_batch(self):
+        if self._running or self._finished or self._closed:
+            return
+        if len(self._buffer) >= _BUFFER_SIZE:
+            return
+        self._running = True
+        self._loop.run_in_executor(None, self._produce)
+
+    # This method runs in the rendering thread.
+    def _produce(self):
+        put = self._loop.call_soon_threadsafe
+        pieces = self._pieces
+        try:
+            for i in range(_BUFFER_SIZE):
+                if self._closed:
+                    pieces.close()
+                    break
+                try:
+                    piece = pieces.next()
+                except StopIteration:
+                    put(self._put, (_END, None))
+                    break
+                put(self._put, (piece, None))
+        except Exception:
+            put(self._put, (None, sys.exc_info()[1]))
+        put(self._end_batch)
+
+    def _end_batch(self):
+        self._running = False
+        if self._stopped is not None:
+            self._stopped.set_result(None)
+            self._stopped = None
+        self._start_batch()
+
+    def _put(self, entry):
+        if entry[0] is _END or entry[1] is not None:
+            # Then no further batch is needed.
+            self._finished = True
+        waiter = self._waiter
+        self._waiter = None
+        if waiter is None or waiter.done():
+            self._buffer.append(entry)
+            return
+        self._deliver(waiter, entry)
+
+    def _deliver(self, future, entry):
+        piece, error = entry
+        if error is not None:
+            future.set_exception(error)
+        elif piece is _END:
+            future.set_exception(StopAsyncIteration())
+        else:
+            future.set_result(piece)
+
+    def _on_next_done(self, future):
+        if future.cancelled():
+            self.aclose()
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = self._loop.create_future()
+        if self._buffer:
+            self._deliver(future, self._buffer.popleft())
+            self._start_batch()
+        elif self._finished or self._closed:
+            future.set_exception(StopAsyncIteration())
+        else:
+            self._waiter = future
+            future.add_done_callback(self._on_next_done)
+        return future
+
+    def aclose(self):
+        """
+        Stop the rendering, and return an awaitable that completes once
+        it is stopped.
+
+        """
+        future = self._loop.create_future()
+        if self._closed or self._finished:
+            self._closed = True
+            future.set_result(None)
+            return future
+
+        self._closed = True
+        self._buffer.clear()
+        if self._running:
+            # The running batch closes the pieces.
+            self._stopped = future
+            return future
+        # Closing the generator runs its finally clauses, which could call
+        # rendering code.
+        return self._loop.run_in_executor(None, self._pieces.close)
+
+
+def _make_engine(renderer, loop, parsed):
+    """
+    Return a RenderEngine that awaits awaitable context values.
+
+    """
+    awaiter = _Awaiter(loop, parsed.get_keys())
+    engine = renderer._make_render_engine()
+    engine.resolve_context = renderer._make_resolve_context(awaiter.get)
+
+    return engine
+
+
+def render_async(renderer, parsed, context, kwargs):
+    """
+    Return an asyncio future for the rendering of a parsed template.
+
+    See Renderer.render_async() for more information.
+
+    """
+    _check_asyncio()
+    loop = _get_loop()
+
+    engine = _make_engine(renderer, loop, parsed)
+    render_func = lambda engine, stack: parsed.render(engine, stack)
+
+    stack = ContextStack.create(*context, **kwargs)
+
+    def render():
+        return renderer._render_with(render_func, engine, stack)
+
+    return loop.run_in_executor(None, render)
+
+
+def render_async_iter(renderer, parsed, context, kwargs):
+    """
+    Return an async iterator over the rendering of a parsed template.
+
+    See Renderer.render_async_iter() for more information.
+
+    """
+    _check_asyncio()
+    loop = _get_loop()
+
+    engine = _make_engine(renderer, loop, parsed)
+    iter_func = lambda engine, stack: parsed.iter_render(engine, stack)
+    stack = ContextStack.create(*context, **kwargs)
+    pieces = renderer._iter_with(iter_func, engine, stack)
+
+    return _AsyncIterator(loop, pieces)
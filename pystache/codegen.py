@@ -0,0 +1,457 @@
+# coding: utf-8
+
+"""
+Compiles parsed templates to Python functions specialized for the shape
+of the contexts they are rendered with.
+
+A Renderer constructed with a jit_threshold renders a ParsedTemplate the
+usual way until it has rendered it that many times.  It then observes
+the context of the next render: the types of the items on the context
+stack, of the items of each section, and of the values of each variable
+tag.  From these it generates the source of a function that renders the
+template in straight-line code, with dictionary lookups in place of
+ContextStack.get() and with checks of the observed types (guards) in
+place of the type tests that RenderEngine makes for each value.
+
+A guard that fails (for example when an item that was a dictionary is an
+object) abandons the compiled function's output, and the template is
+rendered the usual way instead.  The template is then observed and
+compiled again after another jit_threshold renders.
+
+Templates are only compiled when the observed contexts consist of
+dictionaries, lists, and instances of built-in types, and when the
+template has no partials, since these are the cases in which looking up
+a name cannot run user code.  Lambdas and objects are always rendered
+the usual way.
+
+"""
+
+from pystache.common import is_string, _STRING_TYPES
+from pystache.context import _BUILTIN_MODULE
+from pystache.parser import (_ChangeNode, _CommentNode, _ConditionalNode, _EscapeNode,
+                             _InvertedNode, _LiteralNode, _SectionNode)
+
+
+class _Deopt(Exception):
+
+    """Raised by a compiled function when a guard fails."""
+
+    pass
+
+
+class _Unsupported(Exception):
+
+    """Raised when a template or context cannot be compiled."""
+
+    pass
+
+
+class _Missing(object):
+    pass
+_MISSING = _Missing()
+
+
+def _get_part(value, part):
+    """
+    Return the value of a part of a dotted name, or _MISSING.
+
+    """
+    if type(value) is dict:
+        if part in value:
+            return value[part]
+        return _MISSING
+    if type(value).__module__ == _BUILTIN_MODULE:
+        return _MISSING
+    # Then the value is an object, and getting the attribute could call
+    # a method.
+    raise _Deopt()
+
+
+def _missing(strict):
+    if strict:
+        # The usual rendering raises the error.
+        raise _Deopt()
+    return u''
+
+
+def _get_parts(value, parts, strict):
+    """
+    Resolve the remaining parts of a dotted name (as a compiled function
+    does).
+
+    """
+    for part in parts:
+        value = _get_part(value, part)
+        if value is _MISSING:
+            return _missing(strict)
+    return value
+
+
+def _convert(engine, value, escape):
+    """
+    Convert a variable tag value to unicode, as RenderEngine does.
+
+    """
+    if callable(value):
+        # Lambdas are rendered the usual way.
+        raise _Deopt()
+    if not is_string(value):
+        value = engine.to_str(value)
+    if escape:
+        return engine.escape(value)
+    return engine.literal(value)
+
+
+def _lookup(frames, name):
+    """
+    Resolve a name against a list of context stack items as
+    ContextStack.get() does, with missing names resolving to the empty
+    string.
+
+    """
+    if name == '.':
+        if frames:
+            return frames[-1]
+        return u''
+
+    parts = name.split('.')
+    for frame in reversed(frames):
+        if type(frame) is dict:
+            if parts[0] in frame:
+                value = frame[parts[0]]
+                break
+        elif type(frame).__module__ != _BUILTIN_MODULE:
+            raise _Unsupported()
+    else:
+        return u''
+
+    for part in parts[1:]:
+        try:
+            value = _get_part(value, part)
+        except _Deopt:
+            raise _Unsupported()
+        if value is _MISSING:
+            return u''
+    return value
+
+
+class _Observer(object):
+
+    """
+    Records the types that a render of a template encounters.
+
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        # Maps a section node to the set of the types of its items.
+        self.item_types = {}
+        # Maps a variable tag node to the set of the types of its values.
+        self.value_types = {}
+
+    def _add(self, types, node, value):
+        types.setdefault(node, set()).add(type(value))
+
+    def observe(self, nodes, frames):
+        for node in nodes:
+            if type(node) is unicode or isinstance(node, (_CommentNode, _ChangeNode)):
+                continue
+            if isinstance(node, (_EscapeNode, _LiteralNode)):
+                value = _lookup(frames, node.key)
+                if callable(value):
+                    raise _Unsupported()
+                self._add(self.value_types, node, value)
+            elif isinstance(node, _SectionNode):
+                self._observe_section(node, _lookup(frames, node.key), frames)
+            elif isinstance(node, _InvertedNode):
+                if not self.engine.coerce_section_data(_lookup(frames, node.key)):
+                    self.observe(node.parsed_section._parse_tree, frames)
+            elif isinstance(node, _ConditionalNode):
+                value = _lookup(frames, node.key)
+                if self.engine.coerce_section_data(value):
+                    self._observe_section(node.section, value, frames)
+                else:
+                    self.observe(node.inverted.parsed_section._parse_tree, frames)
+            else:
+                # For example partials, whose text can change.
+                raise _Unsupported()
+
+    def _observe_section(self, node, value, frames):
+        # Coerce before anything else tests the value, since the truth
+        # value of a structured array is ambiguous.
+        values = self.engine.coerce_section_data(value)
+        if type(values) not in (list, tuple):
+            # For example a generator, which observing would exhaust
+            # before the render that follows.
+            raise _Unsupported()
+        for item in values:
+            if callable(item) or (type(item) is not dict and
+                                  type(item).__module__ != _BUILTIN_MODULE):
+                raise _Unsupported()
+            self._add(self.item_types, node, item)
+            self.observe(node.parsed._parse_tree, frames + [item])
+
+
+class _Compiler(object):
+
+    """
+    Generates the source of a render function from a parse tree and the
+    types an _Observer recorded.
+
+    """
+
+    def __init__(self, observer):
+        self.observer = observer
+        self.lines = []
+        self.indent = 1
+        # Maps the names in the generated source to their values.
+        self.namespace = {'_Deopt': _Deopt, '_convert': _convert, '_get_parts': _get_parts,
+                          '_missing': _missing}
+
+    def _line(self, line):
+        self.lines.append('    ' * self.indent + line)
+
+    def _const(self, value):
+        name = '_c%d' % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def _get_single_type(self, types, node):
+        node_types = types.get(node, ())
+        if len(node_types) != 1:
+            return None
+        return list(node_types)[0]
+
+    def compile(self, parsed, frame_types):
+        frames = []
+        self.lines.append('def render(frames, engine, strict):')
+        self._line('if len(frames) != %d:' % len(frame_types))
+        self._line('    raise _Deopt()')
+        for index, frame_type in enumerate(frame_types):
+            var = 'f%d' % index
+            self._line('%s = frames[%d]' % (var, index))
+            self._line('if type(%s) is not %s:' % (var, self._const(frame_type)))
+            self._line('    raise _Deopt()')
+            frames.append((var, frame_type))
+
+        return self._compile_function(parsed, frames)
+
+    def _compile_function(self, parsed, frames):
+        """
+        Generate the body of the render function after its guards, and
+        return the function.
+
+        """
+        self._line('escape = engine.escape')
+        self._line('literal = engine.literal')
+        self._line('to_str = engine.to_str')
+        self._line('coerce = engine.coerce_section_data')
+        self._line('parts = []')
+        self._line('a = parts.append')
+        self._compile_nodes(parsed._parse_tree, frames)
+        self._line("return %s.join(parts)" % self._const(u''))
+
+        source = '\n'.join(self.lines) + '\n'
+        code = compile(source, '<pystache template>', 'exec')
+        namespace = self.namespace
+        exec code in namespace
+
+        return namespace['render']
+
+    def _compile_nodes(self, nodes, frames):
+        start = len(self.lines)
+        for node in nodes:
+            if type(node) is unicode:
+                self._line('a(%s)' % self._const(node))
+            elif isinstance(node, (_EscapeNode, _LiteralNode)):
+                self._compile_variable(node, frames)
+            elif isinstance(node, _SectionNode):
+                shape = self._compile_lookup(node.key, frames)
+                self._compile_section(node, frames, shape)
+            elif isinstance(node, _InvertedNode):
+                self._compile_lookup(node.key, frames)
+                self._line('if not coerce(v):')
+                self._compile_block(node.parsed_section._parse_tree, frames)
+            elif isinstance(node, _ConditionalNode):
+                shape = self._compile_lookup(node.key, frames)
+                self._compile_section(node.section, frames, shape)
+                self._line('else:')
+                self._compile_block(node.inverted.parsed_section._parse_tree, frames)
+            elif not isinstance(node, (_CommentNode, _ChangeNode)):
+                self._compile_other(node, frames)
+        if len(self.lines) == start:
+            self._line('pass')
+
+    def _compile_other(self, node, frames):
+        """
+        Generate code that renders a node of another type (e.g. a partial).
+
+        """
+        # The _Observer rejects templates with such nodes.
+        raise _Unsupported()
+
+    def _compile_block(self, nodes, frames):
+        self.indent += 1
+        self._compile_nodes(nodes, frames)
+        self.indent -= 1
+
+    def _compile_lookup(self, key, frames):
+        """
+        Generate code that sets v to the value of a name.
+
+        Returns what is known of the value's shape (None here).
+
+        """
+        if key == '.':
+            if frames:
+                self._line('v = %s' % frames[-1][0])
+            else:
+                self._line('v = _missing(strict)')
+            return
+
+        parts = key.split('.')
+        name = self._const(parts[0])
+        # Items of built-in types other than dict do not define names.
+        dict_vars = [var for var, frame_type in reversed(frames) if frame_type is dict]
+        if not dict_vars:
+            self._line('v = _missing(strict)')
+        else:
+            keyword = 'if'
+            for var in dict_vars:
+                self._line('%s %s in %s:' % (keyword, name, var))
+                self._line('    v = %s[%s]' % (var, name))
+                keyword = 'elif'
+            self._line('else:')
+            self._line('    v = _missing(strict)')
+
+        if len(parts) > 1:
+            self._line('v = _get_parts(v, %s, strict)' % self._const(tuple(parts[1:])))
+
+        return None
+
+    def _compile_variable(self, node, frames):
+        self._compile_lookup(node.key, frames)
+
+        is_escape = isinstance(node, _EscapeNode)
+        convert = 'a(_convert(engine, v, %s))' % is_escape
+        value_type = self._get_single_type(self.observer.value_types, node)
+        if value_type is None:
+            self._line(convert)
+            return
+
+        if issubclass(value_type, _STRING_TYPES):
+            fast = 'v'
+        else:
+            fast = 'to_str(v)'
+        if is_escape:
+            fast = 'escape(%s)' % fast
+        else:
+            fast = 'literal(%s)' % fast
+
+        self._line('if type(v) is %s:' % self._const(value_type))
+        self._line('    a(%s)' % fast)
+        self._line('else:')
+        self._line('    ' + convert)
+
+    def _compile_sequence_guard(self):
+        """
+        Generate code that raises _Deopt unless v is a list or tuple.
+
+        A loop over an iterator that deoptimizes partway through would
+        leave only the rest of the iterator for the usual rendering, so the
+        generated loops run over lists and tuples only.
+
+        """
+        self._line('if type(v) is not list and type(v) is not tuple:')
+        self._line('    raise _Deopt()')
+
+    def _compile_section(self, node, frames, shape):
+        self._line('v = coerce(v)')
+        self._line('if v:')
+        self.indent += 1
+        item_type = self._get_single_type(self.observer.item_types, node)
+        if item_type is None:
+            # The section was not rendered, or its items had mixed types.
+            self._line('raise _Deopt()')
+        else:
+            var = 'f%d' % len(frames)
+            self._compile_sequence_guard()
+            self._line('for %s in v:' % var)
+            self._line('    if type(%s) is not %s:' % (var, self._const(item_type)))
+            self._line('        raise _Deopt()')
+            self._compile_block(node.parsed._parse_tree, frames + [(var, item_type)])
+        self.indent -= 1
+
+
+def compile_template(parsed, engine, frames):
+    """
+    Return a function specialized for the types in the given context stack
+    items that renders a ParsedTemplate, or None if this is not possible.
+
+    The function has signature render(frames, engine, strict), where
+    frames is the list of context stack items and strict is whether
+    missing tags are errors.  It raises _Deopt if the context does not
+    have the types it was compiled for.
+
+    """
+    frame_types = []
+    for frame in frames:
+        if type(frame) is not dict and type(frame).__module__ != _BUILTIN_MODULE:
+            return None
+        frame_types.append(type(frame))
+
+    observer = _Observer(engine)
+    try:
+        observer.observe(parsed._parse_tree, list(frames))
+    except _Unsupported:
+        return None
+
+    return _Compiler(observer).compile(parsed, frame_types)
+
+
+class _JitState(object):
+
+    """
+    The compilation state of a ParsedTemplate.
+
+    """
+
+    __slots__ = ('count', 'render')
+
+    def __init__(self):
+        # The number of renders since the template was last observed.
+        self.count = 0
+        self.render = None
+
+
+def render(parsed, engine, stack, threshold, strict):
+    """
+    Render a ParsedTemplate, compiling it once it has been rendered
+    threshold times.
+
+    Arguments:
+
+      strict: whether missing tags are errors (see Renderer).
+
+    """
+    state = parsed._jit
+    if state is None:
+        state = _JitState()
+        parsed._jit = state
+
+    compiled = state.render
+    if compiled is not None:
+        try:
+            return compiled(stack._stack, engine, strict)
+        except _Deopt:
+            # The context has a different shape, so we start over.
+            state.render = None
+            state.count = 0
+        return parsed.render(engine, stack)
+
+    state.count += 1
+    if state.count > threshold:
+        state.count = 0
+        state.render = compile_template(parsed, engine, stack._stack)
+
+    return parsed.render(engine, stack)
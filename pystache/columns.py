@@ -0,0 +1,208 @@
+# coding: utf-8
+
+"""
+Provides the columnar rendering behind Renderer.render_columns().
+
+The data of a columnar render is a dictionary mapping names to columns:
+sequences of equal length (e.g. lists, tuples, array.array instances, or
+NumPy arrays), where the items at the same index form a row.
+
+For a template of only variable tags (see ParsedTemplate.render()), each
+tag is rendered once per column rather than once per row: the values of
+a column are converted to strings and escaped together, and a tag whose
+name is not a column is resolved and rendered only once.  The rows are
+then rendered by filling the template's format string.  Other templates
+are rendered row by row, with each row as a dictionary on top of the
+context stack.
+
+"""
+
+from itertools import izip, repeat
+
+from pystache.common import PystacheError, is_string
+from pystache.context import ContextStack
+from pystache.parser import _EscapeNode, _LiteralNode
+from pystache.tables import _to_list
+
+
+# Joins the strings of a column for escaping them together.  The default
+# escape function leaves this character as is.
+_SEPARATOR = u'\x00'
+
+
+class _Unsupported(Exception):
+
+    """Raised when a template cannot be rendered by column."""
+
+    pass
+
+
+def get_row_count(columns):
+    """
+    Return the number of rows of a dictionary of columns.
+
+    """
+    count = None
+    for name, column in columns.items():
+        if count is None:
+            count = len(column)
+        elif len(column) != count:
+            raise PystacheError("Column %s has %d items instead of %d." %
+                                (repr(name), len(column), count))
+    if count is None:
+        return 0
+    return count
+
+
+def iter_rows(columns):
+    """
+    Yield each row of a dictionary of columns as a dictionary.
+
+    """
+    names = list(columns.keys())
+    for values in izip(*[columns[name] for name in names]):
+        yield dict(izip(names, values))
+
+
+class ColumnRenderer(object):
+
+    """
+    Renders the variable tags of a template for whole columns at a time.
+
+    """
+
+    def __init__(self, engine, to_unicode, bulk_escape=None):
+        """
+        Arguments:
+
+          engine: the RenderEngine instance with which to render.
+
+          to_unicode: the function with which to convert a byte string to
+            unicode, preserving any unicode subclass.
+
+          bulk_escape: an escape function that escapes each character
+            independently (e.g. the default HTML escape function), for
+            escaping the strings of a column in one call, or None.
+
+        """
+        self.engine = engine
+        self.to_unicode = to_unicode
+        self.bulk_escape = bulk_escape
+
+    def _get_strings(self, values):
+        """
+        Return the list of the unicode strings of a column of values.
+
+        """
+        to_str = self.engine.to_str
+        to_unicode = self.to_unicode
+
+        strings = []
+        for value in values:
+            if type(value) is not unicode:
+                if callable(value):
+                    raise _Unsupported()
+                if not is_string(value):
+                    value = to_str(value)
+                value = to_unicode(value)
+            strings.append(value)
+        return strings
+
+    def _escape(self, strings):
+        """
+        Escape a list of unicode strings.
+
+        """
+        bulk_escape = self.bulk_escape
+        if bulk_escape is not None:
+            for s in strings:
+                if type(s) is not unicode:
+                    # Then s could be a Safe string, which is not escaped.
+                    break
+            else:
+                joined = _SEPARATOR.join(strings)
+                escaped = bulk_escape(joined)
+                if escaped is joined:
+                    # Then no string needed escaping.
+                    return strings
+                escaped = escaped.split(_SEPARATOR)
+                # A string could itself contain the separator.
+                if len(escaped) == len(strings):
+                    return escaped
+
+        escape = self.engine.escape
+        return [escape(s) for s in strings]
+
+    def _get_values(self, key, columns):
+        """
+        Return the list of the values of a name that starts with the name
+        of a column.
+
+        """
+        name = key.split('.')[0]
+        values = _to_list(columns[name])
+        if name == key:
+            return values
+
+        # Then the name is dotted, so we resolve the rest in each row.
+        resolve_context = self.engine.resolve_context
+        row = {}
+        stack = ContextStack(row)
+        dotted = []
+        for value in values:
+            row[name] = value
+            dotted.append(resolve_context(stack, key))
+        return dotted
+
+    def _render_node(self, node, stack, columns, count):
+        """
+        Return the renderings of a node for all rows, as a list or as an
+        iterator that repeats the same rendering.
+
+        """
+        if not isinstance(node, (_EscapeNode, _LiteralNode)):
+            # For example a comment.
+            return repeat(node.render(self.engine, stack), count)
+
+        key = node.key
+        if key == '.':
+            # Then the tag renders the row itself.
+            raise _Unsupported()
+        if key.split('.')[0] not in columns:
+            value = self.engine.resolve_context(stack, key)
+            if callable(value):
+                # The lambda's template could reference the columns.
+                raise _Unsupported()
+            return repeat(node.render_value(self.engine, value), count)
+
+        strings = self._get_strings(self._get_values(key, columns))
+        if isinstance(node, _EscapeNode):
+            return self._escape(strings)
+        literal = self.engine.literal
+        return [literal(s) for s in strings]
+
+    def render(self, parsed, stack, columns):
+        """
+        Return the list of the renderings of a ParsedTemplate for each
+        row, or None if the template cannot be rendered by column.
+
+        Arguments:
+
+          stack: the ContextStack instance in which to resolve the names
+            that are not columns.
+
+        """
+        format = parsed._get_format()
+        if not format:
+            return None
+        format_string, nodes = format
+
+        count = get_row_count(columns)
+        try:
+            rendered = [self._render_node(node, stack, columns, count) for node in nodes]
+        except _Unsupported:
+            return None
+
+        if not rendered:
+            return [format_string % ()] * count
+        return [format_string % row for row in izip(*rendered)]
@@ -35,6 +35,7 @@ import sys
 #
 #   ValueError: Attempted relative import in non-package
 #
+from pystache import lazyjson
 from pystache.common import TemplateNotFoundError
 from pystache.renderer import Renderer
 
@@ -83,7 +84,9 @@ def main(sys_argv=sys.argv):
         pass
 
     try:
-        context = json.load(open(context))
+        # Context files can be large, so we only decode what the template
+        # reads.
+        context = lazyjson.load(open(context, 'rb'))
     except IOError:
         context = json.loads(context)
 
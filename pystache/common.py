@@ -53,6 +53,60 @@ def read(path):
         f.close()
 
 
+class Safe(unicode):
+
+    """
+    A unicode string that is safe to insert into HTML without escaping.
+
+    The rendering process inserts instances of this class as is in place
+    of escaped variable tags like {{name}}, without escaping or copying
+    them.  The same is true of other strings with an __html__() method,
+    like markupsafe.Markup.  For example, a layout can embed a rendered
+    page without escaping it a second time:
+
+    >>> from pystache import Renderer
+    >>> renderer = Renderer()
+    >>> body = Safe(renderer.render('<b>{{name}}</b>', name='Tom & Jerry'))
+    >>> print renderer.render('<div>{{body}}</div>', body=body)
+    <div><b>Tom &amp; Jerry</b></div>
+
+    """
+
+    def __html__(self):
+        return self
+
+
+class SectionLambda(object):
+
+    """
+    Wraps a function to be called as a section lambda with a handle to
+    the parsed section, rather than with the section's raw text.
+
+    The handle has a `text` attribute with the section's raw text, and a
+    `render()` method that renders the section in the current context
+    without parsing it again.  Passing a template string to `render()`
+    renders that string instead, with the section's delimiters.  The
+    function's return value is inserted as is, rather than rendered as a
+    template:
+
+    >>> from pystache import Renderer
+    >>> bold = SectionLambda(lambda section: u'<b>%s</b>' % section.render())
+    >>> print Renderer().render('{{#bold}}Hi {{name}}{{/bold}}', bold=bold, name='Al')
+    <b>Hi Al</b>
+
+    For example, a translation lambda can render the translated text of
+    a section with render(translations[section.text]).  Parse trees of
+    such strings are cached.
+
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+
 class MissingTags(object):
 
     """Contains the valid values for Renderer.missing_tags."""
@@ -0,0 +1,316 @@
+# coding: utf-8
+
+"""
+Exposes a compile() function to compile a template for contexts of a
+declared structure.
+
+"""
+
+from pystache import codegen
+from pystache.common import PystacheError, is_string, _STRING_TYPES
+from pystache.context import ContextStack, _BUILTIN_MODULE
+from pystache.parser import _PartialNode
+from pystache.renderer import Renderer
+
+
+# The types of scalar values that render without calling user code.
+_SCALAR_TYPES = (bool, int, long, float, _STRING_TYPES)
+
+# The schema types that accept any string.
+_STRING_SCHEMAS = (str, unicode)
+
+
+class SchemaError(PystacheError):
+
+    """
+    An exception raised when a schema is invalid, or a context does not
+    match its schema.
+
+    """
+
+    pass
+
+
+def _check_schema(schema, path):
+    """
+    Raise SchemaError if a schema is not valid.
+
+    """
+    if isinstance(schema, dict):
+        for key, value in schema.items():
+            if not is_string(key):
+                raise SchemaError("%s: keys must be strings: %s" % (path, repr(key)))
+            _check_schema(value, '%s[%s]' % (path, repr(key)))
+    elif isinstance(schema, list):
+        if len(schema) != 1:
+            raise SchemaError("%s: a list schema must have exactly one item: %s" %
+                              (path, repr(schema)))
+        _check_schema(schema[0], path + '[]')
+    elif schema is not None and not isinstance(schema, type):
+        raise SchemaError("%s: expected a dict, a list, a type, or None: %s" %
+                          (path, repr(schema)))
+
+
+def validate(value, schema, path='context'):
+    """
+    Raise SchemaError if a value does not match a schema.
+
+    Arguments:
+
+      path: the description of the value for error messages.
+
+    """
+    if schema is None:
+        return
+
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise SchemaError("%s: expected a dict, got %s" % (path, repr(value)))
+        for key, item_schema in schema.items():
+            item_path = '%s[%s]' % (path, repr(key))
+            if key not in value:
+                raise SchemaError("%s: missing" % item_path)
+            validate(value[key], item_schema, item_path)
+        return
+
+    if isinstance(schema, list):
+        if not isinstance(value, (list, tuple)):
+            raise SchemaError("%s: expected a list, got %s" % (path, repr(value)))
+        for index, item in enumerate(value):
+            validate(item, schema[0], '%s[%d]' % (path, index))
+        return
+
+    if schema in _STRING_SCHEMAS:
+        matches = is_string(value)
+    else:
+        matches = isinstance(value, schema)
+    if not matches:
+        raise SchemaError("%s: expected %s, got %s" % (path, schema.__name__, repr(value)))
+
+
+class _SchemaCompiler(codegen._Compiler):
+
+    """
+    Generates a render function from a parse tree and a schema.
+
+    Frames are pairs of the name of a variable in the generated source
+    and the schema of its value.
+
+    """
+
+    def __init__(self):
+        codegen._Compiler.__init__(self, None)
+        self.namespace['ContextStack'] = ContextStack
+
+    def compile(self, parsed, schema):
+        self.lines.append('def render(frames, engine, strict):')
+        self._line('f0 = frames[0]')
+        return self._compile_function(parsed, [('f0', schema)])
+
+    def _compile_lookup(self, key, frames):
+        """
+        Generate code that sets v to the value of a name, and return the
+        value's schema.
+
+        """
+        if key == '.':
+            if frames:
+                var, schema = frames[-1]
+                self._line('v = %s' % var)
+                return schema
+            self._line('v = _missing(strict)')
+            return None
+
+        parts = key.split('.')
+        for var, schema in reversed(frames):
+            if isinstance(schema, dict):
+                if parts[0] in schema:
+                    break
+            elif schema is None or (isinstance(schema, type) and
+                                    schema.__module__ != _BUILTIN_MODULE):
+                # Then the value can be of any type that defines names, so
+                # we look the name up the usual way.
+                stack = ', '.join([frame[0] for frame in frames])
+                self._line('v = engine.resolve_context(ContextStack(%s), %s)' %
+                           (stack, self._const(key)))
+                return None
+        else:
+            self._line('v = _missing(strict)')
+            return None
+
+        expression = var
+        for part in parts:
+            if not isinstance(schema, dict) or part not in schema:
+                # Then a later part of a dotted name is missing.
+                self._line('v = _missing(strict)')
+                return None
+            expression += '[%s]' % self._const(part)
+            schema = schema[part]
+
+        # The context need not match the schema unless it is validated.
+        self._line('try:')
+        self._line('    v = %s' % expression)
+        self._line('except (KeyError, TypeError):')
+        self._line('    raise _Deopt()')
+        return schema
+
+    def _compile_variable(self, node, frames):
+        schema = self._compile_lookup(node.key, frames)
+
+        is_escape = isinstance(node, codegen._EscapeNode)
+        if schema in _STRING_SCHEMAS:
+            value = 'v'
+        elif isinstance(schema, type) and issubclass(schema, _SCALAR_TYPES):
+            value = 'to_str(v)'
+        else:
+            # For example a value whose type the schema leaves open, which
+            # could be a lambda.
+            self._line('a(_convert(engine, v, %s))' % is_escape)
+            return
+
+        if is_escape:
+            self._line('a(escape(%s))' % value)
+        else:
+            self._line('a(literal(%s))' % value)
+
+    def _compile_section(self, node, frames, schema):
+        var = 'f%d' % len(frames)
+        if not (isinstance(schema, (list, dict)) or
+                (isinstance(schema, type) and issubclass(schema, _SCALAR_TYPES))):
+            # The value can be a lambda, or a structured array, whose truth
+            # value is ambiguous until it is coerced.
+            self._line('if callable(v):')
+            self._line('    raise _Deopt()')
+            self._line('v = coerce(v)')
+        self._line('if v:')
+        self.indent += 1
+        if isinstance(schema, list):
+            self._compile_sequence_guard()
+            self._line('for %s in v:' % var)
+            self._compile_block(node.parsed._parse_tree, frames + [(var, schema[0])])
+        elif isinstance(schema, dict) or (isinstance(schema, type) and
+                                          issubclass(schema, _SCALAR_TYPES)):
+            # A truthy dictionary or scalar is rendered once, with itself
+            # on top of the context stack.
+            self._line('%s = v' % var)
+            self._compile_nodes(node.parsed._parse_tree, frames + [(var, schema)])
+        else:
+            self._compile_sequence_guard()
+            self._line('for %s in v:' % var)
+            self._compile_block(node.parsed._parse_tree, frames + [(var, None)])
+        self.indent -= 1
+
+    def _compile_other(self, node, frames):
+        if not isinstance(node, _PartialNode):
+            raise codegen._Unsupported()
+        # Partials are rendered the usual way.
+        stack = ', '.join([var for var, schema in frames])
+        self._line('a(%s.render(engine, ContextStack(%s)))' % (self._const(node), stack))
+
+
+class CompiledTemplate(object):
+
+    """
+    A template compiled for contexts that match a schema.
+
+    See compile() for more information.
+
+    """
+
+    def __init__(self, parsed, schema, renderer, render_func, validate_context):
+        self.parsed = parsed
+        self.schema = schema
+        self.renderer = renderer
+        self.validate = validate_context
+        self._render_func = render_func
+
+    def __repr__(self):
+        return "%s(%s, schema=%s)" % (self.__class__.__name__, repr(self.parsed),
+                                      repr(self.schema))
+
+    def render(self, context=None, **kwargs):
+        """
+        Render the template with a dictionary context, and return a
+        unicode string.
+
+        Keyword arguments are added to a copy of the context.
+
+        """
+        if context is None:
+            context = {}
+        if kwargs:
+            context = context.copy()
+            context.update(kwargs)
+        if self.validate:
+            validate(context, self.schema)
+
+        compiled = self._render_func
+        parsed = self.parsed
+        strict = self.renderer._is_missing_tags_strict()
+
+        def render_func(engine, stack):
+            try:
+                return compiled(stack._stack, engine, strict)
+            except codegen._Deopt:
+                # For example the value of a tag was a lambda.
+                return parsed.render(engine, stack)
+
+        return self.renderer._render_final(render_func, context)
+
+
+def compile(template, schema, renderer=None, validate=False):
+    """
+    Compile a template to a Python function for contexts of the structure
+    that a schema declares.
+
+    A schema is a dictionary that mirrors the context, with a schema for
+    the value of each key.  A schema is one of: a dictionary, for a
+    dictionary value; a list containing the schema of the items, for a
+    list of values; a type, for a value of that type (str and unicode
+    both stand for any string); or None, for a value of any type:
+
+    >>> compiled = compile(u'{{#items}}{{name}}={{n}};{{/items}}',
+    ...                    {'items': [{'name': unicode, 'n': int}]})
+    >>> print compiled.render({'items': [{'name': u'a', 'n': 1}, {'name': u'b', 'n': 2}]})
+    a=1;b=2;
+
+    The compiled function accesses each name directly in the dictionary
+    that the schema declares it in (the innermost one, for a name that
+    more than one declares), and loops over lists without the type
+    checks of the usual rendering.  Names that the schema does not
+    declare are missing, unless a value whose schema is None (or a type
+    other than a built-in type) can define them, in which case they are
+    looked up the usual way.  The items of dictionaries that a schema
+    declares should not define other names that the template references.
+    A context that lacks a key its schema declares is rendered the usual
+    way.
+
+    Values whose schema is None can be lambdas, in which case the
+    template is rendered the usual way.  Partials are rendered the usual
+    way too.
+
+    Arguments:
+
+      template: a ParsedTemplate instance or a template string.
+
+      schema: the schema of the context, a dictionary.
+
+      renderer: the Renderer instance whose escape function, partials,
+        and other configuration to use.  Defaults to a default Renderer.
+
+      validate: whether to check that each context matches the schema,
+        raising SchemaError if not.  Defaults to False.
+
+    """
+    if not isinstance(schema, dict):
+        raise SchemaError("The schema of a context must be a dict: %s" % repr(schema))
+    _check_schema(schema, 'schema')
+
+    if renderer is None:
+        renderer = Renderer()
+    if is_string(template):
+        template = renderer._parse(template)
+
+    render_func = _SchemaCompiler().compile(template, schema)
+
+    return CompiledTemplate(template, schema, renderer, render_func, validate)
@@ -12,6 +12,9 @@ spec, we define these categories mutually exclusively as follows:
  (2) Object: an item that is neither a hash nor an instance of a
      built-in type.
 
+Row cursors (instances of RowCursor) are objects whose names are looked
+up with their lookup() method rather than as attributes.
+
 """
 
 from pystache.common import PystacheError
@@ -34,6 +37,34 @@ class NotFound(object):
 _NOT_FOUND = NotFound()
 
 
+class RowCursor(object):
+
+    """
+    The base class of row cursors, through which sections iterate over
+    the rows of a table (see the tables module).
+
+    A row cursor is a context stack item that looks up names in the
+    current row of a table with its lookup() method, rather than as
+    attributes.  A table can yield the same cursor for each row, moving
+    it to the next row each time.
+
+    This class is abstract: subclasses must implement lookup().
+
+    """
+
+    __slots__ = ()
+
+    def lookup(self, key, default):
+        """
+        Return the value of a name in the current row, or default if the
+        row does not have the name.
+
+        Subclasses must override this method.
+
+        """
+        raise NotImplementedError("%s must implement lookup()" % type(self).__name__)
+
+
 def _get_value(context, key):
     """
     Retrieve a key's value from a context item.
@@ -50,6 +81,8 @@ def _get_value(context, key):
         # (e.g. catching KeyError).
         if key in context:
             return context[key]
+    elif isinstance(context, RowCursor):
+        return context.lookup(key, _NOT_FOUND)
     elif type(context).__module__ != _BUILTIN_MODULE:
         # Then we consider the argument an "object" for the purposes of
         # the spec.
@@ -76,6 +109,20 @@ def _get_value(context, key):
     return _NOT_FOUND
 
 
+class _Prefetched(dict):
+
+    """
+    The values of names that a Renderer resolved before rendering (see
+    the prefetch_executor option), pushed onto the top of a context stack.
+
+    The values stand in for the names' lookups but not for the item below
+    them, which remains the current item ("{{.}}").
+
+    """
+
+    pass
+
+
 class KeyNotFoundError(PystacheError):
 
     """
@@ -329,10 +376,14 @@ class ContextStack(object):
 
     def top(self):
         """
-        Return the item last added to the stack.
+        Return the item last added to the stack, other than prefetched
+        values.
 
         """
-        return self._stack[-1]
+        item = self._stack[-1]
+        if type(item) is _Prefetched:
+            item = self._stack[-2]
+        return item
 
     def copy(self):
         """
@@ -59,7 +59,16 @@ SEARCH_DIRS = [os.curdir]  # i.e. ['.']
 #   http://docs.python.org/library/cgi.html#cgi.escape
 #   http://docs.python.org/dev/library/html.html#html.escape
 #
-TAG_ESCAPE = lambda u: escape(u, quote=True)
+# We use a def rather than a lambda so that the function can be pickled
+# (e.g. to send a Renderer to another process).
+#
+# Most strings contain none of the characters that escape() replaces, so
+# we check for them first and return such strings as is.  A chain of "in"
+# tests is faster for this than a regular expression search.
+def TAG_ESCAPE(u):
+    if '&' in u or '<' in u or '>' in u or '"' in u or "'" in u:
+        return escape(u, quote=True)
+    return u
 
 # The default template extension, without the leading dot.
 TEMPLATE_EXTENSION = 'mustache'
@@ -0,0 +1,436 @@
+# coding: utf-8
+
+"""
+Provides fragment caching of section renderings.
+
+A Renderer constructed with a fragment_cache backend and a list of
+cached_sections stores the rendering of each section with one of those
+names, and reuses it when the section is rendered again with the same
+data.  For example--
+
+    renderer = Renderer(fragment_cache=MemoryCache(ttl=60),
+                        cached_sections=['nav', 'footer'])
+
+The cache key of a section rendering is a digest of the section's parse
+tree and of the values of all the names that the section and its partials
+reference.  The values must be made of None, booleans, numbers, strings,
+lists, tuples, and dictionaries.  If any value is something else (for
+example an object or a lambda, whose output cannot be predicted from its
+value), the section is rendered without the cache.
+
+A backend is an object with a get(key) method that returns a cached
+unicode string or None, and a set(key, value) method.  This module
+provides an in-process LRU cache and a SQLite cache that processes can
+share.  Since cache keys do not cover the renderer's configuration (e.g.
+its escape function), a backend should only be shared by renderers
+configured alike.
+
+"""
+
+try:
+    # The hashlib module is new in Python 2.5.
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+import threading
+import time
+
+try:
+    # OrderedDict is new in Python 2.7.
+    from collections import OrderedDict
+except ImportError:
+    OrderedDict = None
+
+try:
+    # The sqlite3 module is new in Python 2.5.
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from pystache.common import PystacheError, Safe
+from pystache.context import KeyNotFoundError
+from pystache.parsed import ParsedTemplate
+from pystache.parser import (flatten, parse, _BlockNode, _ConditionalNode, _InvertedNode,
+                             _ParentNode, _PartialNode, _SectionNode)
+
+
+# The types of values whose repr() identifies them for digest().
+_SCALAR_TYPES = (type(None), bool, int, long, float, unicode, Safe,
+                 type(u''.encode('ascii')))
+
+# The maximum nesting depth of a value for digest().
+_MAX_DEPTH = 50
+
+
+class _NotDigestible(Exception):
+
+    pass
+
+
+def _serialize(value, parts, depth):
+    if depth > _MAX_DEPTH:
+        raise _NotDigestible()
+    value_type = type(value)
+    if value_type in _SCALAR_TYPES:
+        parts.append('%s:%s' % (value_type.__name__, repr(value)))
+        return
+    if value_type is list or value_type is tuple:
+        parts.append('%s:%d[' % (value_type.__name__, len(value)))
+        for item in value:
+            _serialize(item, parts, depth + 1)
+        parts.append(']')
+        return
+    if value_type is dict:
+        parts.append('dict:%d{' % len(value))
+        items = [(repr(key), item) for key, item in value.items()]
+        items.sort()
+        for key, item in items:
+            parts.append(key)
+            _serialize(item, parts, depth + 1)
+        parts.append('}')
+        return
+    raise _NotDigestible()
+
+
+def digest(*values):
+    """
+    Return a hex digest of the given values, or None if a value is not
+    made only of the types that this module supports.
+
+    >>> digest({'a': [1, u'x']}) == digest({'a': [1, u'x']})
+    True
+    >>> digest({'a': [1, u'x']}) == digest({'a': [1, u'y']})
+    False
+    >>> digest(object()) is None
+    True
+
+    """
+    parts = []
+    try:
+        for value in values:
+            _serialize(value, parts, 0)
+    except _NotDigestible:
+        return None
+    return sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+class MemoryCache(object):
+
+    """
+    An in-process cache backend that discards the least recently used
+    entries beyond a maximum size.  Instances are thread-safe.
+
+    Pickling an instance (e.g. to send a Renderer to another process)
+    gives an empty cache with the same settings.
+
+    """
+
+    def __init__(self, max_size=1000, ttl=None):
+        """
+        Arguments:
+
+          max_size: the maximum number of entries to keep.
+
+          ttl: the number of seconds after which an entry expires.
+            Defaults to None, for entries that do not expire.
+
+        """
+        if OrderedDict is None:
+            raise PystacheError("MemoryCache requires Python 2.7 or later.")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._init_entries()
+
+    def _init_entries(self):
+        self._lock = threading.Lock()
+        # Maps a key to a (value, expiry time) pair, from the least to the
+        # most recently used.
+        self._entries = OrderedDict()
+
+    def __getstate__(self):
+        return {'max_size': self.max_size, 'ttl': self.ttl}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_entries()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _time(self):
+        return time.time()
+
+    def get(self, key):
+        self._lock.acquire()
+        try:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= self._time():
+                return None
+            self._entries[key] = entry
+            return value
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self._time() + self.ttl
+
+        self._lock.acquire()
+        try:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(False)
+        finally:
+            self._lock.release()
+
+
+class SQLiteCache(object):
+
+    """
+    A cache backend that stores entries in a SQLite database file, so that
+    processes on the same machine can share them.
+
+    Each thread uses its own database connection.  Expired entries are
+    deleted when they are next looked up.
+
+    """
+
+    def __init__(self, path, ttl=None, timeout=5.0):
+        """
+        Arguments:
+
+          path: the path to the database file, which is created if needed.
+
+          ttl: the number of seconds after which an entry expires.
+            Defaults to None, for entries that do not expire.
+
+          timeout: the number of seconds to wait for another process's
+            write to finish.
+
+        """
+        if sqlite3 is None:
+            raise PystacheError("SQLiteCache requires the sqlite3 module "
+                                "(Python 2.5 or later).")
+
+        self.path = path
+        self.timeout = timeout
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Connections cannot be pickled.
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def _time(self):
+        return time.time()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout)
+            connection.execute("CREATE TABLE IF NOT EXISTS fragments "
+                               "(key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+            connection.commit()
+            self._local.connection = connection
+        return connection
+
+    def close(self):
+        """
+        Close the calling thread's connection, if open.
+
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def get(self, key):
+        connection = self._connect()
+        row = connection.execute("SELECT value, expires FROM fragments WHERE key = ?",
+                                 (key, )).fetchone()
+        if row is None:
+            return None
+        value, expires = row
+        if expires is not None and expires <= self._time():
+            connection.execute("DELETE FROM fragments WHERE key = ?", (key, ))
+            connection.commit()
+            return None
+        return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self._time() + self.ttl
+
+        connection = self._connect()
+        connection.execute("INSERT OR REPLACE INTO fragments (key, value, expires) "
+                           "VALUES (?, ?, ?)", (key, value, expires))
+        connection.commit()
+
+
+def _collect(nodes, resolve_partial, keys, partials):
+    """
+    Add the names referenced by the given nodes, including by their
+    partials, to keys, and the texts of their partials to partials.
+
+    """
+    for node in nodes:
+        if type(node) is unicode:
+            continue
+        if isinstance(node, _SectionNode):
+            keys.append(node.key)
+            _collect(node.parsed._parse_tree, resolve_partial, keys, partials)
+        elif isinstance(node, _InvertedNode):
+            keys.append(node.key)
+            _collect(node.parsed_section._parse_tree, resolve_partial, keys, partials)
+        elif isinstance(node, _ConditionalNode):
+            _collect([node.section, node.inverted], resolve_partial, keys, partials)
+        elif isinstance(node, _PartialNode):
+            if node.key in partials:
+                continue
+            template = resolve_partial(node.key)
+            partials[node.key] = template
+            parsed = parse(template, resolve_partial=resolve_partial)
+            _collect(parsed._parse_tree, resolve_partial, keys, partials)
+        elif isinstance(node, _BlockNode):
+            _collect(node.parsed._parse_tree, resolve_partial, keys, partials)
+        elif isinstance(node, _ParentNode):
+            # Then the tree was not flattened (e.g. it is from parse()
+            # without resolve_partial), so we flatten the parent tag as
+            # rendering it does, recording the parent templates.
+            def load_parent(name):
+                template = resolve_partial(name)
+                partials[name] = template
+                return template
+            parsed = ParsedTemplate()
+            parsed.add(node)
+            parsed = flatten(parsed, load_parent)
+            _collect(parsed._parse_tree, resolve_partial, keys, partials)
+        else:
+            keys.extend(node.get_keys())
+
+
+def get_sources(node, resolve_partial):
+    """
+    Return what the rendering of a node depends on besides the node.
+
+    Arguments:
+
+      resolve_partial: the function with which to load partials, as for
+        RenderEngine.__init__().
+
+    Returns a pair (keys, partials), where keys is the sorted list of the
+    names that the node and its partials reference, and partials is a
+    dictionary mapping the name of each partial to its template string.
+
+    """
+    keys, partials = [], {}
+    _collect([node], resolve_partial, keys, partials)
+    # We use a set because the names are looked up in the same context
+    # regardless of order and repetition.
+    keys = list(set(keys))
+    keys.sort()
+
+    return keys, partials
+
+
+def resolve_values(keys, resolve_context, context):
+    """
+    Return the list of (key, value) pairs for the given names in a
+    context stack, for passing to digest().
+
+    A missing name gives a pair (key, ) instead.
+
+    """
+    values = []
+    for key in keys:
+        try:
+            value = resolve_context(context, key)
+        except KeyNotFoundError:
+            values.append((key, ))
+            continue
+        values.append((key, value))
+    return values
+
+
+class SectionCache(object):
+
+    """
+    Renders the cached sections of a template through a cache backend.
+
+    An instance is created for each RenderEngine.
+
+    """
+
+    def __init__(self, backend, names):
+        """
+        Arguments:
+
+          backend: the cache backend.
+
+          names: the names of the sections to cache.
+
+        """
+        self.backend = backend
+        self.names = set(names)
+        # Maps a section node to the description of the section, the list
+        # of names, and the dictionary of partial texts that its cache keys
+        # cover.
+        self._sources = {}
+
+    def _get_sources(self, node, engine):
+        sources = self._sources.get(node)
+        if sources is None:
+            keys, partials = get_sources(node, engine.resolve_partial)
+            # We describe the section by its parse tree rather than by its
+            # text, since the blocks in the text of a section of a parent
+            # template can be overridden (see parser.flatten()).
+            section = (node.key, repr(node.parsed))
+            sources = (section, keys, partials)
+            self._sources[node] = sources
+        return sources
+
+    def make_key(self, node, engine, context):
+        """
+        Return the cache key for rendering a section in a context, or None
+        if the rendering cannot be cached.
+
+        """
+        section, keys, partials = self._get_sources(node, engine)
+        values = resolve_values(keys, engine.resolve_context, context)
+
+        return digest(section, partials, values)
+
+    def render(self, node, engine, context, render):
+        """
+        Return the rendering of a section, from the cache if possible.
+
+        Arguments:
+
+          render: a function that renders the section without the cache,
+            with signature render(engine, context).
+
+        """
+        key = self.make_key(node, engine, context)
+        if key is None:
+            return render(engine, context)
+
+        rendered = self.backend.get(key)
+        if rendered is None:
+            rendered = render(engine, context)
+            self.backend.set(key, rendered)
+
+        return rendered
@@ -5,8 +5,11 @@ This module contains the initialization logic called by __init__.py.
 
 """
 
+from pystache.common import Safe, SectionLambda
+from pystache.compiler import compile
 from pystache.parser import parse
 from pystache.renderer import Renderer
+from pystache.specializer import specialize
 from pystache.template_spec import TemplateSpec
 
 
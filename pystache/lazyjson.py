@@ -0,0 +1,461 @@
+# coding: utf-8
+
+"""
+Provides lazily decoded JSON documents, for use as rendering contexts.
+
+Decoding a large JSON document with the json module creates a Python
+object for every value in it, even if a template reads only a few of
+them.  The load() and loads() functions of this module instead return a
+LazyObject (a dict) or LazyArray (a list) that keeps the document text
+and decodes its members only when first accessed.  Decoding an object or
+array decodes the scalars it contains directly, and creates another
+LazyObject or LazyArray for each object or array it contains, whose
+text is only scanned to find where it ends.  This scan matches the
+brackets of the container's text (skipping strings) without decoding
+anything, and records where each object and array in it ends, so that no
+text is scanned twice.  So the memory used, and most of the time, scale
+with the parts of the document that a template reads:
+
+>>> context = loads('{"title": "Hi", "pages": [{"body": "..."}]}')
+>>> print context['title']
+Hi
+>>> type(context['pages']).__name__
+'LazyArray'
+
+Since LazyObject and LazyArray instances are dictionaries and lists,
+they can be used as context items, and their methods decode them as
+needed.  However, code that reads the storage of a dictionary or list
+directly rather than through its methods (as dict(), list(), and
+json.dumps() can) sees a container that has not been decoded as empty.
+The decode() function decodes a value completely, for passing it to
+such code.
+
+Like the json module's functions, load() and loads() raise ValueError
+if the document is not valid JSON.  However, since the members of an
+object or array are only decoded when first accessed, some errors in
+them are only raised then.
+
+Containers can be shared across threads: a container's members are
+decoded into a new dictionary or list, and added to the container in one
+step.
+
+"""
+
+import re
+import threading
+from array import array
+from bisect import bisect_left
+
+try:
+    import json
+except ImportError:
+    # The json module is new in Python 2.6, whereas simplejson is
+    # compatible with earlier versions.
+    import simplejson as json
+
+
+_decoder = json.JSONDecoder()
+_scanstring = json.decoder.scanstring
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+# The following patterns match text without decoding it.  No two of the
+# alternatives in a pattern can match the same text, so that a failed
+# match does not backtrack much.  The regular expression engine keeps
+# state for each repetition of a group, so we bound the repetitions.
+
+_MAX_REPEAT = 1000
+
+_OTHER = r'[^"\[\]{}]*'
+_STRING = r'"[^"\\]*(?:\\.[^"\\]*)*"'
+
+
+def _make_container_pattern(inner):
+    """
+    Return a pattern that matches an object or array whose members match
+    one of the given patterns or are scalars.
+
+    """
+    members = '%s(?:(?:%s)%s){0,%d}' % (_OTHER, '|'.join([_STRING] + inner), _OTHER,
+                                        _MAX_REPEAT)
+    return r'\{%s\}|\[%s\]' % (members, members)
+
+# Matches an object or array nested at most two deep, like the records
+# that large documents tend to be lists of.
+_SMALL_CONTAINER = _make_container_pattern([_make_container_pattern([])])
+_SMALL_CONTAINER_RE = re.compile(_SMALL_CONTAINER, re.DOTALL)
+
+# Matches the text up to the next small container (group 1) or other
+# bracket (group 2) that is not in a string, and that container or
+# bracket.
+_SCAN_RE = re.compile(r'%s(?:%s%s){0,%d}(?:(%s)|([\[\]{}]))?' %
+                      (_OTHER, _STRING, _OTHER, _MAX_REPEAT, _SMALL_CONTAINER), re.DOTALL)
+
+_CLOSING_BRACKETS = {'{': '}', '[': ']'}
+
+# Serializes the decoding of containers, so that threads sharing a
+# context (e.g. a Renderer's prefetch_executor) do not decode a container
+# twice.  Decoding holds the global interpreter lock anyway.
+_load_lock = threading.Lock()
+
+
+def _error(message, pos):
+    return ValueError("%s: char %d" % (message, pos))
+
+
+def _skip_whitespace(text, pos):
+    return _WHITESPACE_RE.match(text, pos).end()
+
+
+class _Document(object):
+
+    """
+    The text of a JSON document, with the ends of the objects and arrays
+    in it found so far.
+
+    The ends of small containers (see _SMALL_CONTAINER) are not recorded,
+    since matching them again is about as fast as looking them up.
+
+    """
+
+    __slots__ = ('text', '_starts', '_ends')
+
+    def __init__(self, text):
+        self.text = text
+        # The start and end indices of the objects and arrays found, in
+        # the order of their starts.
+        self._starts = array('l')
+        self._ends = array('l')
+
+    def find_end(self, pos):
+        """
+        Return the index after the object or array that starts at pos.
+
+        """
+        starts = self._starts
+        index = bisect_left(starts, pos)
+        if index < len(starts) and starts[index] == pos:
+            return self._ends[index]
+        match = _SMALL_CONTAINER_RE.match(self.text, pos)
+        if match is not None:
+            return match.end()
+        return self._scan(pos)
+
+    def _scan(self, pos):
+        """
+        Find the ends of the object or array that starts at pos and of the
+        objects and arrays in it, and return the index after it.
+
+        Only the containers of the document's top-level value are scanned,
+        in order, when it is decoded, so the starts stay sorted.  The
+        containers in them are either recorded or small.
+
+        """
+        text, starts, ends = self.text, self._starts, self._ends
+        match = _SCAN_RE.match
+        # The indices in starts of the containers open, and the brackets
+        # that close them.
+        indices, closing = [], []
+        while True:
+            result = match(text, pos)
+            end = result.end()
+            char = result.group(2)
+            if char is None:
+                if end == pos:
+                    # Then the text ends, or a string is unterminated.
+                    raise _error("Unterminated object or array", pos)
+                pos = end
+                continue
+            pos = end
+            if char == '{' or char == '[':
+                indices.append(len(starts))
+                closing.append(_CLOSING_BRACKETS[char])
+                starts.append(pos - 1)
+                ends.append(0)
+                continue
+            if not closing or closing.pop() != char:
+                raise _error("Unexpected %s" % repr(str(char)), pos - 1)
+            ends[indices.pop()] = pos
+            if not indices:
+                return pos
+
+
+def _decode_value(document, pos):
+    """
+    Return the pair of the value that starts at pos and the index after it.
+
+    """
+    text = document.text
+    if pos >= len(text):
+        raise _error("Expecting value", pos)
+    char = text[pos]
+    if char == '{':
+        return LazyObject(document, pos), document.find_end(pos)
+    if char == '[':
+        return LazyArray(document, pos), document.find_end(pos)
+    return _decoder.raw_decode(text, pos)
+
+
+def _decode_members(obj, document, pos):
+    """
+    Add the members of the object that starts at pos to a dictionary, and
+    return the index after the object.
+
+    """
+    text = document.text
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos:pos + 1] == '}':
+        return pos + 1
+    while True:
+        if text[pos:pos + 1] != '"':
+            raise _error("Expecting property name enclosed in double quotes", pos)
+        key, pos = _scanstring(text, pos + 1)
+
+        pos = _skip_whitespace(text, pos)
+        if text[pos:pos + 1] != ':':
+            raise _error("Expecting ':' delimiter", pos)
+        pos = _skip_whitespace(text, pos + 1)
+
+        value, pos = _decode_value(document, pos)
+        dict.__setitem__(obj, key, value)
+
+        pos = _skip_whitespace(text, pos)
+        char = text[pos:pos + 1]
+        if char == '}':
+            return pos + 1
+        if char != ',':
+            raise _error("Expecting ',' delimiter", pos)
+        pos = _skip_whitespace(text, pos + 1)
+
+
+def _decode_items(items, document, pos):
+    """
+    Add the items of the array that starts at pos to a list, and return
+    the index after the array.
+
+    """
+    text = document.text
+    pos = _skip_whitespace(text, pos + 1)
+    if text[pos:pos + 1] == ']':
+        return pos + 1
+    while True:
+        value, pos = _decode_value(document, pos)
+        list.append(items, value)
+
+        pos = _skip_whitespace(text, pos)
+        char = text[pos:pos + 1]
+        if char == ']':
+            return pos + 1
+        if char != ',':
+            raise _error("Expecting ',' delimiter", pos)
+        pos = _skip_whitespace(text, pos + 1)
+
+
+def _make_loading_method(base, name):
+    """
+    Return a method that decodes a lazy container (and any lazy container
+    arguments) before calling the method of the base class.
+
+    """
+    method = getattr(base, name)
+
+    def loading_method(self, *args, **kwargs):
+        self._load()
+        for arg in args:
+            if isinstance(arg, (LazyObject, LazyArray)):
+                arg._load()
+        return method(self, *args, **kwargs)
+
+    loading_method.__name__ = name
+    return loading_method
+
+
+def _add_loading_methods(cls, base, names):
+    for name in names:
+        if hasattr(base, name) and name not in cls.__dict__:
+            setattr(cls, name, _make_loading_method(base, name))
+
+
+class LazyObject(dict):
+
+    """
+    A dictionary decoded from a JSON object when first accessed.
+
+    """
+
+    __slots__ = ('_document', '_start')
+
+    def __init__(self, document, start):
+        """
+        Arguments:
+
+          document: the _Document instance of the JSON document.
+
+          start: the index of the object in the document.
+
+        """
+        dict.__init__(self)
+        self._document = document
+        self._start = start
+
+    def _load(self):
+        """
+        Decode the object's members, and return the index after the object
+        (or None if the members were already decoded).
+
+        """
+        _load_lock.acquire()
+        try:
+            document = self._document
+            if document is None:
+                return None
+            members = {}
+            end = _decode_members(members, document, self._start)
+            # Other threads read the dictionary once the document is
+            # cleared.
+            dict.update(self, members)
+            self._document = None
+            return end
+        finally:
+            _load_lock.release()
+
+    # We define the methods that rendering calls directly, for speed.
+
+    def __contains__(self, key):
+        if self._document is not None:
+            self._load()
+        return dict.__contains__(self, key)
+
+    def __getitem__(self, key):
+        if self._document is not None:
+            self._load()
+        return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        if self._document is not None:
+            self._load()
+        return dict.get(self, key, default)
+
+_add_loading_methods(LazyObject, dict,
+                     ['__delitem__', '__eq__', '__iter__', '__len__', '__ne__', '__repr__',
+                      '__setitem__', 'clear', 'copy', 'has_key', 'items', 'iteritems',
+                      'iterkeys', 'itervalues', 'keys', 'pop', 'popitem', 'setdefault',
+                      'update', 'values', 'viewitems', 'viewkeys', 'viewvalues'])
+
+
+class LazyArray(list):
+
+    """
+    A list decoded from a JSON array when first accessed.
+
+    """
+
+    __slots__ = ('_document', '_start')
+
+    def __init__(self, document, start):
+        """
+        Arguments:
+
+          document: the _Document instance of the JSON document.
+
+          start: the index of the array in the document.
+
+        """
+        list.__init__(self)
+        self._document = document
+        self._start = start
+
+    def _load(self):
+        """
+        Decode the array's items, and return the index after the array (or
+        None if the items were already decoded).
+
+        """
+        _load_lock.acquire()
+        try:
+            document = self._document
+            if document is None:
+                return None
+            items = []
+            end = _decode_items(items, document, self._start)
+            list.extend(self, items)
+            self._document = None
+            return end
+        finally:
+            _load_lock.release()
+
+    def __iter__(self):
+        if self._document is not None:
+            self._load()
+        return list.__iter__(self)
+
+    def __len__(self):
+        if self._document is not None:
+            self._load()
+        return list.__len__(self)
+
+_add_loading_methods(LazyArray, list,
+                     ['__add__', '__contains__', '__delitem__', '__delslice__', '__eq__',
+                      '__ge__', '__getitem__', '__getslice__', '__gt__', '__iadd__', '__imul__',
+                      '__le__', '__lt__', '__mul__', '__ne__', '__repr__', '__reversed__',
+                      '__rmul__', '__setitem__', '__setslice__', 'append', 'count', 'extend',
+                      'index', 'insert', 'pop', 'remove', 'reverse', 'sort'])
+
+
+def decode(value):
+    """
+    Decode the lazy containers in a value recursively, and return the
+    value.
+
+    """
+    if isinstance(value, LazyObject):
+        value._load()
+        for item in dict.values(value):
+            decode(item)
+    elif isinstance(value, LazyArray):
+        value._load()
+        for item in list.__iter__(value):
+            decode(item)
+    return value
+
+
+def loads(text):
+    """
+    Return the value of a JSON document, with objects and arrays decoded
+    when first accessed.
+
+    Arguments:
+
+      text: the document, as a unicode string or a UTF-8 byte string.
+
+    """
+    if not isinstance(text, unicode):
+        text = text.decode('utf-8')
+    # Skip a byte order mark.
+    if text.startswith(u'\ufeff'):
+        text = text[1:]
+
+    document = _Document(text)
+    pos = _skip_whitespace(text, 0)
+    char = text[pos:pos + 1]
+    # Decoding the members of a top-level object or array now finds the
+    # end of the document without scanning it twice.
+    if char == '{':
+        value = LazyObject(document, pos)
+        pos = value._load()
+    elif char == '[':
+        value = LazyArray(document, pos)
+        pos = value._load()
+    else:
+        value, pos = _decode_value(document, pos)
+    if _skip_whitespace(text, pos) != len(text):
+        raise _error("Extra data", pos)
+    return value
+
+
+def load(fp):
+    """
+    Return the value of the JSON document in a file, as for loads().
+
+    """
+    return loads(fp.read())
@@ -0,0 +1,217 @@
+# coding: utf-8
+
+"""
+Provides the parsing of memory-mapped template files.
+
+Parsing a template file the usual way reads and decodes the whole file,
+and copies each stretch of literal text (and the text of each section,
+for lambdas) into a string of its own.  For a large template of mostly
+literal text, parse_file() instead memory-maps the file and parses its
+bytes.  The literal text and section text of the returned ParsedTemplate
+are ranges of the map, which the operating system pages in as needed.
+
+Rendering to byte strings in the file's encoding copies the bytes of
+each range without decoding them.  When Renderer.render_bytes() writes
+to a file, the ranges are written straight from the map, without any
+copy.  Rendering to unicode decodes the ranges on each render, so it is
+slower than for a template parsed the usual way.
+
+Tags are found in the undecoded bytes, so the file's encoding must
+encode ASCII characters as their ASCII bytes and use these bytes for
+nothing else, as UTF-8 and single-byte encodings like Latin-1 do.  Files
+in other encodings are read and parsed as usual.
+
+"""
+
+import codecs
+import mmap
+import os
+
+try:
+    # The hashlib module is new in Python 2.5.
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+from pystache import defaults
+from pystache.parsed import ParsedTemplate
+from pystache.parser import _compile_template_re, _Node, _Parser, flatten, parse
+
+
+try:
+    buffer
+except NameError:
+    # Then we are in Python 3.
+    def _make_view(data, start, end):
+        return memoryview(data)[start:end]
+else:
+    # In Python 2, memoryview does not support mmap objects.
+    def _make_view(data, start, end):
+        return buffer(data, start, end - start)
+
+
+_ALL_BYTES = bytes(bytearray(range(256)))
+
+
+def _is_ascii_compatible(encoding):
+    """
+    Return whether an encoding encodes ASCII characters as their ASCII
+    bytes and uses these bytes for nothing else.
+
+    """
+    if codecs.lookup(encoding).name == 'utf-8':
+        return True
+    # Otherwise, we accept single-byte encodings that extend ASCII.
+    chars = _ALL_BYTES.decode(encoding, 'replace')
+    return len(chars) == 256 and chars[:128] == _ALL_BYTES[:128].decode('ascii')
+
+
+class _MappedText(_Node):
+
+    """
+    A range of the bytes of a memory-mapped template file.
+
+    The parse tree of a mapped template has instances of this class in
+    place of unicode strings of literal text.
+
+    """
+
+    __slots__ = ('data', 'start', 'end', 'encoding', 'errors', '_digest')
+
+    def __init__(self, data, start, end, encoding, errors):
+        """
+        Arguments:
+
+          data: the mmap object.
+
+          encoding: the normalized name of the file's encoding.
+
+          errors: the errors argument with which to decode the text.
+
+        """
+        self.data = data
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+        self.errors = errors
+        # The digest of the bytes, computed when first needed.
+        self._digest = None
+
+    def __repr__(self):
+        # The repr of a parse tree identifies its text (e.g. in tracking
+        # fingerprints and fragment cache keys), so we include a digest of
+        # the bytes rather than their place in the map.  Since the file
+        # should not change while mapped, we compute the digest once.
+        digest = self._digest
+        if digest is None:
+            digest = sha1(_make_view(self.data, self.start, self.end)).hexdigest()
+            self._digest = digest
+        return "%s(digest=%s, encoding=%s)" % (self.__class__.__name__, repr(digest),
+                                               repr(self.encoding))
+
+    # Pickling a mapped text pickles its text, since an mmap object
+    # cannot be pickled.
+    def __reduce__(self):
+        return (unicode, (self.decode(), ))
+
+    def decode(self):
+        """
+        Return the text as a unicode string.
+
+        """
+        return self.data[self.start:self.end].decode(self.encoding, self.errors)
+
+    def get_keys(self):
+        return []
+
+    def render(self, engine, context):
+        return self.decode()
+
+    def iter_render_bytes(self, engine, context):
+        if codecs.lookup(engine.encoding).name != self.encoding:
+            yield self.decode().encode(engine.encoding)
+        elif engine.buffers:
+            yield _make_view(self.data, self.start, self.end)
+        else:
+            yield self.data[self.start:self.end]
+
+
+class _MappedParser(_Parser):
+
+    """
+    Parses the bytes of a memory-mapped template file.
+
+    """
+
+    def __init__(self, encoding, errors, delimiters=None):
+        _Parser.__init__(self, delimiters)
+        self.encoding = codecs.lookup(encoding).name
+        self.errors = errors
+
+    def _compile_delimiters(self):
+        self._template_re = _compile_template_re(self._delimiters, self.encoding)
+
+    def _get_matches(self, match):
+        matches = match.groupdict()
+        for name, value in matches.items():
+            if value is not None:
+                matches[name] = value.decode(self.encoding, self.errors)
+        return matches
+
+    def _get_char(self, template, index):
+        # This is only compared with ASCII characters, whose bytes are the
+        # same in Latin-1 as in the file's encoding.
+        return template[index:index + 1].decode('latin-1')
+
+    def _get_literal(self, template, start, end):
+        return _MappedText(template, start, end, self.encoding, self.errors)
+
+    def _get_section_text(self, template, start, end, is_outermost):
+        # The text stays in the map, so there is nothing to copy.
+        return _MappedText(template, start, end, self.encoding, self.errors)
+
+
+def parse_file(path, encoding=None, decode_errors=None, delimiters=None,
+               resolve_partial=None):
+    """
+    Memory-map a template file, and return a ParsedTemplate instance
+    whose literal text refers to the map.
+
+    The file should not be modified while the ParsedTemplate is in use.
+
+    Arguments:
+
+      encoding: the name of the file's encoding.  Defaults to the package
+        default.
+
+      decode_errors: the errors argument with which to decode the file's
+        text.  Defaults to the package default.
+
+      delimiters, resolve_partial: as for parser.parse().
+
+    """
+    if encoding is None:
+        encoding = defaults.FILE_ENCODING
+    if decode_errors is None:
+        decode_errors = defaults.DECODE_ERRORS
+
+    f = open(path, 'rb')
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped.
+            return ParsedTemplate()
+        # The map stays open after the file is closed.
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+
+    if not _is_ascii_compatible(encoding):
+        template = data[:].decode(encoding, decode_errors)
+        data.close()
+        return parse(template, delimiters, resolve_partial)
+
+    parser = _MappedParser(encoding, decode_errors, delimiters)
+    parsed = parser.parse(data)
+    if parser.has_inheritance and resolve_partial is not None:
+        parsed = flatten(parsed, resolve_partial)
+    return parsed
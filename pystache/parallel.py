@@ -0,0 +1,165 @@
+# coding: utf-8
+
+"""
+Exposes a render_parallel() function to render a template against many
+contexts using a pool of processes.
+
+"""
+
+import copy
+import sys
+import traceback
+
+try:
+    # The multiprocessing module is new in Python 2.6.
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+from pystache.common import PystacheError
+from pystache.context import ContextStack
+from pystache.renderer import Renderer
+
+
+# The valid values for the errors argument of render_parallel().
+ERRORS_RAISE = 'raise'
+ERRORS_RETURN = 'return'
+ERRORS_SKIP = 'skip'
+
+_ERRORS_VALUES = (ERRORS_RAISE, ERRORS_RETURN, ERRORS_SKIP)
+
+
+class RenderError(PystacheError):
+
+    """
+    An error raised while rendering one of the contexts in a worker process.
+
+    Since exceptions cannot always be pickled, the original exception is
+    described by its type name, message, and formatted traceback.
+
+    """
+
+    def __init__(self, index, type_name, message, traceback_text):
+        PystacheError.__init__(self, index, type_name, message, traceback_text)
+        self.index = index
+        self.type_name = type_name
+        self.message = message
+        self.traceback_text = traceback_text
+
+    def __str__(self):
+        return "Error rendering context %d: %s: %s" % (self.index, self.type_name,
+                                                       self.message)
+
+
+# The state of a worker process, set by _init_worker().  Keeping this
+# state in the worker means the template and renderer are sent to each
+# worker once, rather than with every chunk of contexts.
+_worker = {}
+
+
+def _init_worker(renderer, parsed, prefix):
+    _worker['renderer'] = renderer
+    _worker['render_func'] = renderer._make_render_parsed(parsed)
+    _worker['engine'] = renderer._make_render_engine()
+    _worker['prefix'] = prefix
+
+
+def _render_item(item):
+    """
+    Render one context in a worker process.
+
+    Returns an (index, succeeded, value) tuple, where value is the
+    rendering or a description of the error.
+
+    """
+    index, context = item
+    renderer = _worker['renderer']
+
+    try:
+        stack = ContextStack.create(*(_worker['prefix'] + (context, )))
+        rendered = renderer._render_with(_worker['render_func'], _worker['engine'], stack)
+    except Exception:
+        ex_type, ex_value, tb = sys.exc_info()
+        text = ''.join(traceback.format_exception(ex_type, ex_value, tb))
+        return index, False, (ex_type.__name__, str(ex_value), text)
+
+    return index, True, rendered
+
+
+def render_parallel(template, contexts, workers=None, chunksize=100,
+                    renderer=None, errors=ERRORS_RAISE):
+    """
+    Render a template against each item of contexts using worker processes.
+
+    Returns an iterator over the renderings, in the order of contexts.
+    The worker processes start when iteration starts, and stop when it
+    ends or the iterator is closed.  This is useful for CPU-bound batch
+    jobs like mail merges, since rendering in a single process is limited
+    by the global interpreter lock.
+
+    The template is parsed once, and the parsed template and the renderer
+    are sent to each worker once.  The contexts are sent to the workers in
+    chunks as the pool consumes them.  Contexts, and any objects needed to
+    render them, must be picklable.
+
+    Arguments:
+
+      template: a template, as for Renderer.render().
+
+      contexts: an iterable of contexts, as for Renderer.render_many().
+
+      workers: the number of worker processes.  Defaults to the number
+        of CPUs.
+
+      chunksize: the number of contexts to send to a worker at a time.
+
+      renderer: the Renderer instance whose configuration (e.g. escape
+        function, missing_tags, and partials) to use.  It must be
+        picklable.  Its prefetch_executor is not used.  Defaults to
+        a default Renderer.
+
+      errors: how to handle an error raised while rendering a context.
+        If 'raise', the iterator raises a RenderError and the pool stops.
+        If 'return', the iterator yields a RenderError instance in place
+        of the rendering.  If 'skip', the iterator leaves out the
+        rendering.
+
+    """
+    if multiprocessing is None:
+        raise PystacheError("Parallel rendering requires the multiprocessing "
+                            "module (Python 2.6 or later).")
+    if errors not in _ERRORS_VALUES:
+        raise Exception("Unsupported 'errors' value: %s" % repr(errors))
+
+    if renderer is None:
+        renderer = Renderer()
+    else:
+        renderer = copy.copy(renderer)
+    # Executors cannot be sent to other processes.
+    renderer.prefetch_executor = None
+
+    parsed, prefix = renderer._get_parsed(template, ())
+
+    return _iter_results(renderer, parsed, prefix, contexts, workers, chunksize, errors)
+
+
+def _iter_results(renderer, parsed, prefix, contexts, workers, chunksize, errors):
+    # We create the pool here rather than in render_parallel() so that no
+    # worker processes are started (and left running) if the caller never
+    # iterates.
+    pool = multiprocessing.Pool(workers, _init_worker, (renderer, parsed, prefix))
+    try:
+        results = pool.imap(_render_item, enumerate(contexts), chunksize)
+        for index, succeeded, value in results:
+            if succeeded:
+                yield value
+                continue
+            error = RenderError(index, *value)
+            if errors == ERRORS_RAISE:
+                raise error
+            if errors == ERRORS_RETURN:
+                yield error
+    finally:
+        # This also stops the workers if the caller stops iterating early.
+        pool.terminate()
+        pool.join()
@@ -5,6 +5,9 @@ Exposes a class that represents a parsed (or compiled) template.
 
 """
 
+# The type of byte strings (str in Python 2 and bytes in Python 3).
+_BYTES = type(u''.encode('ascii'))
+
 
 class ParsedTemplate(object):
 
@@ -14,16 +17,50 @@ class ParsedTemplate(object):
     An instance wraps a list of unicode strings and node objects.  A node
     object must have a `render(engine, stack)` method that accepts a
     RenderEngine instance and a ContextStack instance and returns a unicode
-    string.
+    string, and a `get_keys()` method that returns the list of context
+    names the node references.  A node object may also have an
+    `iter_render(engine, stack)` method that yields its rendering in
+    pieces, and an `iter_render_bytes(engine, stack)` method that yields
+    its rendering in pieces encoded in engine.encoding.  A node object whose
+    rendering is just the value of its own tag (e.g. a variable tag, but
+    not a section or partial) may have a true `formattable` attribute.
 
     """
 
+    __slots__ = ('_parse_tree', '_encoded', '_format', '_jit', '_flattened')
+
     def __init__(self):
         self._parse_tree = []
+        # Maps an encoding name to a copy of the parse tree with the
+        # literals encoded in that encoding.  Created when first needed.
+        self._encoded = None
+        # The pair of a format string and the list of the tag nodes to
+        # render into it, or False if the template has other nodes.
+        # Created when first rendered.
+        self._format = None
+        # The compilation state for codegen.render(), if any.
+        self._jit = None
+        # The parent templates loaded and the tree with them merged in,
+        # for trees with parent tags (see parser.flatten()).
+        self._flattened = None
 
     def __repr__(self):
         return repr(self._parse_tree)
 
+    # Instances of classes with __slots__ need these methods to be pickled
+    # with the protocols before protocol 2.
+    def __getstate__(self):
+        # The encoded parse trees, format string, compiled functions, and
+        # flattened tree are recreated when needed.
+        return {'_parse_tree': self._parse_tree}
+
+    def __setstate__(self, state):
+        self._parse_tree = state['_parse_tree']
+        self._encoded = None
+        self._format = None
+        self._jit = None
+        self._flattened = None
+
     def add(self, node):
         """
         Arguments:
@@ -33,12 +70,120 @@ class ParsedTemplate(object):
 
         """
         self._parse_tree.append(node)
+        self._format = None
+        self._flattened = None
+
+    def get_keys(self):
+        """
+        Return the list of context names referenced by the template.
+
+        The names are listed in order of first appearance and without
+        duplicates.  Dotted names are returned as is.  Names referenced
+        only by partials or by the templates returned by lambdas are not
+        included, as these are not known until render time.
+
+        """
+        keys = []
+        seen = set()
+        for node in self._parse_tree:
+            if type(node) is unicode:
+                continue
+            for key in node.get_keys():
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+        return keys
+
+    def iter_render(self, engine, context):
+        """
+        Render the template, yielding the output in unicode pieces.
+
+        Joining the pieces gives the same string as render().
+
+        """
+        for node in self._parse_tree:
+            if type(node) is unicode:
+                yield node
+                continue
+            iter_render = getattr(node, 'iter_render', None)
+            if iter_render is None:
+                yield node.render(engine, context)
+                continue
+            for part in iter_render(engine, context):
+                yield part
+
+    def _get_encoded(self, encoding):
+        """
+        Return the parse tree with the unicode strings encoded.
+
+        """
+        if self._encoded is None:
+            self._encoded = {}
+        encoded = self._encoded.get(encoding)
+        if encoded is None:
+            encoded = []
+            for node in self._parse_tree:
+                if type(node) is unicode:
+                    node = node.encode(encoding)
+                encoded.append(node)
+            self._encoded[encoding] = encoded
+        return encoded
+
+    def iter_render_bytes(self, engine, context):
+        """
+        Render the template, yielding the output in byte string pieces.
+
+        The pieces are encoded in engine.encoding.  The template's literal
+        text is encoded only once per encoding, rather than on each render.
+
+        """
+        for node in self._get_encoded(engine.encoding):
+            if type(node) is _BYTES:
+                yield node
+                continue
+            iter_render_bytes = getattr(node, 'iter_render_bytes', None)
+            if iter_render_bytes is None:
+                yield node.render(engine, context).encode(engine.encoding)
+                continue
+            for part in iter_render_bytes(engine, context):
+                yield part
+
+    def _get_format(self):
+        """
+        Return the pair of a format string and the list of the nodes whose
+        renderings it takes, or False if the template has nodes that are
+        not formattable (e.g. sections or partials).
+
+        """
+        if self._format is not None:
+            return self._format
+
+        pieces, nodes = [], []
+        for node in self._parse_tree:
+            if type(node) is unicode:
+                pieces.append(node.replace(u'%', u'%%'))
+            elif getattr(node, 'formattable', False):
+                pieces.append(u'%s')
+                nodes.append(node)
+            else:
+                self._format = False
+                return False
+
+        self._format = (u''.join(pieces), nodes)
+        return self._format
 
     def render(self, engine, context):
         """
         Returns: a string of type unicode.
 
         """
+        format = self._get_format()
+        if format:
+            # Then the template has only variable tags, which we render
+            # into a format string in one operation.
+            format_string, nodes = format
+            return format_string % tuple([node.render(engine, context) for node in nodes])
+
         # We avoid use of the ternary operator for Python 2.4 support.
         def get_unicode(node):
             if type(node) is unicode:
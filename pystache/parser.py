@@ -6,19 +6,31 @@ Exposes a parse() function to parse template strings.
 """
 
 import re
+import textwrap
+import threading
 
 from pystache import defaults
+from pystache.common import is_string, SectionLambda
 from pystache.parsed import ParsedTemplate
+from pystache.tables import Table
 
 
 END_OF_LINE_CHARACTERS = [u'\r', u'\n']
 NON_BLANK_RE = re.compile(ur'^(.)', re.M)
 
+# The maximum number of parse trees that parse() caches.
+PARSE_CACHE_SIZE = 1000
+
+# Maps a (template, delimiters) pair to a pair (parsed_template,
+# has_inheritance), where parsed_template is not flattened.
+_parse_cache = {}
+_parse_cache_lock = threading.Lock()
+
 
 # TODO: add some unit tests for this.
 # TODO: add a test case that checks for spurious spaces.
 # TODO: add test cases for delimiters.
-def parse(template, delimiters=None):
+def parse(template, delimiters=None, resolve_partial=None, cache=False):
     """
     Parse a unicode template string and return a ParsedTemplate instance.
 
@@ -28,27 +40,205 @@ def parse(template, delimiters=None):
 
       delimiters: a 2-tuple of delimiters.  Defaults to the package default.
 
+      resolve_partial: a function that accepts a template name and returns
+        the template string, as for RenderEngine.__init__().  If given,
+        the parent templates of the template (see the inheritance tags
+        below) are loaded and merged into the returned ParsedTemplate, so
+        that rendering does not look up blocks.
+
+      cache: whether to cache the parse tree, keyed by the template
+        string and delimiters.  This is for strings that are parsed
+        repeatedly, like partials and the strings that lambdas return.
+        The returned ParsedTemplate should then not be modified.
+
+    Besides the tags of the Mustache spec, the parser supports the tags
+    of the spec's optional inheritance module.  A parent tag
+    {{<parent}}...{{/parent}} includes the template named "parent" like a
+    partial, replacing the blocks in it that it overrides.  A block
+    {{$name}}...{{/name}} renders its content unless overridden.
+
+    A line holding only parent and block tags is standalone, even if it
+    holds both the opening and closing tags (as in
+    "  {{<parent}}{{/parent}}\n").  If the opening tag of an overridden
+    block is standalone, the overriding content is reindented: its own
+    common indentation is replaced by that of the tag.  Unlike the spec's
+    inheritance module, the indentation of the block's default content
+    is not taken into account.
+
     Examples:
 
     >>> parsed = parse(u"Hey {{#who}}{{name}}!{{/who}}")
     >>> print str(parsed).replace('u', '')  # This is a hack to get the test to pass both in Python 2 and 3.
-    ['Hey ', _SectionNode(key='who', index_begin=12, index_end=21, parsed=[_EscapeNode(key='name'), '!'])]
+    ['Hey ', _SectionNode(key='who', parsed=[_EscapeNode(key='name'), '!'])]
 
     """
     if type(template) is not unicode:
         raise Exception("Template is not unicode: %s" % type(template))
+
+    if cache:
+        parsed, has_inheritance = _parse_with_cache(template, delimiters)
+    else:
+        parser = _Parser(delimiters)
+        parsed = parser.parse(template)
+        has_inheritance = parser.has_inheritance
+
+    if has_inheritance and resolve_partial is not None:
+        # A cached tree keeps its flattened tree only while the parent
+        # templates stay the same (see flatten()).
+        parsed = flatten(parsed, resolve_partial)
+    return parsed
+
+
+def _parse_with_cache(template, delimiters):
+    """
+    Return the pair (parsed_template, has_inheritance) for a template
+    string, from the parse cache if possible.
+
+    """
+    if delimiters is None:
+        # The defaults can change at run time (see issue #135).
+        delimiters = defaults.DELIMITERS
+    cache_key = (template, tuple(delimiters))
+
+    entry = _parse_cache.get(cache_key)
+    if entry is not None:
+        return entry
+
     parser = _Parser(delimiters)
-    return parser.parse(template)
+    entry = (parser.parse(template), parser.has_inheritance)
+
+    _parse_cache_lock.acquire()
+    try:
+        if len(_parse_cache) >= PARSE_CACHE_SIZE:
+            # Rather than track use, we start over.  A cache this size
+            # fills up only with templates that are not reused much.
+            _parse_cache.clear()
+        _parse_cache[cache_key] = entry
+    finally:
+        _parse_cache_lock.release()
+
+    return entry
+
+
+def _flatten_into(parsed_template, nodes, resolve_partial, overrides, loaded):
+    """
+    Add the given nodes to a ParsedTemplate, with parent tags and blocks
+    replaced by the nodes they render.
 
+    Arguments:
+
+      overrides: a dictionary mapping block names to the _BlockNode
+        instances that override them.
+
+      loaded: a list to which to append a (name, template) pair for each
+        parent template loaded.
 
-def _compile_template_re(delimiters):
+    """
+    for node in nodes:
+        if isinstance(node, _BlockNode):
+            override = overrides.get(node.key)
+            if override is None:
+                content = node.parsed
+            else:
+                content = override.get_override(node.indent)
+            _flatten_into(parsed_template, content._parse_tree, resolve_partial, overrides,
+                          loaded)
+        elif isinstance(node, _ParentNode):
+            # The overrides of an outer parent tag take precedence.
+            parent_overrides = node.overrides.copy()
+            parent_overrides.update(overrides)
+            template = resolve_partial(node.key)
+            loaded.append((node.key, template))
+            parent = parse(node.indent_parent(template))
+            _flatten_into(parsed_template, parent._parse_tree, resolve_partial,
+                          parent_overrides, loaded)
+        elif isinstance(node, _SectionNode):
+            parsed = _flatten(node.parsed, resolve_partial, overrides, loaded)
+            _add_node(parsed_template, _SectionNode(node.key, parsed, node.delimiters, node.text))
+        elif isinstance(node, _InvertedNode):
+            parsed = _flatten(node.parsed_section, resolve_partial, overrides, loaded)
+            _add_node(parsed_template, _InvertedNode(node.key, parsed))
+        elif isinstance(node, _ConditionalNode):
+            # The two sections are fused again as they are added.
+            _flatten_into(parsed_template, [node.section, node.inverted], resolve_partial,
+                          overrides, loaded)
+        else:
+            _add_node(parsed_template, node)
+
+
+def _add_node(parsed_template, node):
+    """
+    Add a node to a ParsedTemplate, fusing an inverted section with an
+    immediately preceding section on the same key.
+
+    """
+    tree = parsed_template._parse_tree
+    if (isinstance(node, _InvertedNode) and tree and isinstance(tree[-1], _SectionNode) and
+        tree[-1].key == node.key):
+        node = _ConditionalNode(tree.pop(), node)
+    parsed_template.add(node)
+
+
+def _flatten(parsed, resolve_partial, overrides, loaded):
+    parsed_template = ParsedTemplate()
+    _flatten_into(parsed_template, parsed._parse_tree, resolve_partial, overrides, loaded)
+    return parsed_template
+
+
+def _flatten_cached(owner, nodes, resolve_partial):
+    """
+    Return a ParsedTemplate of the given nodes with their parent tags and
+    blocks resolved, caching it in the _flattened attribute of owner.
+
+    The cached tree is reused as long as resolve_partial returns the same
+    parent templates.
+
+    """
+    entry = owner._flattened
+    if entry is not None:
+        loaded, parsed = entry
+        for name, template in loaded:
+            if resolve_partial(name) != template:
+                break
+        else:
+            return parsed
+
+    loaded = []
+    parsed = ParsedTemplate()
+    _flatten_into(parsed, nodes, resolve_partial, {}, loaded)
+    owner._flattened = (loaded, parsed)
+    return parsed
+
+
+def flatten(parsed, resolve_partial):
+    """
+    Return a ParsedTemplate with the parent tags and blocks of the given
+    ParsedTemplate resolved.
+
+    Parent templates are loaded with resolve_partial.  Partials included
+    with {{>partial}} are not loaded, as they do not see the blocks of
+    the including template.
+
+    The result is cached on the given ParsedTemplate, and reused while
+    resolve_partial returns the same parent templates.
+
+    """
+    return _flatten_cached(parsed, parsed._parse_tree, resolve_partial)
+
+
+def _compile_template_re(delimiters, encoding=None):
     """
     Return a regular expression object (re.RegexObject) instance.
 
+    Arguments:
+
+      encoding: the encoding of the byte string templates to match, or
+        None to match unicode templates.
+
     """
     # The possible tag type characters following the opening tag,
     # excluding "=" and "{".
-    tag_types = "!>&/#^"
+    tag_types = "!>&/#^<$"
 
     # TODO: are we following this in the spec?
     #
@@ -66,6 +256,9 @@ def _compile_template_re(delimiters):
         \s* %(ctag)s
     """ % {'tag_types': tag_types, 'otag': re.escape(delimiters[0]), 'ctag': re.escape(delimiters[1])}
 
+    if encoding is not None:
+        tag = tag.encode(encoding)
+
     return re.compile(tag, re.VERBOSE)
 
 
@@ -76,73 +269,171 @@ class ParsingError(Exception):
 
 ## Node types
 
+def _get_slots(obj):
+    """
+    Return the names of the slots of an instance of a class with __slots__.
+
+    """
+    names = []
+    for cls in type(obj).__mro__:
+        names.extend(getattr(cls, '__slots__', ()))
+    return names
+
+
 def _format(obj, exclude=None):
     if exclude is None:
         exclude = []
     exclude.append('key')
-    attrs = obj.__dict__
+    attrs = {}
+    for name in _get_slots(obj):
+        attrs[name] = getattr(obj, name)
     names = list(set(attrs.keys()) - set(exclude))
     names.sort()
-    names.insert(0, 'key')
+    # Not all nodes have a key (e.g. comment nodes).
+    if 'key' in attrs:
+        names.insert(0, 'key')
     args = ["%s=%s" % (name, repr(attrs[name])) for name in names]
     return "%s(%s)" % (obj.__class__.__name__, ", ".join(args))
 
 
-class _CommentNode(object):
+class _Node(object):
+
+    """
+    The base class of the node types.
+
+    Node classes define __slots__, since a cached template can hold many
+    nodes.
+
+    """
+
+    __slots__ = ()
+
+    # The names of the attributes that repr() leaves out.
+    _repr_exclude = ()
+
+    # Whether the node renders only the value of its own tag (see
+    # ParsedTemplate.render()).
+    formattable = False
 
     def __repr__(self):
-        return _format(self)
+        return _format(self, list(self._repr_exclude))
+
+    # Instances of classes with __slots__ need these methods to be pickled
+    # with the protocols before protocol 2.
+    def __getstate__(self):
+        state = {}
+        for name in _get_slots(self):
+            state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class _CommentNode(_Node):
+
+    __slots__ = ()
+
+    formattable = True
+
+    def get_keys(self):
+        return []
 
     def render(self, engine, context):
         return u''
 
 
-class _ChangeNode(object):
+class _ChangeNode(_Node):
+
+    __slots__ = ('delimiters', )
+
+    formattable = True
 
     def __init__(self, delimiters):
         self.delimiters = delimiters
 
-    def __repr__(self):
-        return _format(self)
+    def get_keys(self):
+        return []
 
     def render(self, engine, context):
         return u''
 
 
-class _EscapeNode(object):
+class _EscapeNode(_Node):
+
+    __slots__ = ('key', )
+
+    formattable = True
 
     def __init__(self, key):
         self.key = key
 
-    def __repr__(self):
-        return _format(self)
+    def get_keys(self):
+        return [self.key]
 
     def render(self, engine, context):
         s = engine.fetch_string(context, self.key)
         return engine.escape(s)
 
+    def render_value(self, engine, val):
+        """
+        Return the rendering of the tag for a resolved value that is not a
+        lambda, as a string of type unicode (not a subclass).
 
-class _LiteralNode(object):
+        """
+        if not is_string(val):
+            val = engine.to_str(val)
+        # The escape function can return a subclass like Safe.
+        return unicode(engine.escape(val))
+
+    def iter_render_bytes(self, engine, context):
+        s = engine.fetch_string(context, self.key)
+        yield engine.escape_bytes(s)
+
+
+class _LiteralNode(_Node):
+
+    __slots__ = ('key', )
+
+    formattable = True
 
     def __init__(self, key):
         self.key = key
 
-    def __repr__(self):
-        return _format(self)
+    def get_keys(self):
+        return [self.key]
 
     def render(self, engine, context):
         s = engine.fetch_string(context, self.key)
         return engine.literal(s)
 
+    def render_value(self, engine, val):
+        """
+        Return the rendering of the tag for a resolved value that is not a
+        lambda, as a string of type unicode (not a subclass).
+
+        """
+        if not is_string(val):
+            val = engine.to_str(val)
+        return unicode(engine.literal(val))
+
+    def iter_render_bytes(self, engine, context):
+        s = engine.fetch_string(context, self.key)
+        yield engine.literal_bytes(s)
+
 
-class _PartialNode(object):
+class _PartialNode(_Node):
+
+    __slots__ = ('key', 'indent')
 
     def __init__(self, key, indent):
         self.key = key
         self.indent = indent
 
-    def __repr__(self):
-        return _format(self)
+    def get_keys(self):
+        # The keys of a partial are not known until the partial is loaded.
+        return []
 
     def render(self, engine, context):
         template = engine.resolve_partial(self.key)
@@ -152,46 +443,345 @@ class _PartialNode(object):
         return engine.render(template, context)
 
 
-class _InvertedNode(object):
+class _InvertedNode(_Node):
+
+    __slots__ = ('key', 'parsed_section')
 
     def __init__(self, key, parsed_section):
         self.key = key
         self.parsed_section = parsed_section
 
-    def __repr__(self):
-        return _format(self)
+    def get_keys(self):
+        return [self.key] + self.parsed_section.get_keys()
 
     def render(self, engine, context):
-        # TODO: is there a bug because we are not using the same
-        #   logic as in fetch_string()?
-        data = engine.resolve_context(context, self.key)
-        # Note that lambdas are considered truthy for inverted sections
-        # per the spec.
-        if data:
+        # Coerce the data first, since the truth value of a structured
+        # array is ambiguous.  Note that lambdas are considered truthy for
+        # inverted sections per the spec.
+        if engine.fetch_section_data(context, self.key):
             return u''
         return self.parsed_section.render(engine, context)
 
+    def iter_render_bytes(self, engine, context):
+        if engine.fetch_section_data(context, self.key):
+            return
+        for part in self.parsed_section.iter_render_bytes(engine, context):
+            yield part
+
+
+class _BlockNode(_Node):
+
+    __slots__ = ('key', 'parsed', 'indent', 'text', 'delimiters')
+
+    _repr_exclude = ('text', 'delimiters')
+
+    def __init__(self, key, parsed, indent, text, delimiters):
+        """
+        Arguments:
+
+          indent: the indentation of the block's opening tag if the tag is
+            standalone, and otherwise None.
 
-class _SectionNode(object):
+          text: the unprocessed text of the block if it is inside a parent
+            tag, and otherwise None.  This is a unicode string, or an
+            object with a decode() method that returns the text.
 
-    # TODO: the template_ and parsed_template_ arguments don't both seem
-    # to be necessary.  Can we remove one of them?  For example, if
-    # callable(data) is True, then the initial parsed_template isn't used.
-    def __init__(self, key, parsed, delimiters, template, index_begin, index_end):
+        """
+        self.key = key
+        self.parsed = parsed
+        self.indent = indent
+        self.text = text
+        self.delimiters = delimiters
+
+    def get_keys(self):
+        return self.parsed.get_keys()
+
+    def get_override(self, indent):
+        """
+        Return the ParsedTemplate to render in place of a block of a
+        parent template that this block overrides.
+
+        Arguments:
+
+          indent: the indent attribute of the overridden block.
+
+        """
+        if indent is None:
+            return self.parsed
+        # Then the overridden block's tag is standalone, so we replace
+        # the indentation of the content with the tag's, as the spec
+        # requires.  Like partials, we indent before parsing.
+        text = self.text
+        if type(text) is not unicode:
+            text = text.decode()
+        text = re.sub(NON_BLANK_RE, indent + ur'\1', textwrap.dedent(text))
+        return parse(text, self.delimiters)
+
+    def render(self, engine, context):
+        # A block that is not inside a parent template renders its content.
+        return self.parsed.render(engine, context)
+
+
+class _ParentNode(_Node):
+
+    __slots__ = ('key', 'overrides', 'indent', '_flattened')
+
+    _repr_exclude = ('_flattened',)
+
+    def __init__(self, key, overrides, indent):
+        """
+        Arguments:
+
+          overrides: a dictionary mapping the names of the blocks inside
+            the parent tag to their _BlockNode instances.
+
+        """
+        self.key = key
+        self.overrides = overrides
+        self.indent = indent
+        # See _flatten_cached().
+        self._flattened = None
+
+    def get_keys(self):
+        # The keys of the parent are not known until the parent is loaded.
+        keys = []
+        for name in sorted(self.overrides):
+            keys.extend(self.overrides[name].get_keys())
+        return keys
+
+    def __getstate__(self):
+        state = _Node.__getstate__(self)
+        # The flattened tree is recreated when needed.
+        state['_flattened'] = None
+        return state
+
+    def indent_parent(self, template):
+        """
+        Return the parent template string, indented.
+
+        """
+        # Indent before parsing, as for partials.
+        return re.sub(NON_BLANK_RE, self.indent + ur'\1', template)
+
+    def render(self, engine, context):
+        # Parent tags are usually resolved when the template is loaded
+        # (see flatten()), in which case this method is not called.
+        parsed = _flatten_cached(self, [self], engine.resolve_partial)
+        return parsed.render(engine, context)
+
+
+class _Section(object):
+
+    """
+    The handle to a section that a SectionLambda receives.
+
+    """
+
+    __slots__ = ('_node', '_engine', '_context')
+
+    def __init__(self, node, engine, context):
+        self._node = node
+        self._engine = engine
+        self._context = context
+
+    def _get_text(self):
+        return self._node.get_text()
+
+    text = property(_get_text)
+
+    def render(self, template=None):
+        """
+        Render the section, or the given template string in its place.
+
+        """
+        engine, node = self._engine, self._node
+        if template is None:
+            return node.parsed.render(engine, self._context)
+        return engine._render_value(template, self._context, delimiters=node.delimiters)
+
+
+def _defines(values, name):
+    """
+    Return whether any of a table or list of dictionaries defines a name.
+
+    """
+    if isinstance(values, Table):
+        return values.has_name(name)
+    for val in values:
+        if name in val:
+            return True
+    return False
+
+
+class _SectionText(object):
+
+    """
+    The unprocessed text of a nested section, as a range of the text of
+    the outermost section that contains it.
+
+    An outermost section keeps a copy of its own text rather than the
+    whole template string.  The sections nested in it share that copy,
+    and their text is sliced from it only when a lambda asks for it.
+
+    """
+
+    __slots__ = ('source', 'start', 'end')
+
+    def __init__(self, source, start, end):
+        self.source = source
+        self.start = start
+        self.end = end
+
+    def __reduce__(self):
+        return (_SectionText, (self.source, self.start, self.end))
+
+    def decode(self):
+        """
+        Return the text as a unicode string.
+
+        """
+        return self.source[self.start:self.end]
+
+
+class _SectionNode(_Node):
+
+    __slots__ = ('key', 'parsed', 'delimiters', 'text', '_hoistable')
+
+    _repr_exclude = ('delimiters', 'text', '_hoistable')
+
+    def __init__(self, key, parsed, delimiters, text):
+        """
+        Arguments:
+
+          text: the unprocessed text of the section, for lambdas.  This is
+            a unicode string, or an object with a decode() method that
+            returns the text (see _SectionText and the mapped module).
+
+        """
         self.delimiters = delimiters
         self.key = key
         self.parsed = parsed
-        self.template = template
-        self.index_begin = index_begin
-        self.index_end = index_end
+        self.text = text
+        # The list of (index, node, name) triples for the variable tags at
+        # the top level of the section, where name is the first part of
+        # the tag's key.  See _hoist().
+        self._hoistable = []
+        for index, node in enumerate(parsed._parse_tree):
+            if isinstance(node, (_EscapeNode, _LiteralNode)) and node.key != '.':
+                self._hoistable.append((index, node, node.key.split('.')[0]))
+
+    def get_keys(self):
+        return [self.key] + self.parsed.get_keys()
+
+    def get_text(self):
+        """
+        Return the unprocessed text of the section as a unicode string.
 
-    def __repr__(self):
-        return _format(self, exclude=['delimiters', 'template'])
+        """
+        text = self.text
+        if type(text) is not unicode:
+            text = text.decode()
+        return text
+
+    def _hoist(self, engine, context, values):
+        """
+        Return the ParsedTemplate to render for each of the given section
+        data values.
+
+        This is the section's ParsedTemplate, with the variable tags that
+        render the same for every item replaced by their rendering, so
+        that they are looked up once rather than once per item.  A tag
+        renders the same for every item if no item defines the first part
+        of its name, in which case the name resolves outside the section.
+
+        We only hoist tags when all items are dictionaries (the common
+        case), or when the values are a table (see the tables module),
+        since other objects can define names dynamically (e.g. with
+        __getattr__()).  Tags whose value is a lambda are not hoisted,
+        since a lambda's output is rendered with the item.
+
+        """
+        candidates = self._hoistable
+        if not candidates:
+            return self.parsed
+        if isinstance(values, Table):
+            if len(values) < 2:
+                return self.parsed
+        else:
+            if type(values) is not list or len(values) < 2:
+                return self.parsed
+            for val in values:
+                if type(val) is not dict:
+                    return self.parsed
+
+        tree = None
+        for index, node, name in candidates:
+            if not _defines(values, name):
+                resolved = engine.resolve_context(context, node.key)
+                if callable(resolved):
+                    continue
+                if tree is None:
+                    tree = list(self.parsed._parse_tree)
+                tree[index] = node.render_value(engine, resolved)
+
+        if tree is None:
+            return self.parsed
+        parsed = ParsedTemplate()
+        parsed._parse_tree = tree
+        return parsed
 
     def render(self, engine, context):
+        return unicode(''.join(self.iter_render(engine, context)))
+
+    def _render_uncached(self, engine, context):
+        return unicode(''.join(self._iter_render_items(engine, context)))
+
+    def iter_render(self, engine, context):
+        """
+        Render the section, yielding the rendering of each item in turn.
+
+        A cached section is yielded in one piece.
+
+        """
+        if self.is_cached(engine):
+            yield engine.fragments.render(self, engine, context, self._render_uncached)
+            return
+        for part in self._iter_render_items(engine, context):
+            yield part
+
+    def is_cached(self, engine):
+        """
+        Return whether the engine renders the section through its fragment
+        cache.
+
+        """
+        fragments = engine.fragments
+        return fragments is not None and self.key in fragments.names
+
+    def _render_lambda(self, val, engine, context):
+        if isinstance(val, SectionLambda):
+            # The return value is already a rendering.
+            val = val(_Section(self, engine, context))
+            if not is_string(val):
+                val = engine.to_str(val)
+            if type(val) is not unicode:
+                val = engine.literal(val)
+            return val
+
+        val = val(self.get_text())
+        return engine._render_value(val, context, delimiters=self.delimiters)
+
+    def _iter_render_items(self, engine, context):
         values = engine.fetch_section_data(context, self.key)
+        return self.iter_render_values(engine, context, values)
+
+    def iter_render_values(self, engine, context, values):
+        """
+        Render the section for the given list of section data values,
+        without the fragment cache.
 
-        parts = []
+        """
+        parsed = self._hoist(engine, context, values)
         for val in values:
             if callable(val):
                 # Lambdas special case section rendering and bypass pushing
@@ -209,16 +799,102 @@ class _SectionNode(object):
                 #   https://github.com/defunkt/pystache/issues/113
                 #
                 # TODO: should we check the arity?
-                val = val(self.template[self.index_begin:self.index_end])
-                val = engine._render_value(val, context, delimiters=self.delimiters)
-                parts.append(val)
+                yield self._render_lambda(val, engine, context)
                 continue
 
             context.push(val)
-            parts.append(self.parsed.render(engine, context))
+            rendered = parsed.render(engine, context)
             context.pop()
+            yield rendered
 
-        return unicode(''.join(parts))
+    def iter_render_bytes(self, engine, context):
+        """
+        Render the section, yielding byte string pieces.
+
+        """
+        if self.is_cached(engine):
+            rendered = engine.fragments.render(self, engine, context, self._render_uncached)
+            yield rendered.encode(engine.encoding)
+            return
+
+        values = engine.fetch_section_data(context, self.key)
+        for part in self.iter_render_values_bytes(engine, context, values):
+            yield part
+
+    def iter_render_values_bytes(self, engine, context, values):
+        """
+        Render the section for the given list of section data values,
+        yielding byte string pieces.
+
+        """
+        parsed = self._hoist(engine, context, values)
+        for val in values:
+            if callable(val):
+                # See the comments in _iter_render_items().
+                yield self._render_lambda(val, engine, context).encode(engine.encoding)
+                continue
+
+            context.push(val)
+            for part in parsed.iter_render_bytes(engine, context):
+                yield part
+            context.pop()
+
+
+class _ConditionalNode(_Node):
+
+    """
+    A section immediately followed by an inverted section on the same key,
+    as in {{#x}}...{{/x}}{{^x}}...{{/x}}.
+
+    The node resolves the key once rather than once per section, and
+    renders one section or the other.
+
+    """
+
+    __slots__ = ('key', 'section', 'inverted')
+
+    def __init__(self, section, inverted):
+        self.key = section.key
+        self.section = section
+        self.inverted = inverted
+
+    def get_keys(self):
+        return self.section.get_keys() + self.inverted.get_keys()
+
+    def render(self, engine, context):
+        return unicode(''.join(self.iter_render(engine, context)))
+
+    def iter_render(self, engine, context):
+        values = engine.fetch_section_data(context, self.key)
+        # Lambdas are truthy, as for _InvertedNode.
+        if not values:
+            for part in self.inverted.parsed_section.iter_render(engine, context):
+                yield part
+            return
+
+        section = self.section
+        if section.is_cached(engine):
+            # The fragment cache resolves the key itself.
+            parts = section.iter_render(engine, context)
+        else:
+            parts = section.iter_render_values(engine, context, values)
+        for part in parts:
+            yield part
+
+    def iter_render_bytes(self, engine, context):
+        values = engine.fetch_section_data(context, self.key)
+        if not values:
+            for part in self.inverted.parsed_section.iter_render_bytes(engine, context):
+                yield part
+            return
+
+        section = self.section
+        if section.is_cached(engine):
+            parts = section.iter_render_bytes(engine, context)
+        else:
+            parts = section.iter_render_values_bytes(engine, context, values)
+        for part in parts:
+            yield part
 
 
 class _Parser(object):
@@ -231,6 +907,14 @@ class _Parser(object):
             delimiters = defaults.DELIMITERS
 
         self._delimiters = delimiters
+        # Whether the template contains parent tags or blocks.
+        self.has_inheritance = False
+        # Maps the text of each outermost section parsed to itself, so
+        # that sections with the same text share one string.
+        self._section_texts = {}
+        # The text of each section parsed inside the current outermost
+        # section, as a range of the template until that section ends.
+        self._nested_texts = []
 
     def _compile_delimiters(self):
         self._template_re = _compile_template_re(self._delimiters)
@@ -239,6 +923,57 @@ class _Parser(object):
         self._delimiters = delimiters
         self._compile_delimiters()
 
+    # The following methods are for subclasses that parse templates other
+    # than unicode strings (see the mapped module).
+
+    def _get_matches(self, match):
+        """
+        Return the dictionary of the groups of a tag match.
+
+        """
+        return match.groupdict()
+
+    def _get_char(self, template, index):
+        """
+        Return the character at an index of the template.
+
+        """
+        return template[index]
+
+    def _get_literal(self, template, start, end):
+        """
+        Return the parse tree node for a range of literal text.
+
+        """
+        return template[start:end]
+
+    def _get_section_text(self, template, start, end, is_outermost):
+        """
+        Return the unprocessed text of a section, for lambdas.
+
+        Arguments:
+
+          is_outermost: whether the section is not inside another section
+            (ignoring inverted sections, parent tags, and blocks, which do
+            not keep their text).
+
+        """
+        if not is_outermost:
+            text = _SectionText(template, start, end)
+            self._nested_texts.append(text)
+            return text
+
+        source = template[start:end]
+        source = self._section_texts.setdefault(source, source)
+        # Have the sections inside this one refer to its copy of the text.
+        for text in self._nested_texts:
+            text.source = source
+            text.start -= start
+            text.end -= start
+        self._nested_texts = []
+
+        return source
+
     def parse(self, template):
         """
         Parse a template string starting at some index.
@@ -263,6 +998,8 @@ class _Parser(object):
         parsed_template = ParsedTemplate()
 
         states = []
+        # The index after the last standalone parent or block tag.
+        run_index = None
 
         while True:
             match = self._template_re.search(template, start_index)
@@ -273,7 +1010,7 @@ class _Parser(object):
             match_index = match.start()
             end_index = match.end()
 
-            matches = match.groupdict()
+            matches = self._get_matches(match)
 
             # Normalize the matches dictionary.
             if matches['change'] is not None:
@@ -287,28 +1024,54 @@ class _Parser(object):
 
             # Standalone (non-interpolation) tags consume the entire line,
             # both leading whitespace and trailing newline.
-            did_tag_begin_line = match_index == 0 or template[match_index - 1] in END_OF_LINE_CHARACTERS
-            did_tag_end_line = end_index == len(template) or template[end_index] in END_OF_LINE_CHARACTERS
+            did_tag_begin_line = (match_index == 0 or
+                                  self._get_char(template, match_index - 1) in END_OF_LINE_CHARACTERS)
+            did_tag_end_line = (end_index == len(template) or
+                                self._get_char(template, end_index) in END_OF_LINE_CHARACTERS)
             is_tag_interpolating = tag_type in ['', '&']
 
-            if did_tag_begin_line and did_tag_end_line and not is_tag_interpolating:
+            # Parent and block tags are also standalone if the other tags on
+            # their line are parent and block tags (e.g. "{{<a}}{{/a}}").
+            types = [state[0] for state in states]
+            if tag_type in ('<', '$') or (tag_type == '/' and types[-1:] in (['<'], ['$'])):
+                if match_index == run_index:
+                    did_tag_begin_line = True
+                if did_tag_begin_line and not did_tag_end_line:
+                    if tag_type == '/':
+                        types.pop()
+                    else:
+                        types.append(tag_type)
+                    did_tag_end_line = self._is_inheritance_line(template, end_index, types)
+                is_standalone = did_tag_begin_line and did_tag_end_line
+                run_index = is_standalone and end_index or None
+            else:
+                is_standalone = did_tag_begin_line and did_tag_end_line and not is_tag_interpolating
+
+            if is_standalone:
                 if end_index < len(template):
-                    end_index += template[end_index] == '\r' and 1 or 0
+                    end_index += self._get_char(template, end_index) == '\r' and 1 or 0
                 if end_index < len(template):
-                    end_index += template[end_index] == '\n' and 1 or 0
+                    end_index += self._get_char(template, end_index) == '\n' and 1 or 0
             elif leading_whitespace:
                 match_index += len(leading_whitespace)
                 leading_whitespace = ''
 
             # Avoid adding spurious empty strings to the parse tree.
             if start_index != match_index:
-                parsed_template.add(template[start_index:match_index])
+                parsed_template.add(self._get_literal(template, start_index, match_index))
 
             start_index = end_index
 
-            if tag_type in ('#', '^'):
+            if tag_type in ('#', '^', '$', '<'):
+                if tag_type in ('$', '<'):
+                    self.has_inheritance = True
+                if tag_type == '$' and not is_standalone:
+                    # Then the content overriding the block is not
+                    # reindented (see _BlockNode.get_override()).
+                    leading_whitespace = None
                 # Cache current state.
-                state = (tag_type, end_index, section_key, parsed_template)
+                state = (tag_type, end_index, section_key, parsed_template,
+                         leading_whitespace)
                 states.append(state)
 
                 # Initialize new state
@@ -322,21 +1085,55 @@ class _Parser(object):
                 # Restore previous state with newly found section data.
                 parsed_section = parsed_template
 
-                (tag_type, section_start_index, section_key, parsed_template) = states.pop()
+                (tag_type, section_start_index, section_key, parsed_template,
+                 leading_whitespace) = states.pop()
                 node = self._make_section_node(template, tag_type, tag_key, parsed_section,
-                                               section_start_index, match_index)
+                                               section_start_index, match_index,
+                                               leading_whitespace, states)
 
             else:
                 node = self._make_interpolation_node(tag_type, tag_key, leading_whitespace)
 
-            parsed_template.add(node)
+            _add_node(parsed_template, node)
 
         # Avoid adding spurious empty strings to the parse tree.
         if start_index != len(template):
-            parsed_template.add(template[start_index:])
+            parsed_template.add(self._get_literal(template, start_index, len(template)))
 
         return parsed_template
 
+    def _is_inheritance_line(self, template, index, types):
+        """
+        Return whether the rest of a line from an index of the template
+        holds only parent and block tags.
+
+        Arguments:
+
+          types: the list of the tag types of the sections open at the
+            index, from the outermost.
+
+        """
+        types = list(types)
+        while index < len(template):
+            if self._get_char(template, index) in END_OF_LINE_CHARACTERS:
+                break
+            match = self._template_re.match(template, index)
+            if match is None:
+                return False
+            matches = self._get_matches(match)
+            tag_type = matches['tag']
+            if matches['whitespace'] or matches['change'] is not None or matches['raw'] is not None:
+                return False
+            if tag_type in ('<', '$'):
+                types.append(tag_type)
+            elif tag_type == '/' and types[-1:] in (['<'], ['$']):
+                types.pop()
+            else:
+                return False
+            index = match.end()
+
+        return True
+
     def _make_interpolation_node(self, tag_type, tag_key, leading_whitespace):
         """
         Create and return a non-section node for the parse tree.
@@ -363,14 +1160,41 @@ class _Parser(object):
         raise Exception("Invalid symbol for interpolation tag: %s" % repr(tag_type))
 
     def _make_section_node(self, template, tag_type, tag_key, parsed_section,
-                           section_start_index, section_end_index):
+                           section_start_index, section_end_index, leading_whitespace,
+                           states):
         """
         Create and return a section node for the parse tree.
 
+        Arguments:
+
+          states: the list of the parse states of the sections enclosing
+            the section, from the outermost.
+
         """
+        is_outermost = '#' not in [state[0] for state in states]
+
+        if tag_type == '$':
+            text = None
+            if states and states[-1][0] == '<':
+                # Then the block overrides a block of the parent template,
+                # and is reindented from its text (see get_override()).
+                text = self._get_section_text(template, section_start_index, section_end_index,
+                                              is_outermost)
+            return _BlockNode(tag_key, parsed_section, leading_whitespace, text,
+                              self._delimiters)
+
+        if tag_type == '<':
+            # Only the blocks inside a parent tag have an effect.
+            overrides = {}
+            for node in parsed_section._parse_tree:
+                if isinstance(node, _BlockNode):
+                    overrides[node.key] = node
+            return _ParentNode(tag_key, overrides, leading_whitespace)
+
         if tag_type == '#':
-            return _SectionNode(tag_key, parsed_section, self._delimiters,
-                               template, section_start_index, section_end_index)
+            text = self._get_section_text(template, section_start_index, section_end_index,
+                                          is_outermost)
+            return _SectionNode(tag_key, parsed_section, self._delimiters, text)
 
         if tag_type == '^':
             return _InvertedNode(tag_key, parsed_section)
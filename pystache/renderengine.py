@@ -8,7 +8,9 @@ Defines a class responsible for rendering logic.
 import re
 
 from pystache.common import is_string
+from pystache.context import _BUILTIN_MODULE
 from pystache.parser import parse
+from pystache.tables import ColumnTable, get_field_names
 
 
 def context_get(stack, name):
@@ -43,7 +45,8 @@ class RenderEngine(object):
     #   that encapsulates the customizable aspects of converting
     #   strings and resolving partials and names from context.
     def __init__(self, literal=None, escape=None, resolve_context=None,
-                 resolve_partial=None, to_str=None):
+                 resolve_partial=None, to_str=None, encoding=None,
+                 literal_bytes=None, escape_bytes=None, fragments=None, buffers=False):
         """
         Arguments:
 
@@ -81,9 +84,36 @@ class RenderEngine(object):
             coercion whenever a string is required (e.g. for converting None
             or 0 to a string).
 
+          encoding: the name of the encoding of byte string renderings
+            (e.g. from ParsedTemplate.iter_render_bytes()).  Only needed
+            for rendering to byte strings.
+
+          literal_bytes: the function used to convert unescaped variable
+            tag values to byte strings in the given encoding.  The function
+            should accept the same strings as the literal function.  Only
+            needed for rendering to byte strings.
+
+          escape_bytes: the function used to escape and convert variable
+            tag values to byte strings in the given encoding.  The function
+            should accept the same strings as the escape function.  Only
+            needed for rendering to byte strings.
+
+          fragments: a fragments.SectionCache instance with which to
+            render the sections it caches, or None.
+
+          buffers: whether byte string renderings can include read-only
+            views of bytes (memoryview instances, or buffer instances in
+            Python 2) in place of byte strings, e.g. for writing to a file.
+            Defaults to False.
+
         """
+        self.buffers = buffers
+        self.encoding = encoding
         self.escape = escape
+        self.escape_bytes = escape_bytes
+        self.fragments = fragments
         self.literal = literal
+        self.literal_bytes = literal_bytes
         self.resolve_context = resolve_context
         self.resolve_partial = resolve_partial
         self.to_str = to_str
@@ -120,6 +150,13 @@ class RenderEngine(object):
         """
         data = self.resolve_context(context, name)
 
+        return self.coerce_section_data(data)
+
+    def coerce_section_data(self, data):
+        """
+        Convert the resolved value of a section to a list.
+
+        """
         # From the spec:
         #
         #   If the data is not of a list type, it is coerced into a list
@@ -127,6 +164,11 @@ class RenderEngine(object):
         #   use a single-element list containing the data, otherwise use
         #   an empty list.
         #
+        if type(data).__module__ != _BUILTIN_MODULE and get_field_names(data):
+            # Then the data is a NumPy structured array, whose truth value
+            # is ambiguous and whose rows do not support name lookup.
+            data = ColumnTable(data)
+
         if not data:
             data = []
         else:
@@ -176,6 +218,8 @@ class RenderEngine(object):
           context_stack: a ContextStack instance.
 
         """
-        parsed_template = parse(template, delimiters)
+        # Partials and the strings that lambdas return are typically
+        # rendered many times, e.g. once per section item.
+        parsed_template = parse(template, delimiters, self.resolve_partial, cache=True)
 
         return parsed_template.render(self, context_stack)
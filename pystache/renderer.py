@@ -5,18 +5,41 @@ This module provides a Renderer class to render templates.
 
 """
 
+import codecs
 import sys
+import threading
 
+from pystache import asyncrender
+from pystache import codegen
 from pystache import defaults
+from pystache import mapped
+from pystache import tracking
+from pystache.columns import ColumnRenderer, iter_rows
 from pystache.common import TemplateNotFoundError, MissingTags, is_string
-from pystache.context import ContextStack, KeyNotFoundError
+from pystache.context import ContextStack, KeyNotFoundError, _Prefetched
+from pystache.fragments import SectionCache
 from pystache.loader import Loader
 from pystache.parsed import ParsedTemplate
+from pystache.parser import parse
 from pystache.renderengine import context_get, RenderEngine
 from pystache.specloader import SpecLoader
 from pystache.template_spec import TemplateSpec
 
 
+# The function whose return values _make_escape() may cache.
+_DEFAULT_TAG_ESCAPE = defaults.TAG_ESCAPE
+
+# The maximum number of escaped strings to cache per render.
+_ESCAPE_CACHE_SIZE = 1000
+
+# The characters that the default escape function replaces, as byte
+# strings.  They are the same bytes in all ASCII-compatible encodings.
+_ESCAPED_CHARS = u'&<>"\''
+_ESCAPED_BYTES = tuple([c.encode('ascii') for c in _ESCAPED_CHARS])
+
+_EMPTY_BYTES = u''.encode('ascii')
+
+
 class Renderer(object):
 
     """
@@ -45,11 +68,18 @@ class Renderer(object):
                 else:
                     return str(val)
 
+    Instances are safe to share across threads.  All per-call state (the
+    context stack and the RenderEngine) is created anew for each call to
+    render(), and the current context exposed by the context property is
+    stored per thread.
+
     """
 
     def __init__(self, file_encoding=None, string_encoding=None,
                  decode_errors=None, search_dirs=None, file_extension=None,
-                 escape=None, partials=None, missing_tags=None):
+                 escape=None, partials=None, missing_tags=None,
+                 prefetch_executor=None, fragment_cache=None, cached_sections=None,
+                 jit_threshold=None):
         """
         Construct an instance.
 
@@ -108,6 +138,33 @@ class Renderer(object):
             the value of the tag is the empty string.  Defaults to the
             package default.
 
+          prefetch_executor: an executor (e.g. a
+            concurrent.futures.ThreadPoolExecutor instance) with which to
+            resolve the names referenced by a template concurrently before
+            rendering.  Rendering then uses the resolved values, so that
+            context methods that block (e.g. on I/O) run in parallel
+            rather than one after another.  Every name the template
+            references outside partials is resolved once, even if it is
+            in a section that turns out not to be rendered.  Defaults to
+            None, for no prefetching.
+
+          fragment_cache: a cache backend (e.g. a fragments.MemoryCache
+            instance) in which to store the renderings of the sections
+            named in cached_sections.  A cached rendering is reused when
+            the section is rendered with the same values for the names
+            it references.  See the fragments module for details.
+            Defaults to None, for no caching.
+
+          cached_sections: the list of the names of the sections whose
+            renderings to cache, e.g. ['nav', 'footer'].
+
+          jit_threshold: the number of times render() renders a template
+            before compiling it to a Python function specialized for the
+            types in its context (see the codegen module), or None not to
+            compile templates.  Template strings are then parsed once and
+            cached.  Templates are not compiled if prefetch_executor or
+            fragment_cache is set.  Defaults to None.
+
         """
         if decode_errors is None:
             decode_errors = defaults.DECODE_ERRORS
@@ -133,16 +190,39 @@ class Renderer(object):
         if isinstance(search_dirs, basestring):
             search_dirs = [search_dirs]
 
-        self._context = None
+        if cached_sections is None:
+            cached_sections = []
+
+        # Holds the context stack of the render in progress, per thread.
+        self._local = threading.local()
         self.decode_errors = decode_errors
+        self.cached_sections = cached_sections
         self.escape = escape
         self.file_encoding = file_encoding
+        self.fragment_cache = fragment_cache
         self.file_extension = file_extension
+        self.jit_threshold = jit_threshold
         self.missing_tags = missing_tags
         self.partials = partials
+        self.prefetch_executor = prefetch_executor
         self.search_dirs = search_dirs
         self.string_encoding = string_encoding
 
+    def __getstate__(self):
+        """
+        Return the state to pickle, e.g. to send an instance to a process.
+
+        """
+        state = self.__dict__.copy()
+        # Thread-local storage cannot be pickled and only describes
+        # renders in progress in this process.
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
     # This is an experimental way of giving views access to the current context.
     # TODO: consider another approach of not giving access via a property,
     #   but instead letting the caller pass the initial context to the
@@ -153,8 +233,11 @@ class Renderer(object):
         """
         Return the current rendering context [experimental].
 
+        The value is the context stack of the render in progress on the
+        calling thread, or None if that thread is not rendering.
+
         """
-        return self._context
+        return getattr(self._local, 'context', None)
 
     # We could not choose str() as the name because 2to3 renames the unicode()
     # method of this class to str().
@@ -192,10 +275,106 @@ class Renderer(object):
         """
         Convert a basestring to unicode (preserving any unicode subclass), and escape it.
 
-        Returns a unicode string (not subclass).
+        Returns a unicode string (not subclass), unless the string has an
+        __html__() method (e.g. a Safe instance).  In that case, the
+        string is already safe, and the return value of __html__() is
+        returned without escaping.
+
+        """
+        # We type-check to avoid redundant conversions in the common case.
+        if type(s) is not unicode:
+            html = getattr(s, '__html__', None)
+            if html is not None:
+                return self._to_unicode_soft(html())
+            s = self._to_unicode_soft(s)
+        s = self.escape(s)
+        if type(s) is unicode:
+            return s
+        return unicode(s)
+
+    def _make_escape(self):
+        """
+        Return the escape function to pass to RenderEngine.__init__().
+
+        """
+        if self.escape is not _DEFAULT_TAG_ESCAPE:
+            return self._escape_to_unicode
+
+        # Since the default escape function is pure, we can cache its
+        # return values for the lifetime of the engine (i.e. a render).
+        # We only cache strings that escaping changed, since returning
+        # other strings as is is already fast.
+        escape_to_unicode = self._escape_to_unicode
+        cache = {}
+
+        def escape(s):
+            if type(s) is not unicode:
+                return escape_to_unicode(s)
+            escaped = cache.get(s)
+            if escaped is not None:
+                return escaped
+            escaped = escape_to_unicode(s)
+            if escaped is not s and len(cache) < _ESCAPE_CACHE_SIZE:
+                cache[s] = escaped
+            return escaped
+
+        return escape
+
+    def _is_string_encoding(self, encoding):
+        """
+        Return whether the given encoding is the same as string_encoding.
+
+        """
+        return codecs.lookup(encoding).name == codecs.lookup(self.string_encoding).name
+
+    def _make_literal_bytes(self, encoding):
+        """
+        Return the literal_bytes function to pass to RenderEngine.__init__().
 
         """
-        return unicode(self.escape(self._to_unicode_soft(s)))
+        to_unicode = self._to_unicode_soft
+
+        def literal_bytes(s):
+            return to_unicode(s).encode(encoding)
+
+        if not self._is_string_encoding(encoding):
+            return literal_bytes
+
+        # Otherwise, byte strings are already in the output encoding.
+        def literal_bytes_passthrough(s):
+            if isinstance(s, unicode):
+                return s.encode(encoding)
+            return s
+
+        return literal_bytes_passthrough
+
+    def _make_escape_bytes(self, escape, encoding):
+        """
+        Return the escape_bytes function to pass to RenderEngine.__init__().
+
+        Arguments:
+
+          escape: the escape function passed to RenderEngine.__init__().
+
+        """
+        def escape_bytes(s):
+            return escape(s).encode(encoding)
+
+        if (self.escape is not _DEFAULT_TAG_ESCAPE or not self._is_string_encoding(encoding) or
+            _ESCAPED_CHARS.encode(encoding) != _EMPTY_BYTES.join(_ESCAPED_BYTES)):
+            return escape_bytes
+
+        # Otherwise, byte strings are already in the output encoding, and
+        # we can check them for the characters to escape without decoding.
+        def escape_bytes_passthrough(s):
+            if isinstance(s, unicode):
+                return escape(s).encode(encoding)
+            for b in _ESCAPED_BYTES:
+                if b in s:
+                    return escape(s).encode(encoding)
+            return s
+
+        return escape_bytes_passthrough
 
     def unicode(self, b, encoding=None):
         """
@@ -303,36 +482,85 @@ class Renderer(object):
 
         return resolve_partial
 
-    def _make_resolve_context(self):
+    def _parse(self, template):
+        """
+        Parse a template string, and return a ParsedTemplate instance.
+
+        The parent templates of the template are loaded as partials.
+
+        """
+        # The parser requires that the template string be unicode.
+        template = self._to_unicode_hard(template)
+
+        # Compiling a template only pays off if its parse tree is reused.
+        cache = self._is_jit_enabled()
+
+        return parse(template, resolve_partial=self._make_resolve_partial(), cache=cache)
+
+    def _make_resolve_context(self, get=context_get):
         """
         Return the resolve_context function to pass to RenderEngine.__init__().
 
+        Arguments:
+
+          get: the function to wrap, with the same signature as context_get().
+            It should raise KeyNotFoundError if the name is not found.
+
         """
         if self._is_missing_tags_strict():
-            return context_get
+            return get
         # Otherwise, ignore missing tags.
 
         def resolve_context(stack, name):
             try:
-                return context_get(stack, name)
+                return get(stack, name)
             except KeyNotFoundError:
                 return u''
 
         return resolve_context
 
-    def _make_render_engine(self):
+    def _make_render_engine(self, encoding=None, buffers=False):
         """
         Return a RenderEngine instance for rendering.
 
+        Arguments:
+
+          encoding: the name of the encoding for rendering to byte strings.
+            Defaults to None, for rendering to unicode only.
+
+          buffers: the buffers argument of RenderEngine.__init__().
+
         """
         resolve_context = self._make_resolve_context()
         resolve_partial = self._make_resolve_partial()
+        escape = self._make_escape()
+
+        # We avoid use of the ternary operator for Python 2.4 support.
+        literal_bytes, escape_bytes = None, None
+        if encoding is not None:
+            # Since pieces of the output are encoded separately, each
+            # piece would get its own byte order mark.
+            if u'a'.encode(encoding) * 2 != u'aa'.encode(encoding):
+                raise Exception("Unsupported encoding for rendering to byte strings "
+                                "(try an encoding without a byte order mark): %s" %
+                                repr(encoding))
+            literal_bytes = self._make_literal_bytes(encoding)
+            escape_bytes = self._make_escape_bytes(escape, encoding)
+
+        fragments = None
+        if self.fragment_cache is not None and self.cached_sections:
+            fragments = SectionCache(self.fragment_cache, self.cached_sections)
 
         engine = RenderEngine(literal=self._to_unicode_hard,
-                              escape=self._escape_to_unicode,
+                              escape=escape,
                               resolve_context=resolve_context,
                               resolve_partial=resolve_partial,
-                              to_str=self.str_coerce)
+                              to_str=self.str_coerce,
+                              encoding=encoding,
+                              literal_bytes=literal_bytes,
+                              escape_bytes=escape_bytes,
+                              fragments=fragments,
+                              buffers=buffers)
         return engine
 
     # TODO: add unit tests for this method.
@@ -344,9 +572,9 @@ class Renderer(object):
         load_template = self._make_load_template()
         return load_template(template_name)
 
-    def _render_object(self, obj, *context, **kwargs):
+    def _load_object_template(self, obj):
         """
-        Render the template associated with the given object.
+        Load and return the template associated with the given object.
 
         """
         loader = self._make_loader()
@@ -362,6 +590,14 @@ class Renderer(object):
         else:
             template = loader.load_object(obj)
 
+        return template
+
+    def _render_object(self, obj, *context, **kwargs):
+        """
+        Render the template associated with the given object.
+
+        """
+        template = self._load_object_template(obj)
         context = [obj] + list(context)
 
         return self._render_string(template, *context, **kwargs)
@@ -389,18 +625,112 @@ class Renderer(object):
 
         return self._render_string(template, *context, **kwargs)
 
+    def map_template(self, template_path):
+        """
+        Memory-map the template file at the given path, and return a
+        ParsedTemplate instance whose literal text refers to the map.
+
+        This is for large templates of mostly literal text.  Rendering the
+        template with render_bytes() copies or writes its literal text
+        from the map without decoding it, when encoding is the renderer's
+        file_encoding.  See the mapped module for more information.
+
+        """
+        return mapped.parse_file(template_path, self.file_encoding, self.decode_errors,
+                                 resolve_partial=self._make_resolve_partial())
+
     def _render_string(self, template, *context, **kwargs):
         """
         Render the given template string using the given context.
 
         """
-        # RenderEngine.render() requires that the template string be unicode.
-        template = self._to_unicode_hard(template)
+        return self._render_parsed(self._parse(template), *context, **kwargs)
+
+    def _is_jit_enabled(self):
+        """
+        Return whether render() compiles templates.
+
+        """
+        return (self.jit_threshold is not None and self.prefetch_executor is None and
+                self.fragment_cache is None)
+
+    def _make_render_parsed(self, parsed_template):
+        """
+        Return a render_func for _render_final() that renders the given
+        ParsedTemplate instance.
+
+        """
+        if self._is_jit_enabled():
+            threshold = self.jit_threshold
+            strict = self._is_missing_tags_strict()
+
+            def render_func(engine, stack):
+                return codegen.render(parsed_template, engine, stack, threshold, strict)
+
+            return render_func
+
+        if self.prefetch_executor is None:
+            return lambda engine, stack: parsed_template.render(engine, stack)
 
-        render_func = lambda engine, stack: engine.render(template, stack)
+        keys = parsed_template.get_keys()
+
+        def render_func(engine, stack):
+            self._prefetch(keys, stack)
+            return parsed_template.render(engine, stack)
+
+        return render_func
+
+    def _render_parsed(self, parsed_template, *context, **kwargs):
+        """
+        Render the given ParsedTemplate instance using the given context.
+
+        """
+        render_func = self._make_render_parsed(parsed_template)
 
         return self._render_final(render_func, *context, **kwargs)
 
+    def _prefetch(self, keys, stack):
+        """
+        Resolve the given names concurrently using prefetch_executor, and
+        push the values found onto the given context stack.
+
+        """
+        names = []
+        for key in keys:
+            name = key.split('.')[0]
+            if name and name not in names:
+                names.append(name)
+
+        local = self._local
+        not_found = object()
+
+        def get(name):
+            # This function runs in an executor thread, so we also make
+            # the context available there (e.g. for views).
+            previous = getattr(local, 'context', None)
+            local.context = stack
+            try:
+                try:
+                    return stack.get(name)
+                except KeyNotFoundError:
+                    return not_found
+            finally:
+                local.context = previous
+
+        submit = self.prefetch_executor.submit
+        futures = [(name, submit(get, name)) for name in names]
+
+        snapshot = _Prefetched()
+        for name, future in futures:
+            value = future.result()
+            if value is not not_found:
+                snapshot[name] = value
+
+        # Since names resolve to the first item found from the top of the
+        # stack, later lookups of the same names find the same values.
+        # The current item ("{{.}}") is still the one below the snapshot.
+        stack.push(snapshot)
+
     # All calls to render() should end here because it prepares the
     # context stack correctly.
     def _render_final(self, render_func, *context, **kwargs):
@@ -412,11 +742,340 @@ class Renderer(object):
 
         """
         stack = ContextStack.create(*context, **kwargs)
-        self._context = stack
+        engine = self._make_render_engine()
+
+        return self._render_with(render_func, engine, stack)
+
+    def _render_with(self, render_func, engine, stack):
+        """
+        Call render_func(engine, stack), exposing stack as the current context.
 
+        """
+        # We restore the previous value rather than clearing it so that
+        # nested calls to render() (e.g. from within a view) work.
+        local = self._local
+        previous = getattr(local, 'context', None)
+        local.context = stack
+        try:
+            return render_func(engine, stack)
+        finally:
+            local.context = previous
+
+    def _iter_final(self, iter_func, *context, **kwargs):
+        """
+        Arguments:
+
+          iter_func: a function that accepts a RenderEngine and ContextStack
+            instance and returns an iterator over the pieces of a template
+            rendering.
+
+        """
+        stack = ContextStack.create(*context, **kwargs)
+        engine = self._make_render_engine()
+
+        return self._iter_with(iter_func, engine, stack)
+
+    def _iter_with(self, iter_func, engine, stack):
+        """
+        Iterate over iter_func(engine, stack), exposing stack as the current
+        context while each piece is rendered.
+
+        """
+        pieces = iter_func(engine, stack)
+
+        local = self._local
+        while True:
+            # The current context is only set while this generator runs,
+            # since the caller can do anything between pieces.
+            previous = getattr(local, 'context', None)
+            local.context = stack
+            try:
+                try:
+                    piece = pieces.next()
+                except StopIteration:
+                    return
+            finally:
+                local.context = previous
+            yield piece
+
+    def _get_parsed(self, template, context):
+        """
+        Return a ParsedTemplate for the given template and its context.
+
+        Returns a pair (parsed_template, context), where context is the
+        given context tuple prefixed with the template if the template is
+        an object (as for render()).
+
+        """
+        if is_string(template):
+            return self._parse(template), context
+        if isinstance(template, ParsedTemplate):
+            return template, context
+        # Otherwise, we assume the template is an object.
+        template_string = self._load_object_template(template)
+        parsed = self._parse(template_string)
+
+        return parsed, (template, ) + tuple(context)
+
+    def render_iter(self, template, *context, **kwargs):
+        """
+        Render the given template, and return an iterator over the output.
+
+        The iterator yields unicode strings that join to the return value
+        of render().  Rendering happens as the iterator is consumed, with
+        each top-level tag and each section item yielded as soon as it is
+        rendered.  This is useful for streaming large pages.
+
+        See the render() docstring for a description of the arguments.
+
+        """
+        parsed, context = self._get_parsed(template, context)
+        iter_func = lambda engine, stack: parsed.iter_render(engine, stack)
+
+        return self._iter_final(iter_func, *context, **kwargs)
+
+    def render_many(self, template, contexts):
+        """
+        Render the given template once for each item of contexts.
+
+        Returns an iterator over the renderings, in order.  This method
+        is equivalent to, but faster than, calling render() in a loop.
+        Converting and parsing the template and setting up the rendering
+        process are done only once, and the iterator renders each item
+        as it is consumed.
+
+        Arguments:
+
+          template: a template, as for render().
+
+          contexts: an iterable of dictionaries, ContextStack instances,
+            or objects, each of which is used as the context for one
+            rendering.  None items are treated as an empty context.
+
+        """
+        parsed, prefix = self._get_parsed(template, ())
+        render_func = self._make_render_parsed(parsed)
+        engine = self._make_render_engine()
+
+        return self._render_many(render_func, engine, prefix, contexts)
+
+    def _render_many(self, render_func, engine, prefix, contexts):
+        create_stack = ContextStack.create
+        render_with = self._render_with
+
+        for context in contexts:
+            stack = create_stack(*(prefix + (context, )))
+            yield render_with(render_func, engine, stack)
+
+    def render_columns(self, template, columns, *context, **kwargs):
+        """
+        Render the given template once for each row of columnar data.
+
+        Returns the list of the renderings, in row order.  This method is
+        equivalent to calling render() with a dictionary for each row on
+        top of the context, but it does not create those dictionaries.
+        For a template of only variable tags, each tag is resolved once
+        per column rather than once per row, and the strings of a column
+        are escaped together (see the columns module).  Other templates,
+        and templates whose tags render lambdas, are rendered row by row.
+
+        Arguments:
+
+          template: a template, as for render().
+
+          columns: a dictionary mapping names to sequences of equal
+            length (e.g. lists, array.array instances, or NumPy arrays).
+            The items at the same index of each sequence form a row.
+
+          *context, **kwargs: the context below the rows, as for render().
+
+        """
+        parsed, prefix = self._get_parsed(template, context)
+        stack = ContextStack.create(*prefix, **kwargs)
+        engine = self._make_render_engine()
+
+        bulk_escape = None
+        if self.escape is _DEFAULT_TAG_ESCAPE:
+            bulk_escape = self.escape
+        column_renderer = ColumnRenderer(engine, self._to_unicode_soft, bulk_escape)
+
+        renderings = column_renderer.render(parsed, stack, columns)
+        if renderings is not None:
+            return renderings
+
+        render_func = self._make_render_parsed(parsed)
+        renderings = []
+        for row in iter_rows(columns):
+            stack.push(row)
+            try:
+                renderings.append(self._render_with(render_func, engine, stack))
+            finally:
+                stack.pop()
+        return renderings
+
+    def render_bytes(self, template, context=None, encoding='utf-8', chunks=False,
+                     file=None):
+        """
+        Render the given template directly to a byte string.
+
+        This is equivalent to, but uses less memory than, encoding the
+        return value of render().  The template's literal text is encoded
+        once per parsed template (so that passing the same ParsedTemplate
+        instance again reuses the encoded text), and only the tag values
+        are encoded on each render.  Byte string tag values are passed
+        through without decoding if encoding is the same as the
+        string_encoding attribute.
+
+        Arguments:
+
+          template: a template, as for render().
+
+          context: a dictionary, ContextStack instance, or object with
+            which to populate the initial context stack.  Defaults to None,
+            for an empty context.
+
+          encoding: the name of the output encoding.  Defaults to UTF-8.
+            Since pieces of the output are encoded separately, encodings
+            that add a byte order mark (e.g. "utf-16" as opposed to
+            "utf-16-le") are not supported.
+
+          chunks: whether to return the output as a list of byte strings
+            rather than as a single byte string, e.g. for passing to a
+            WSGI server without joining the pieces.
+
+          file: a binary file-like object to write the output to, piece by
+            piece, instead of returning it.  The literal text of a template
+            from map_template() is written straight from the map.
+
+        """
+        parsed, prefix = self._get_parsed(template, ())
+        stack = ContextStack.create(*(prefix + (context, )))
+        engine = self._make_render_engine(encoding, buffers=file is not None)
+
+        def render_func(engine, stack):
+            if self.prefetch_executor is not None:
+                self._prefetch(parsed.get_keys(), stack)
+            if file is not None:
+                write = file.write
+                for piece in parsed.iter_render_bytes(engine, stack):
+                    write(piece)
+                return None
+            return list(parsed.iter_render_bytes(engine, stack))
+
+        pieces = self._render_with(render_func, engine, stack)
+
+        if file is not None:
+            return None
+        if chunks:
+            return pieces
+        return _EMPTY_BYTES.join(pieces)
+
+    def render_tracked(self, template, *context, **kwargs):
+        """
+        Render the given template, recording what the rendering used.
+
+        Returns a tracking.RenderResult instance, whose output attribute
+        is the return value of render(), and whose fingerprint attribute
+        is a stable digest of the template, the partials loaded, and the
+        context values resolved.  Renders with equal fingerprints have
+        equal output, so the fingerprint can serve as an ETag.
+
+        The fingerprint summarizes lists, dictionaries, and other objects
+        by their type and size, since the values resolved inside them are
+        recorded separately, and covers the strings that objects
+        interpolated as is (e.g. "{{items}}") render as.  It does not cover
+        the strings that lambdas return (other than through the names
+        their templates reference).  Fragment caching is not used.
+
+        See the render() docstring for a description of the arguments.
+
+        """
+        parsed, prefix = self._get_parsed(template, ())
+
+        return self._render_tracked(parsed, prefix, context, kwargs, None)
+
+    def rerender(self, previous, *context, **kwargs):
+        """
+        Render a template again with a new context, reusing what it can.
+
+        Returns a tracking.RenderResult instance, as for render_tracked().
+        The output of each top-level tag (e.g. a section) whose values are
+        the same as in the previous rendering is reused instead of being
+        rendered again.  The changed attribute of the result lists the
+        (start, end) ranges of the output that changed, e.g. for sending
+        updates to a live page.
+
+        To tell which values are the same, the values of the names that a
+        top-level tag references are compared by digest, so a tag whose
+        values are not plain data (e.g. objects or lambdas) is always
+        rendered again.
+
+        Arguments:
+
+          previous: the RenderResult of a previous call to render_tracked()
+            or rerender().
+
+        See the render() docstring for a description of the other arguments.
+
+        """
+        return self._render_tracked(previous.parsed, previous.prefix, context, kwargs,
+                                    previous)
+
+    def _render_tracked(self, parsed, prefix, context, kwargs, previous):
+        stack = ContextStack.create(*(prefix + tuple(context)), **kwargs)
         engine = self._make_render_engine()
+        tracker = tracking.Tracker(engine)
+
+        def render_func(engine, stack):
+            if self.prefetch_executor is not None:
+                self._prefetch(parsed.get_keys(), stack)
+            return tracker.render(engine, stack, parsed, prefix, previous)
+
+        return self._render_with(render_func, engine, stack)
+
+    def render_async(self, template, *context, **kwargs):
+        """
+        Render the given template, and return an asyncio awaitable.
+
+        Context values may be awaitables (e.g. coroutines or futures).
+        They are awaited when the rendering process first needs them, and
+        their results are used in their place.  Awaitables that are items
+        of a section list, or values in context dictionaries that the
+        template references, are awaited concurrently.
+
+        The template is rendered on the event loop's default executor, so
+        that synchronous context code (e.g. view methods) does not block
+        the event loop.  Requires Python 3.4 or later.
+
+        Example (inside a coroutine):
+
+            html = await renderer.render_async(template, {'user': get_user()})
+
+        See the render() docstring for a description of the arguments.
+
+        """
+        parsed, context = self._get_parsed(template, context)
+
+        return asyncrender.render_async(self, parsed, context, kwargs)
+
+    def render_async_iter(self, template, *context, **kwargs):
+        """
+        Render the given template, and return an asyncio async iterator.
+
+        This is the streaming variant of render_async().  The iterator
+        yields the same unicode pieces as render_iter().  For example--
+
+            async for piece in renderer.render_async_iter(template, context):
+                await response.write(piece)
+
+        The rendering runs only a bounded number of pieces ahead of the
+        consumer.  To stop it before the end, await the iterator's
+        aclose() method.
+
+        """
+        parsed, context = self._get_parsed(template, context)
 
-        return render_func(engine, stack)
+        return asyncrender.render_async_iter(self, parsed, context, kwargs)
 
     def render(self, template, *context, **kwargs):
         """
@@ -453,8 +1112,7 @@ class Renderer(object):
         if is_string(template):
             return self._render_string(template, *context, **kwargs)
         if isinstance(template, ParsedTemplate):
-            render_func = lambda engine, stack: template.render(engine, stack)
-            return self._render_final(render_func, *context, **kwargs)
+            return self._render_parsed(template, *context, **kwargs)
         # Otherwise, we assume the template is an object.
 
         return self._render_object(template, *context, **kwargs)
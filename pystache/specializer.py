@@ -0,0 +1,222 @@
+# coding: utf-8
+
+"""
+Exposes a specialize() function to partially evaluate a template.
+
+"""
+
+import re
+
+from pystache.common import is_string
+from pystache.context import ContextStack, RowCursor, _BUILTIN_MODULE
+from pystache.parsed import ParsedTemplate
+from pystache.parser import (parse, NON_BLANK_RE, _add_node, _ChangeNode, _CommentNode,
+                             _ConditionalNode, _EscapeNode, _InvertedNode, _LiteralNode,
+                             _PartialNode, _SectionNode)
+from pystache.renderer import Renderer
+
+
+# Marks a context stack frame pushed by a section over per-request data.
+_DYNAMIC = object()
+
+
+def _has_name(frame, name):
+    """
+    Return whether a context stack item has the given name, without
+    calling the name's value if it is a method.
+
+    """
+    if isinstance(frame, dict):
+        return name in frame
+    if isinstance(frame, RowCursor):
+        return frame.lookup(name, _DYNAMIC) is not _DYNAMIC
+    # See context._get_value() for why we exclude built-in types.
+    if type(frame).__module__ == _BUILTIN_MODULE:
+        return False
+    return hasattr(frame, name)
+
+
+class _Specializer(object):
+
+    def __init__(self, renderer):
+        self.engine = renderer._make_render_engine()
+        # The names of the partials being inlined, to stop recursion.
+        self._partials = []
+
+    def _find_frame(self, frames, name):
+        """
+        Return the static frame in which to look up a name, or None if the
+        name is per-request.
+
+        """
+        if name == '.':
+            if not frames or frames[-1] is _DYNAMIC:
+                return None
+            return frames[-1]
+
+        first = name.split('.')[0]
+        for frame in reversed(frames):
+            # Per-request data is assumed not to define static names, so
+            # we look past sections over per-request data.
+            if frame is not _DYNAMIC and _has_name(frame, first):
+                return frame
+
+        return None
+
+    def specialize(self, parsed, frames):
+        """
+        Return the residual ParsedTemplate of a ParsedTemplate.
+
+        Arguments:
+
+          frames: the list of context stack items known when rendering
+            the template, from the bottom of the stack, with _DYNAMIC
+            standing for per-request items.
+
+        """
+        residual = ParsedTemplate()
+        tree = residual._parse_tree
+        for node in parsed._parse_tree:
+            for part in self._specialize_node(node, frames):
+                # Merge adjacent literals.
+                if type(part) is unicode and tree and type(tree[-1]) is unicode:
+                    tree[-1] += part
+                else:
+                    # This fuses sections that end up adjacent.
+                    _add_node(residual, part)
+        return residual
+
+    def _specialize_node(self, node, frames):
+        """
+        Return the list of literals and nodes that replace a node.
+
+        """
+        if type(node) is unicode:
+            return [node]
+        if isinstance(node, (_CommentNode, _ChangeNode)):
+            return []
+        if isinstance(node, (_EscapeNode, _LiteralNode)):
+            return self._specialize_variable(node, frames)
+        if isinstance(node, _SectionNode):
+            return self._specialize_section(node, frames)
+        if isinstance(node, _InvertedNode):
+            return self._specialize_inverted(node, frames)
+        if isinstance(node, _ConditionalNode):
+            return (self._specialize_section(node.section, frames) +
+                    self._specialize_inverted(node.inverted, frames))
+        if isinstance(node, _PartialNode):
+            return self._specialize_partial(node, frames)
+
+        return [node]
+
+    def _specialize_variable(self, node, frames):
+        frame = self._find_frame(frames, node.key)
+        if frame is None:
+            return [node]
+
+        val = self.engine.resolve_context(ContextStack(frame), node.key)
+        if callable(val):
+            # The lambda's template could reference per-request names.
+            return [node]
+
+        return [node.render_value(self.engine, val)]
+
+    def _specialize_section(self, node, frames):
+        frame = self._find_frame(frames, node.key)
+        if frame is None:
+            parsed = self.specialize(node.parsed, frames + [_DYNAMIC])
+            return [_SectionNode(node.key, parsed, node.delimiters, node.text)]
+
+        values = self.engine.fetch_section_data(ContextStack(frame), node.key)
+        for val in values:
+            if callable(val):
+                # Lambdas receive the unprocessed section text.
+                return [node]
+
+        parts = []
+        for val in values:
+            parts.extend(self.specialize(node.parsed, frames + [val])._parse_tree)
+        return parts
+
+    def _specialize_inverted(self, node, frames):
+        frame = self._find_frame(frames, node.key)
+        if frame is None:
+            parsed = self.specialize(node.parsed_section, frames)
+            return [_InvertedNode(node.key, parsed)]
+
+        if self.engine.fetch_section_data(ContextStack(frame), node.key):
+            return []
+        return self.specialize(node.parsed_section, frames)._parse_tree
+
+    def _specialize_partial(self, node, frames):
+        if node.key in self._partials:
+            # Then the partial is recursive.
+            return [node]
+
+        template = self.engine.resolve_partial(node.key)
+        # Indent before parsing, as in _PartialNode.render().
+        template = re.sub(NON_BLANK_RE, node.indent + ur'\1', template)
+
+        self._partials.append(node.key)
+        try:
+            parsed = parse(template, resolve_partial=self.engine.resolve_partial)
+            return self.specialize(parsed, frames)._parse_tree
+        finally:
+            self._partials.pop()
+
+
+def specialize(template, static_context, renderer=None):
+    """
+    Evaluate the parts of a template that depend only on static data.
+
+    Returns a residual ParsedTemplate in which every tag and section that
+    depends only on names in static_context has been replaced by its
+    rendering.  The remaining tags are left for rendering with the
+    per-request context.  This moves work that is the same for every
+    request (e.g. site names, asset URLs, and feature flags) from render
+    time to load time:
+
+    >>> from pystache import Renderer
+    >>> parsed = specialize(u'{{site}}: {{#beta}}[beta] {{/beta}}{{user}}',
+    ...                     {'site': 'Example', 'beta': True})
+    >>> print ', '.join(parsed.get_keys())
+    user
+    >>> print Renderer().render(parsed, {'user': 'Al'})
+    Example: [beta] Al
+
+    Partials are inlined, and sections over static data are unrolled.
+    Names in static_context are assumed not to be defined by the
+    per-request context, including by the items of sections over
+    per-request data.
+
+    A few tags that use static names cannot be evaluated in advance, for
+    example a tag whose value is a lambda (whose template could reference
+    per-request names), or a recursive partial.  These are left as tags,
+    so to be safe, render the residual template with static_context below
+    the per-request context.
+
+    Arguments:
+
+      template: a ParsedTemplate instance or a template string.
+
+      static_context: a dictionary, object, or ContextStack instance of
+        the static data.
+
+      renderer: the Renderer instance whose escape function, partials,
+        and other configuration to use.  The residual template should be
+        rendered with a renderer configured alike.  Defaults to a
+        default Renderer.
+
+    """
+    if renderer is None:
+        renderer = Renderer()
+
+    if is_string(template):
+        template = renderer._parse(template)
+
+    # The per-request context is pushed above the static context, so the
+    # top of the stack (e.g. "{{.}}") is only static in sections over
+    # static data.
+    frames = list(ContextStack.create(static_context)._stack) + [_DYNAMIC]
+
+    return _Specializer(renderer).specialize(template, frames)
@@ -0,0 +1,216 @@
+# coding: utf-8
+
+"""
+Provides tables, which sections iterate over through row cursors.
+
+A section over a list of dictionaries pushes each dictionary onto the
+context stack.  Data that arrives as columns (e.g. a dictionary of lists
+or arrays, or a NumPy structured array) or as a 2-D array would have to
+be converted to such a list first.  Wrapping the data in a table instead
+lets a section iterate over it directly: the table yields one row cursor
+(see context.RowCursor), which it moves from row to row, and names are
+looked up in the cursor's current row.  For example--
+
+    renderer.render(template, {'people': ColumnTable({'name': names,
+                                                      'age': ages})})
+
+A NumPy structured array (an array whose dtype has field names) is
+wrapped in a ColumnTable automatically when it is the value of a section.
+
+Since a table yields the same cursor for each row, the rows should not
+be collected, e.g. by a lambda.
+
+"""
+
+from pystache.common import PystacheError
+from pystache.context import RowCursor
+
+
+def _to_list(column):
+    # Both array.array and NumPy arrays have a tolist() method, which
+    # converts their items to Python objects much faster than indexing.
+    tolist = getattr(column, 'tolist', None)
+    if tolist is not None:
+        return tolist()
+    return list(column)
+
+
+def get_field_names(value):
+    """
+    Return the field names of a NumPy structured array, or None if the
+    value is not a structured array.
+
+    """
+    return getattr(getattr(value, 'dtype', None), 'names', None)
+
+
+class Table(object):
+
+    """
+    The base class of tables.
+
+    A table is iterated over by section rendering, and has a fixed list of
+    names, which lets sections look up names that the table does not
+    define only once (see parser._SectionNode._hoist()).
+
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self._name_set = set(self.names)
+
+    def has_name(self, name):
+        """
+        Return whether the rows of the table define a name.
+
+        """
+        return name in self._name_set
+
+
+class _ColumnCursor(RowCursor):
+
+    __slots__ = ('_table', '_lists', 'index')
+
+    def __init__(self, table):
+        self._table = table
+        self._lists = table._lists
+        self.index = 0
+
+    def __repr__(self):
+        return "<ColumnTable row %d>" % self.index
+
+    def lookup(self, key, default):
+        column = self._lists.get(key)
+        if column is None:
+            column = self._table._get_column(key)
+            if column is None:
+                return default
+        return column[self.index]
+
+
+class ColumnTable(Table):
+
+    """
+    A table of named columns of equal length.
+
+    Each column is converted to a list when a template first references
+    it, so that columns a template does not use are not converted.
+
+    """
+
+    def __init__(self, columns, names=None):
+        """
+        Arguments:
+
+          columns: a dictionary mapping names to sequences (e.g. lists,
+            array.array instances, or NumPy arrays), or another object
+            whose items are columns, e.g. a NumPy structured array.
+
+          names: the names of the columns.  Defaults to the field names
+            of a structured array, or the keys of a dictionary.
+
+        """
+        if names is None:
+            names = get_field_names(columns)
+            if names is None:
+                names = columns.keys()
+
+        length = None
+        for name in names:
+            column_length = len(columns[name])
+            if length is None:
+                length = column_length
+            elif column_length != length:
+                raise PystacheError("Column %s has %d items instead of %d." %
+                                    (repr(name), column_length, length))
+        if length is None:
+            length = 0
+
+        Table.__init__(self, names)
+        self._columns = columns
+        self._length = length
+        # Maps the name of each column converted so far to its list.
+        self._lists = {}
+
+    def __repr__(self):
+        return "%s(names=%s, rows=%d)" % (self.__class__.__name__, repr(self.names),
+                                          self._length)
+
+    def __len__(self):
+        return self._length
+
+    def _get_column(self, name):
+        """
+        Return a column as a list, or None if there is no such column.
+
+        """
+        column = self._lists.get(name)
+        if column is None:
+            if name not in self._name_set:
+                return None
+            column = _to_list(self._columns[name])
+            self._lists[name] = column
+        return column
+
+    def __iter__(self):
+        cursor = _ColumnCursor(self)
+        for index in xrange(self._length):
+            cursor.index = index
+            yield cursor
+
+
+class _RowCursor(RowCursor):
+
+    __slots__ = ('_indices', 'row')
+
+    def __init__(self, indices):
+        self._indices = indices
+        self.row = None
+
+    def __repr__(self):
+        return "<RowTable row %s>" % repr(self.row)
+
+    def lookup(self, key, default):
+        index = self._indices.get(key)
+        if index is None:
+            return default
+        return self.row[index]
+
+
+class RowTable(Table):
+
+    """
+    A table of rows whose items are named by position, e.g. a list of
+    tuples, the rows of a CSV file, or a 2-D NumPy array.
+
+    """
+
+    def __init__(self, rows, names):
+        """
+        Arguments:
+
+          rows: a sequence of rows, each a sequence with an item for each
+            name.
+
+          names: the names of the items of a row, in order.
+
+        """
+        Table.__init__(self, names)
+        self._rows = rows
+        # Maps each name to its index in a row.
+        self._indices = {}
+        for index, name in enumerate(self.names):
+            self._indices[name] = index
+
+    def __repr__(self):
+        return "%s(names=%s, rows=%d)" % (self.__class__.__name__, repr(self.names),
+                                          len(self._rows))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __iter__(self):
+        cursor = _RowCursor(self._indices)
+        for row in self._rows:
+            cursor.row = row
+            yield cursor
@@ -6,11 +6,20 @@ A rudimentary backward- and forward-compatible script to benchmark pystache.
 
 Usage:
 
-tests/benchmark.py 10000
+tests/benchmark.py 10000 [THREADS]
+
+If THREADS is given, the script also times rendering the examples with
+a single shared Renderer instance from 1 up to THREADS threads.
+
+The script also times rendering a list of 10,000 comments whose template
+references names outside the list, and reports the memory that a large
+set of parsed templates takes up, as when an application caches its
+templates, with and without nested sections.
 
 """
 
 import sys
+import threading
 from timeit import Timer
 
 import pystache
@@ -72,9 +81,165 @@ def make_test_function(example):
     return test
 
 
+def make_threaded_test_function(example, thread_count, count):
+    """
+    Return a function that renders the example count times in total,
+    split across thread_count threads sharing one Renderer.
+
+    """
+    template, context, expected = example
+    renderer = pystache.Renderer()
+
+    def run():
+        for i in xrange(count // thread_count):
+            actual = renderer.render(template, context)
+            if actual != expected:
+                raise Exception("Benchmark mismatch: \n%s\n*** != ***\n%s" % (expected, actual))
+
+    def test():
+        threads = [threading.Thread(target=run) for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return test
+
+
+def make_batch_test_functions(example, count):
+    """
+    Return a pair of functions that render the example count times:
+    one calling render() in a loop, and one calling render_many().
+
+    """
+    template, context, expected = example
+    renderer = pystache.Renderer()
+    contexts = [context] * count
+
+    def check(results):
+        for actual in results:
+            if actual != expected:
+                raise Exception("Benchmark mismatch: \n%s\n*** != ***\n%s" % (expected, actual))
+
+    def test_loop():
+        check([renderer.render(template, context) for context in contexts])
+
+    def test_many():
+        check(renderer.render_many(template, contexts))
+
+    return test_loop, test_many
+
+
+def make_columns_test_functions(count=100000):
+    """
+    Return a pair of functions that render a template once per row of
+    columnar data: one calling render_many() with a dictionary per row,
+    and one calling render_columns().
+
+    """
+    template = pystache.parse(u"Hi {{name}}, order #{{id}} ships {{day}} from {{site}}.")
+    columns = {'name': ["User %d" % n for n in range(count)], 'id': range(count),
+               'day': ["Mon"] * count}
+    context = {'site': "Shop"}
+    renderer = pystache.Renderer()
+
+    def test_many():
+        rows = []
+        for n in range(count):
+            rows.append({'name': columns['name'][n], 'id': columns['id'][n],
+                         'day': columns['day'][n], 'site': context['site']})
+        list(renderer.render_many(template, rows))
+
+    def test_columns():
+        renderer.render_columns(template, columns, context)
+
+    return test_many, test_columns
+
+
+def make_large_comments_test_function(count=10000, jit_threshold=None):
+    """
+    Return a function that renders a list of count comments, each of
+    which references names defined outside the list.
+
+    """
+    template = u"""\
+<div class="comments">
+<h3>{{header}}</h3>
+<ul>
+{{#comments}}<li class="comment">
+<h5><a href="{{post.url}}#{{id}}">{{name}}</a> on {{site}}</h5><p>{{body}}</p>
+</li>{{/comments}}
+</ul>
+</div>"""
+    comments = [{'id': n, 'name': "Joe", 'body': "Thanks for this post!"}
+                for n in range(count)]
+    context = {'header': "My Post Comments", 'site': "Example",
+               'post': {'url': "/posts/1"}, 'comments': comments}
+    renderer = pystache.Renderer(jit_threshold=jit_threshold)
+    parsed = pystache.parse(template)
+
+    def test():
+        renderer.render(parsed, context)
+
+    return test
+
+
+def get_size(obj, seen):
+    """
+    Return the approximate number of bytes taken up by an object and the
+    objects it references, counting objects in the set seen only once.
+
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += get_size(key, seen) + get_size(value, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += get_size(item, seen)
+    elif not isinstance(obj, (basestring, int, long, float)):
+        attrs = getattr(obj, '__dict__', None)
+        if attrs is not None:
+            size += get_size(attrs, seen)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(obj, name):
+                    size += get_size(getattr(obj, name), seen)
+    return size
+
+
+def measure_parsed_size(template_count=200, section_count=50, depth=0):
+    """
+    Return the number of bytes taken up by a set of parsed templates.
+
+    Arguments:
+
+      depth: the number of sections to nest the body of each template in.
+
+    """
+    section = u'<li>{{#items}}<a href="{{url}}">{{title}}</a>{{#sub}}<b>{{name}}</b>{{/sub}}{{/items}}</li>\n'
+    parsed = []
+    for n in range(template_count):
+        parts = [u'<p>Paragraph %d of template %d.</p>\n' % (i, n) + section
+                 for i in range(section_count)]
+        template = u''.join(parts)
+        for level in range(depth):
+            template = u'{{#level%d}}%s{{/level%d}}' % (level, template, level)
+        parsed.append(pystache.parse(template))
+
+    seen = set()
+    return sum([get_size(template, seen) for template in parsed])
+
+
 def main(sys_argv):
     args = sys_argv[1:]
     count = int(args[0])
+    max_threads = 0
+    if len(args) > 1:
+        max_threads = int(args[1])
 
     print "Benchmarking: %sx" % count
     print
@@ -86,6 +251,51 @@ def main(sys_argv):
         t = Timer(test,)
         print min(t.repeat(repeat=3, number=count))
 
+    print
+    print "Batch: render() loop vs. render_many()"
+
+    for example in examples:
+        test_loop, test_many = make_batch_test_functions(example, count)
+
+        loop_time = min(Timer(test_loop).repeat(repeat=3, number=1))
+        many_time = min(Timer(test_many).repeat(repeat=3, number=1))
+        print "%s %s" % (loop_time, many_time)
+
+    for thread_count in range(1, max_threads + 1):
+        print
+        print "Threads: %s (shared Renderer)" % thread_count
+
+        for example in examples:
+            test = make_threaded_test_function(example, thread_count, count)
+
+            t = Timer(test,)
+            print min(t.repeat(repeat=3, number=1))
+
+    print
+    print "Columns: 100000 rows, render_many() vs. render_columns()"
+    test_many, test_columns = make_columns_test_functions()
+    many_time = min(Timer(test_many).repeat(repeat=3, number=1))
+    columns_time = min(Timer(test_columns).repeat(repeat=3, number=1))
+    print "%s %s" % (many_time, columns_time)
+
+    print
+    print "Comments: 10000 items"
+    test = make_large_comments_test_function()
+    print min(Timer(test).repeat(repeat=3, number=1))
+
+    print
+    print "Comments: 10000 items (compiled)"
+    test = make_large_comments_test_function(jit_threshold=0)
+    print min(Timer(test).repeat(repeat=3, number=1))
+
+    if hasattr(sys, 'getsizeof'):
+        # The sys.getsizeof() function is new in Python 2.6.
+        print
+        print "Memory: 200 parsed templates of 50 sections"
+        print "%d bytes" % measure_parsed_size()
+        print "Memory: the same, nested in 3 sections"
+        print "%d bytes" % measure_parsed_size(depth=3)
+
     print "Done"
 
 
@@ -23,7 +23,8 @@ class InitTests(unittest.TestCase):
 
         """
         actual = set(GLOBALS_PYSTACHE_IMPORTED) - set(GLOBALS_INITIAL)
-        expected = set(['parse', 'render', 'Renderer', 'TemplateSpec', 'GLOBALS_INITIAL'])
+        expected = set(['compile', 'parse', 'render', 'Renderer', 'Safe', 'SectionLambda',
+                        'specialize', 'TemplateSpec', 'GLOBALS_INITIAL'])
 
         self.assertEqual(actual, expected)
 
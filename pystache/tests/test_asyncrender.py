@@ -0,0 +1,185 @@
+# coding: utf-8
+
+"""
+Unit tests of asyncrender.py.
+
+"""
+
+import time
+import unittest
+
+from pystache.asyncrender import asyncio
+from pystache.common import PystacheError
+from pystache.context import KeyNotFoundError
+from pystache.renderer import Renderer
+
+
+class AsyncTestCase(unittest.TestCase):
+
+    """
+    A test case base class that skips its tests if asyncio is not available.
+
+    """
+
+    def run(self, result=None):
+        if asyncio is None:
+            return
+        return super(AsyncTestCase, self).run(result)
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def _sleep(self, delay, result):
+        """Return a coroutine that returns the given result after a delay."""
+        return asyncio.sleep(delay, result)
+
+    def _render(self, *args, **kwargs):
+        renderer = kwargs.pop('renderer', Renderer())
+        future = renderer.render_async(*args, **kwargs)
+        return self.loop.run_until_complete(future)
+
+    def _render_iter(self, *args, **kwargs):
+        iterator = Renderer().render_async_iter(*args, **kwargs).__aiter__()
+        pieces = []
+        while True:
+            try:
+                piece = self.loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                break
+            pieces.append(piece)
+        return pieces
+
+
+class RenderAsyncTests(AsyncTestCase):
+
+    """Tests Renderer.render_async()."""
+
+    def test_plain_values(self):
+        actual = self._render('Hi {{name}}!', {'name': 'Bob'})
+        self.assertEqual(actual, 'Hi Bob!')
+
+    def test_awaitable_value(self):
+        actual = self._render('Hi {{name}}!', {'name': self._sleep(0, 'Bob')})
+        self.assertEqual(actual, 'Hi Bob!')
+
+    def test_awaitable_value__referenced_twice(self):
+        """
+        Test that a coroutine referenced twice is awaited only once.
+
+        """
+        actual = self._render('{{name}} {{name}}', {'name': self._sleep(0, 'Bob')})
+        self.assertEqual(actual, 'Bob Bob')
+
+    def test_awaitable_value__dotted_name(self):
+        context = {'person': self._sleep(0, {'name': self._sleep(0, 'Bob')})}
+        actual = self._render('Hi {{person.name}}!', context)
+        self.assertEqual(actual, 'Hi Bob!')
+
+    def test_awaitable_value__section(self):
+        context = {'people': self._sleep(0, [{'name': 'Al'}, self._sleep(0, {'name': 'Bo'})])}
+        actual = self._render('{{#people}}{{name}},{{/people}}', context)
+        self.assertEqual(actual, 'Al,Bo,')
+
+    def test_awaitable_value__inverted_section(self):
+        actual = self._render('{{^empty}}none{{/empty}}', {'empty': self._sleep(0, [])})
+        self.assertEqual(actual, 'none')
+
+    def test_awaitable_value__object_method(self):
+        sleep = self._sleep
+
+        class View(object):
+            def name(self):
+                return sleep(0, 'Bob')
+
+        actual = self._render('{{name}} {{name}}', View())
+        self.assertEqual(actual, 'Bob Bob')
+
+    def test_awaitable_value__missing_tags_strict(self):
+        renderer = Renderer(missing_tags='strict')
+        context = {'person': self._sleep(0, {})}
+        self.assertRaises(KeyNotFoundError, self._render, '{{person.name}}', context,
+                          renderer=renderer)
+
+    def test_awaitable_value__exception(self):
+        future = self.loop.create_future()
+        future.set_exception(ValueError('foo'))
+        self.assertRaises(ValueError, self._render, '{{name}}', {'name': future})
+
+    def test_concurrent__section_items(self):
+        """
+        Test that the awaitable items of a section list are awaited together.
+
+        """
+        items = [self._sleep(0.1, {'n': n}) for n in range(5)]
+        start = time.time()
+        actual = self._render('{{#items}}{{n}}{{/items}}', {'items': items})
+        elapsed = time.time() - start
+
+        self.assertEqual(actual, '01234')
+        self.assertTrue(elapsed < 0.3, elapsed)
+
+    def test_concurrent__same_context(self):
+        """
+        Test that referenced awaitables in a context dict are awaited together.
+
+        """
+        context = {'a': self._sleep(0.1, 'x'), 'b': self._sleep(0.1, 'y'),
+                   'c': self._sleep(0.1, 'z')}
+        start = time.time()
+        actual = self._render('{{a}}{{#b}}{{c}}{{/b}}', context)
+        elapsed = time.time() - start
+
+        self.assertEqual(actual, 'xz')
+        self.assertTrue(elapsed < 0.2, elapsed)
+
+    def test_render_async_iter(self):
+        context = {'people': self._sleep(0, [{'name': 'Al'}, {'name': 'Bo'}])}
+        pieces = self._render_iter('Hi {{#people}}{{name}} {{/people}}!', context)
+        self.assertEqual(pieces, ['Hi ', 'Al ', 'Bo ', '!'])
+
+    def test_render_async_iter__exception(self):
+        future = self.loop.create_future()
+        future.set_exception(ValueError('foo'))
+        self.assertRaises(ValueError, self._render_iter, 'a{{name}}', {'name': future})
+
+    def _iter_items(self, produced, count):
+        for i in range(count):
+            produced.append(i)
+            yield {'i': i}
+
+    def test_render_async_iter__backpressure(self):
+        """
+        Test that rendering waits for the consumer, and stops on aclose().
+
+        """
+        produced = []
+        context = {'items': self._iter_items(produced, 10000)}
+        iterator = Renderer().render_async_iter('{{#items}}{{i}}{{/items}}', context)
+
+        piece = self.loop.run_until_complete(iterator.__anext__())
+        self.assertEqual(piece, '0')
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertTrue(len(produced) < 200, len(produced))
+
+        self.loop.run_until_complete(iterator.aclose())
+        count = len(produced)
+        self.loop.run_until_complete(asyncio.sleep(0.1))
+        self.assertEqual(len(produced), count)
+        self.assertRaises(StopAsyncIteration, self.loop.run_until_complete, iterator.__anext__())
+
+
+class NoAsyncioTests(unittest.TestCase):
+
+    def test_render_async(self):
+        """
+        Test that render_async() fails clearly if asyncio is not available.
+
+        """
+        if asyncio is not None:
+            return
+        self.assertRaises(PystacheError, Renderer().render_async, 'foo')
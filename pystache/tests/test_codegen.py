@@ -0,0 +1,166 @@
+# coding: utf-8
+
+"""
+Unit tests of codegen.py and the jit_threshold option of Renderer.
+
+"""
+
+import unittest
+
+from pystache.compiler import compile
+from pystache.context import KeyNotFoundError
+from pystache.fragments import MemoryCache
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+TEMPLATE = (u'<h1>{{title}}</h1>{{#items}}<li>{{name}} {{{html}}} {{site.url}} {{n}}</li>'
+            u'{{/items}}{{^items}}none{{/items}}{{#flag}}F{{/flag}}{{.}}')
+
+
+class JitTests(unittest.TestCase):
+
+    def _context(self, count=2):
+        items = [{'name': u'x%d' % i, 'html': '<b>', 'n': i} for i in range(count)]
+        return {'title': 'A&B', 'items': items, 'site': {'url': '/u'}, 'flag': True}
+
+    def _assert_renders(self, template, contexts, renderer=None):
+        """
+        Assert that a compiling renderer renders a parsed template like a
+        default renderer for each of the given contexts, and return the
+        parsed template.
+
+        """
+        if renderer is None:
+            renderer = Renderer(jit_threshold=1)
+        parsed = parse(template)
+        for context in contexts:
+            expected = Renderer().render(parsed, context)
+            # Render enough times to compile and then to use the compiled
+            # function.
+            for i in range(3):
+                self.assertEqual(renderer.render(parsed, context), expected)
+        return parsed
+
+    def test_compiled(self):
+        parsed = self._assert_renders(TEMPLATE, [self._context()])
+        self.assertTrue(parsed._jit.render is not None)
+
+    def test_threshold(self):
+        renderer = Renderer(jit_threshold=2)
+        parsed = parse(u'{{a}}')
+        renderer.render(parsed, {'a': 1})
+        renderer.render(parsed, {'a': 1})
+        self.assertTrue(parsed._jit.render is None)
+        renderer.render(parsed, {'a': 1})
+        self.assertTrue(parsed._jit.render is not None)
+
+    def test_not_compiled_by_default(self):
+        parsed = parse(u'{{a}}')
+        for i in range(3):
+            Renderer().render(parsed, {'a': 1})
+        self.assertTrue(parsed._jit is None)
+
+    def test_shapes(self):
+        """
+        Test contexts that differ in shape from the one compiled for.
+
+        """
+        context = self._context()
+        other = self._context()
+        other['items'] = []
+        mixed = self._context()
+        mixed['items'][0]['n'] = 1.5
+        missing = self._context()
+        del missing['site']
+        del missing['items'][0]['name']
+        self._assert_renders(TEMPLATE, [context, other, mixed, missing, context])
+
+    def test_deopt__object(self):
+        class Item(object):
+            name = 'obj'
+
+        context = {'items': [{'name': 'x'}]}
+        parsed = self._assert_renders(u'{{#items}}{{name}}{{/items}}', [context])
+
+        renderer = Renderer(jit_threshold=1)
+        self.assertEqual(renderer.render(parsed, {'items': [Item()]}), u'obj')
+        self.assertTrue(parsed._jit.render is None)
+
+        self._assert_renders(u'{{#items}}{{name}}{{/items}}', [{'items': [Item()]}])
+
+    def test_iterators_not_compiled(self):
+        """
+        Test that compiling does not exhaust one-shot section values.
+
+        """
+        renderer = Renderer(jit_threshold=0)
+        parsed = parse(u'{{#items}}{{name}};{{/items}}')
+        for i in range(3):
+            items = iter([{'name': 'a'}, {'name': 'b'}])
+            self.assertEqual(renderer.render(parsed, {'items': items}), u'a;b;')
+            generated = (item for item in [{'name': 'c'}])
+            self.assertEqual(renderer.render(parsed, {'items': generated}), u'c;')
+        self.assertTrue(parsed._jit.render is None)
+
+    def test_deopt__generator(self):
+        """
+        Test that a compiled function does not loop over an iterator, which
+        would leave part of it to the usual rendering on deoptimizing.
+
+        """
+        template = u'{{#items}}{{name}}{{#flag}}!{{/flag}};{{/items}}'
+        parsed = self._assert_renders(template, [{'items': [{'name': 'a', 'flag': 1}]}])
+        self.assertTrue(parsed._jit.render is not None)
+
+        renderer = Renderer(jit_threshold=0)
+        # The second flag has another type than the one compiled for.
+        items = (item for item in [{'name': 'a', 'flag': 1}, {'name': 'b', 'flag': 'yes'}])
+        self.assertEqual(renderer.render(parsed, {'items': items}), u'a!;b!;')
+
+        compiled = compile(template, {'items': [{'name': str, 'flag': None}]})
+        items = (item for item in [{'name': 'a', 'flag': 1},
+                                   {'name': 'b', 'flag': lambda text: u'?'}])
+        self.assertEqual(compiled.render({'items': items}), u'a!;b?;')
+
+    def test_deopt__lambda(self):
+        context = {'a': 'x'}
+        parsed = self._assert_renders(u'{{a}}', [context])
+        renderer = Renderer(jit_threshold=1)
+        self.assertEqual(renderer.render(parsed, {'a': lambda: '{{b}}', 'b': 'y'}), u'y')
+        self.assertTrue(parsed._jit.render is None)
+
+    def test_deopt__strict(self):
+        renderer = Renderer(jit_threshold=1, missing_tags='strict')
+        parsed = self._assert_renders(u'{{a}}', [{'a': 1}], renderer)
+        self.assertTrue(parsed._jit.render is not None)
+        self.assertRaises(KeyNotFoundError, renderer.render, parsed, {})
+
+    def test_partials_not_compiled(self):
+        renderer = Renderer(jit_threshold=1, partials={'p': u'{{a}}'})
+        parsed = parse(u'{{>p}}')
+        for i in range(3):
+            self.assertEqual(renderer.render(parsed, {'a': 1}), u'1')
+        self.assertTrue(parsed._jit.render is None)
+
+    def test_string_templates(self):
+        """
+        Test that template strings are parsed once, so that they compile.
+
+        """
+        renderer = Renderer(jit_threshold=1)
+        for i in range(3):
+            self.assertEqual(renderer.render(u'{{a}} jit string', {'a': 1}), u'1 jit string')
+        parsed = renderer._parse(u'{{a}} jit string')
+        self.assertTrue(parsed._jit.render is not None)
+
+    def test_fragment_cache(self):
+        """
+        Test that templates are not compiled with a fragment cache.
+
+        """
+        renderer = Renderer(jit_threshold=1, fragment_cache=MemoryCache())
+        parsed = parse(u'{{a}}')
+        for i in range(3):
+            renderer.render(parsed, {'a': 1})
+        self.assertTrue(parsed._jit is None)
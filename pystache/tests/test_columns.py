@@ -0,0 +1,77 @@
+# coding: utf-8
+
+"""
+Unit tests of columns.py and Renderer.render_columns().
+
+"""
+
+import array
+import unittest
+
+from pystache.common import PystacheError, Safe
+from pystache.context import KeyNotFoundError
+from pystache.renderer import Renderer
+
+
+class RenderColumnsTests(unittest.TestCase):
+
+    def _assert_columns(self, template, columns, context=None, renderer=None):
+        """
+        Assert that render_columns() renders like render() with a
+        dictionary for each row, and return the renderings.
+
+        """
+        if renderer is None:
+            renderer = Renderer()
+        names = list(columns.keys())
+        rows = [dict(zip(names, values)) for values in zip(*[columns[name] for name in names])]
+        expected = [renderer.render(template, context, row) for row in rows]
+
+        actual = renderer.render_columns(template, columns, context)
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_variables(self):
+        columns = {'name': ['Al & Bo', u'Cy', Safe(u'<b>')], 'n': array.array('i', [1, 2, 3]),
+                   'd': [{'x': '<1>'}, {'x': 2}, {}]}
+        actual = self._assert_columns(u'{{name}} {{{name}}} #{{n}} {{d.x}} {{site}} 100%',
+                                      columns, {'site': 'S&P'})
+        self.assertEqual(actual[0], u'Al &amp; Bo Al & Bo #1 &lt;1&gt; S&amp;P 100%')
+
+    def test_escape__bulk(self):
+        """
+        Test escaping columns with and without characters to escape.
+
+        """
+        columns = {'a': ['x', 'y'], 'b': ['<', '&'], 'c': [u'\x00<', 'z']}
+        actual = self._assert_columns(u'{{a}}{{b}}{{c}}', columns)
+        self.assertEqual(actual, [u'x&lt;\x00&lt;', u'y&amp;z'])
+
+    def test_escape__custom(self):
+        renderer = Renderer(escape=lambda s: u'[%s]' % s)
+        actual = self._assert_columns(u'{{a}}', {'a': ['x', 'y']}, renderer=renderer)
+        self.assertEqual(actual, [u'[x]', u'[y]'])
+
+    def test_rows(self):
+        """
+        Test templates that are rendered row by row.
+
+        """
+        columns = {'items': [[1, 2], []], 'n': [1, 2]}
+        self._assert_columns(u'{{#items}}{{.}}{{n}}{{/items}}', columns)
+        self._assert_columns(u'{{.}}', {'n': [1]})
+        self._assert_columns(u'{{f}}', {'n': [1, 2]}, {'f': lambda: u'{{n}}'})
+        self._assert_columns(u'{{n}}', {'n': [1, lambda: u'x']})
+
+    def test_no_tags(self):
+        self._assert_columns(u'x', {'n': [1, 2]})
+        self.assertEqual(Renderer().render_columns(u'x', {}), [])
+
+    def test_column_lengths(self):
+        self.assertRaises(PystacheError, Renderer().render_columns, u'{{a}}',
+                          {'a': [1, 2], 'b': [1]})
+
+    def test_missing__strict(self):
+        renderer = Renderer(missing_tags='strict')
+        self.assertRaises(KeyNotFoundError, renderer.render_columns, u'{{a}}{{b}}',
+                          {'a': [1]})
@@ -5,7 +5,10 @@ Unit tests of commands.py.
 
 """
 
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 from pystache.commands.render import main
@@ -41,5 +44,23 @@ class CommandsTestCase(unittest.TestCase):
         actual = self.callScript("Hi {{thing}}", '{"thing": "world"}')
         self.assertEqual(actual, u"Hi world\n")
 
+    def testMainContextFile(self):
+        """
+        Test reading the context from a file.
+
+        """
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, 'context.json')
+            f = open(path, 'wb')
+            try:
+                f.write('{"things": [{"name": "world"}, {"name": "caf\\u00e9"}], "unused": [{}]}'.encode('ascii'))
+            finally:
+                f.close()
+            actual = self.callScript("{{#things}}Hi {{name}}. {{/things}}", path)
+        finally:
+            shutil.rmtree(temp_dir)
+        self.assertEqual(actual, u"Hi world. Hi caf\xe9. \n")
+
     def tearDown(self):
         sys.stdout = ORIGINAL_STDOUT
@@ -0,0 +1,141 @@
+# coding: utf-8
+
+"""
+Unit tests of compiler.py.
+
+"""
+
+import sys
+import unittest
+
+from pystache.compiler import compile, validate, SchemaError
+from pystache.context import KeyNotFoundError
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+class CompileTests(unittest.TestCase):
+
+    def _assert_compiled(self, template, schema, context, renderer=None):
+        """
+        Assert that a compiled template renders like the template.
+
+        """
+        if renderer is None:
+            renderer = Renderer()
+        compiled = compile(template, schema, renderer)
+        actual = compiled.render(context)
+        self.assertEqual(actual, renderer.render(template, context))
+        return actual
+
+    def test_variables(self):
+        actual = self._assert_compiled(u'{{a}} {{{b}}} {{n}} {{x}} {{d.e}} {{d.f}} {{any}}',
+                                       {'a': str, 'b': unicode, 'n': float, 'd': {'e': int},
+                                        'any': None},
+                                       {'a': 'A&B', 'b': u'<i>', 'n': 1.5, 'd': {'e': 2},
+                                        'any': [1]})
+        self.assertEqual(actual, u'A&amp;B <i> 1.5  2  [1]')
+
+    def test_sections(self):
+        template = (u'{{#items}}{{name}}{{#tags}}[{{.}}{{sep}}]{{/tags}}{{/items}}'
+                    u'{{^items}}none{{/items}}{{#site}}{{url}}{{/site}}{{#flag}}{{.}}{{/flag}}'
+                    u'{{#any}}<{{.}}>{{/any}}')
+        schema = {'items': [{'name': str, 'tags': [str]}], 'sep': str,
+                  'site': {'url': str}, 'flag': str, 'any': None}
+        context = {'items': [{'name': 'a', 'tags': ['x', 'y']}, {'name': 'b', 'tags': []}],
+                   'sep': ',', 'site': {'url': '/u'}, 'flag': 'F', 'any': (1, 2)}
+        actual = self._assert_compiled(template, schema, context)
+        self.assertEqual(actual, u'a[x,][y,]b/uF<1><2>')
+
+        context = {'items': [], 'sep': ',', 'site': {}, 'flag': '', 'any': None}
+        actual = self._assert_compiled(template, schema, context)
+        self.assertEqual(actual, u'none')
+
+    def test_innermost_declaration(self):
+        schema = {'name': str, 'items': [{'name': str}]}
+        context = {'name': 'outer', 'items': [{'name': 'inner'}]}
+        actual = self._assert_compiled(u'{{#items}}{{name}}{{/items}}{{name}}', schema, context)
+        self.assertEqual(actual, u'innerouter')
+
+    def test_undeclared_items(self):
+        """
+        Test names that values of an undeclared structure define.
+
+        """
+        actual = self._assert_compiled(u'{{#items}}{{name}};{{/items}}', {'items': None},
+                                       {'items': [{'name': 'a'}, {'name': 'b'}]})
+        self.assertEqual(actual, u'a;b;')
+        actual = self._assert_compiled(u'{{#user}}{{name}} {{site}}{{/user}}',
+                                       {'user': None, 'site': str},
+                                       {'user': {'name': 'a'}, 'site': 'b'})
+        self.assertEqual(actual, u'a b')
+
+    def test_missing_declared_key(self):
+        compiled = compile(u'{{name}}{{#d}}{{e}}{{/d}}', {'name': unicode, 'd': {'e': int}})
+        self.assertEqual(compiled.render({}), u'')
+        self.assertEqual(compiled.render({'name': u'x', 'd': {}}), u'x')
+        self.assertEqual(compiled.render({'name': u'x', 'd': None}), u'x')
+
+    def test_lambda(self):
+        """
+        Test that lambdas where the schema allows them render as usual.
+
+        """
+        context = {'a': 'x', 'f': lambda: u'{{a}}!', 's': lambda text: text + u'?'}
+        actual = self._assert_compiled(u'{{f}}{{#s}}{{a}}{{/s}}', {'a': str, 'f': None, 's': None},
+                                       context)
+        self.assertEqual(actual, u'x!x?')
+
+    def test_partials(self):
+        renderer = Renderer(partials={'p': u'({{name}})'})
+        actual = self._assert_compiled(u'{{#items}}{{>p}}{{/items}}', {'items': [{'name': str}]},
+                                       {'items': [{'name': 'a'}, {'name': 'b'}]}, renderer)
+        self.assertEqual(actual, u'(a)(b)')
+
+    def test_missing__strict(self):
+        renderer = Renderer(missing_tags='strict')
+        compiled = compile(u'{{a}}{{b}}', {'a': str}, renderer)
+        self.assertRaises(KeyNotFoundError, compiled.render, {'a': 'x'})
+
+    def test_kwargs(self):
+        compiled = compile(u'{{a}}{{b}}', {'a': str, 'b': str})
+        self.assertEqual(compiled.render({'a': 'x', 'b': 'y'}, b='z'), u'xz')
+
+    def test_parsed_template(self):
+        compiled = compile(parse(u'{{a}}'), {'a': str})
+        self.assertEqual(compiled.render({'a': 'x'}), u'x')
+
+    def test_invalid_schema(self):
+        self.assertRaises(SchemaError, compile, u'', [str])
+        self.assertRaises(SchemaError, compile, u'', {'a': [str, int]})
+        self.assertRaises(SchemaError, compile, u'', {'a': 'str'})
+
+    def test_validate(self):
+        compiled = compile(u'{{#items}}{{n}}{{/items}}', {'items': [{'n': int}]}, validate=True)
+        self.assertEqual(compiled.render({'items': [{'n': 1}]}), u'1')
+        self.assertRaises(SchemaError, compiled.render, {'items': [{'n': 'x'}]})
+        self.assertRaises(SchemaError, compiled.render, {'items': [{}]})
+        self.assertRaises(SchemaError, compiled.render, {'items': {'n': 1}})
+
+
+class ValidateTests(unittest.TestCase):
+
+    def _get_message(self, value, schema):
+        try:
+            validate(value, schema)
+        except SchemaError:
+            return str(sys.exc_info()[1])
+        return None
+
+    def test_valid(self):
+        schema = {'s': str, 'u': unicode, 'n': int, 'items': [{'x': None}]}
+        self.assertEqual(self._get_message({'s': u'a', 'u': 'b', 'n': 1,
+                                            'items': [{'x': object()}], 'other': 1}, schema),
+                         None)
+
+    def test_message(self):
+        self.assertEqual(self._get_message({'items': [{'n': 1}, {'n': 'x'}]},
+                                           {'items': [{'n': int}]}),
+                         "context['items'][1]['n']: expected int, got 'x'")
+        self.assertEqual(self._get_message({}, {'a': str}), "context['a']: missing")
+
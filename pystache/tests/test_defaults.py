@@ -9,6 +9,7 @@ import unittest
 
 import pystache
 
+from pystache.defaults import escape, TAG_ESCAPE
 from pystache.tests.common import AssertStringMixin
 
 
@@ -66,3 +67,18 @@ class DefaultsConfigurableTestCase(unittest.TestCase, AssertStringMixin):
         pystache.defaults.MISSING_TAGS = 'strict'
         self.assertRaises(pystache.context.KeyNotFoundError,
                           pystache.render, template, context)
+
+
+class TagEscapeTestCase(unittest.TestCase):
+
+    """Tests the default TAG_ESCAPE function."""
+
+    def test_no_special_characters(self):
+        """Test that strings needing no escaping are returned as is."""
+        u = u"Thanks for this post!"
+        self.assertTrue(TAG_ESCAPE(u) is u)
+
+    def test_matches_escape(self):
+        """Test that the return value matches the standard library's escape()."""
+        for u in [u"", u"a&b", u"<p>", u"1 > 0", u'"x"', u"it's", u"&amp;"]:
+            self.assertEqual(TAG_ESCAPE(u), escape(u, quote=True))
@@ -0,0 +1,217 @@
+# coding: utf-8
+
+"""
+Unit tests of fragments.py.
+
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from pystache.common import Safe
+from pystache.fragments import digest, MemoryCache, SQLiteCache
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+class _SpyCache(MemoryCache):
+
+    """A MemoryCache that records the keys set."""
+
+    def __init__(self, *args, **kwargs):
+        MemoryCache.__init__(self, *args, **kwargs)
+        self.keys_set = []
+
+    def set(self, key, value):
+        self.keys_set.append(key)
+        MemoryCache.set(self, key, value)
+
+
+class DigestTests(unittest.TestCase):
+
+    def test_types_distinguished(self):
+        self.assertNotEqual(digest(1), digest(u'1'))
+        self.assertNotEqual(digest([1]), digest((1, )))
+        self.assertNotEqual(digest(u'<b>'), digest(Safe(u'<b>')))
+
+    def test_dict__order_independent(self):
+        first = {}
+        second = {}
+        for n in range(20):
+            first[n] = n
+            second[19 - n] = 19 - n
+        self.assertEqual(digest(first), digest(second))
+
+    def test_not_digestible(self):
+        self.assertEqual(digest([{'a': lambda: 1}]), None)
+
+    def test_not_digestible__cycle(self):
+        items = []
+        items.append(items)
+        self.assertEqual(digest(items), None)
+
+
+class MemoryCacheTests(unittest.TestCase):
+
+    def test_get_and_set(self):
+        cache = MemoryCache()
+        self.assertEqual(cache.get('a'), None)
+        cache.set('a', u'x')
+        self.assertEqual(cache.get('a'), u'x')
+
+    def test_max_size(self):
+        """
+        Test that the least recently used entries are discarded.
+
+        """
+        cache = MemoryCache(max_size=2)
+        cache.set('a', u'x')
+        cache.set('b', u'y')
+        cache.get('a')
+        cache.set('c', u'z')
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), u'x')
+
+    def test_ttl(self):
+        cache = MemoryCache(ttl=10)
+        now = [100]
+        cache._time = lambda: now[0]
+
+        cache.set('a', u'x')
+        now[0] = 109
+        self.assertEqual(cache.get('a'), u'x')
+        now[0] = 110
+        self.assertEqual(cache.get('a'), None)
+
+    def test_pickle(self):
+        cache = MemoryCache(max_size=5, ttl=1)
+        cache.set('a', u'x')
+
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.max_size, cache.ttl), (5, 1))
+
+
+class SQLiteCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'fragments.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _make_cache(self, **kwargs):
+        cache = SQLiteCache(self.path, **kwargs)
+        self.addCleanup(cache.close)
+        return cache
+
+    def test_shared(self):
+        """
+        Test that instances with the same path share entries.
+
+        """
+        self._make_cache().set('a', u'caf\xe9')
+        self.assertEqual(self._make_cache().get('a'), u'caf\xe9')
+
+    def test_ttl(self):
+        cache = self._make_cache(ttl=10)
+        now = [100]
+        cache._time = lambda: now[0]
+
+        cache.set('a', u'x')
+        now[0] = 110
+        self.assertEqual(cache.get('a'), None)
+
+
+class RendererFragmentCacheTests(unittest.TestCase):
+
+    """Tests rendering with the fragment_cache option of Renderer."""
+
+    def _renderer(self, **kwargs):
+        self.cache = _SpyCache()
+        return Renderer(fragment_cache=self.cache, cached_sections=['nav'], **kwargs)
+
+    def test_reused(self):
+        renderer = self._renderer()
+        template = u'{{#nav}}<a>{{title}}</a>{{/nav}} {{page}}'
+        nav = [{'title': 'Home'}, {'title': 'About'}]
+
+        actual = renderer.render(template, nav=nav, page=1)
+        self.assertEqual(actual, u'<a>Home</a><a>About</a> 1')
+        actual = renderer.render(template, nav=nav, page=2)
+        self.assertEqual(actual, u'<a>Home</a><a>About</a> 2')
+        self.assertEqual(len(self.cache.keys_set), 1)
+
+    def test_key__section_data(self):
+        renderer = self._renderer()
+        template = u'{{#nav}}{{title}}{{/nav}}'
+
+        self.assertEqual(renderer.render(template, nav={'title': 'a'}), u'a')
+        self.assertEqual(renderer.render(template, nav={'title': 'b'}), u'b')
+
+    def test_key__outer_names(self):
+        """
+        Test that the key covers outer names that the section references.
+
+        """
+        renderer = self._renderer()
+        template = u'{{#nav}}{{user}}{{/nav}}'
+
+        self.assertEqual(renderer.render(template, nav=True, user='Al'), u'Al')
+        self.assertEqual(renderer.render(template, nav=True, user='Bo'), u'Bo')
+
+    def test_key__partials(self):
+        """
+        Test that the key covers the names and text of partials.
+
+        """
+        partials = {'user': u'{{user}}'}
+        renderer = self._renderer(partials=partials)
+        template = u'{{#nav}}{{>user}}{{/nav}}'
+
+        self.assertEqual(renderer.render(template, nav=True, user='Al'), u'Al')
+        self.assertEqual(renderer.render(template, nav=True, user='Bo'), u'Bo')
+        partials['user'] = u'[{{user}}]'
+        self.assertEqual(renderer.render(template, nav=True, user='Bo'), u'[Bo]')
+
+    def test_key__parent_tags(self):
+        """
+        Test that the key covers the names of unflattened parent templates.
+
+        """
+        renderer = self._renderer(partials={'layout': u'<a>{{title}}</a>'})
+        template = parse(u'{{#nav}}{{<layout}}{{/layout}}{{/nav}}')
+
+        self.assertEqual(renderer.render(template, nav=True, title='A'), u'<a>A</a>')
+        self.assertEqual(renderer.render(template, nav=True, title='B'), u'<a>B</a>')
+
+    def test_not_cached__object(self):
+        class Nav(object):
+            def __init__(self, title):
+                self.title = title
+
+        renderer = self._renderer()
+        template = u'{{#nav}}{{title}}{{/nav}}'
+
+        self.assertEqual(renderer.render(template, nav=Nav('a')), u'a')
+        self.assertEqual(renderer.render(template, nav=Nav('b')), u'b')
+        self.assertEqual(self.cache.keys_set, [])
+
+    def test_other_sections_not_cached(self):
+        renderer = self._renderer()
+        renderer.render(u'{{#other}}x{{/other}}', other=True)
+        self.assertEqual(self.cache.keys_set, [])
+
+    def test_render_iter_and_render_bytes(self):
+        renderer = self._renderer()
+        template = u'a{{#nav}}{{.}}{{/nav}}b'
+
+        self.assertEqual(list(renderer.render_iter(template, nav=[1, 2])), [u'a', u'12', u'b'])
+        self.assertEqual(renderer.render_bytes(template, {'nav': [1, 2]}), u'a12b'.encode('ascii'))
+        self.assertEqual(len(self.cache.keys_set), 1)
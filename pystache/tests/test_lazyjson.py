@@ -0,0 +1,135 @@
+# coding: utf-8
+
+"""
+Unit tests of lazyjson.py.
+
+"""
+
+import threading
+import unittest
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+from pystache import lazyjson
+from pystache.lazyjson import LazyArray, LazyObject
+from pystache.renderer import Renderer
+
+
+DOCUMENT = u"""
+{"title": "Caf\\u00e9 \\"A\\" & B", "count": 3, "ratio": -1.5e2,
+ "flags": [true, false, null],
+ "empty": {}, "none": [],
+ "pages": [{"name": "a", "tags": ["x", "{y]"]}, {"name": "b", "tags": []}],
+ "nested": {"inner": {"value": "deep"}}}
+"""
+
+
+class LazyJsonTestCase(unittest.TestCase):
+
+    def test_loads__equals_json(self):
+        expected = json.loads(DOCUMENT[1:])
+        self.assertEqual(lazyjson.loads(DOCUMENT), expected)
+        self.assertEqual(lazyjson.loads(DOCUMENT[1:].encode('utf-8')), expected)
+
+    def test_loads__scalar(self):
+        self.assertEqual(lazyjson.loads(' "abc" '), u'abc')
+        self.assertEqual(lazyjson.loads('12'), 12)
+
+    def test_loads__lazy(self):
+        """
+        Test that nested objects and arrays are decoded only when accessed.
+
+        """
+        context = lazyjson.loads(DOCUMENT)
+        pages = dict.__getitem__(context, 'pages')
+        self.assertEqual(type(pages), LazyArray)
+        self.assertEqual(list.__len__(pages), 0)
+
+        page = pages[1]
+        self.assertEqual(list.__len__(pages), 2)
+        self.assertEqual(type(page), LazyObject)
+        self.assertEqual(dict.__len__(page), 0)
+        self.assertEqual(page['name'], u'b')
+        self.assertEqual(dict.__len__(page), 2)
+
+    def test_loads__errors(self):
+        self.assertRaises(ValueError, lazyjson.loads, '{"a": 1,}')
+        self.assertRaises(ValueError, lazyjson.loads, '{"a": [1, 2}')
+        self.assertRaises(ValueError, lazyjson.loads, '{"a": 1} x')
+        self.assertRaises(ValueError, lazyjson.loads, '')
+
+    def test_loads__deep(self):
+        """
+        Test skipping containers nested deeper than the small ones matched
+        whole, with brackets and escaped quotes in their strings.
+
+        """
+        rows = [{"s": "]}\\\"[{", "a": [[[["x"]]], {"b": {"c": ["]"]}}]}
+                for n in range(3)]
+        document = json.dumps({"rows": rows, "tail": {"t": "end"}})
+        context = lazyjson.loads(document)
+        self.assertEqual(context['tail']['t'], u'end')
+        self.assertEqual(context['rows'][2]['a'][1]['b']['c'], [u']'])
+        self.assertEqual(context, json.loads(document))
+
+    def test_loads__errors_on_access(self):
+        """
+        Test that errors inside a container are raised when it is decoded.
+
+        """
+        context = lazyjson.loads('{"a": [[[1, ]]], "b": 1}')
+        self.assertEqual(context['b'], 1)
+        self.assertRaises(ValueError, lambda: context['a'][0][0][0])
+        # Unbalanced brackets are found when the enclosing container is.
+        self.assertRaises(ValueError, lazyjson.loads, '{"a": [[[1, 2}]]]}')
+        self.assertRaises(ValueError, lazyjson.loads, '{"a": [[["]]]}')
+
+    def test_methods(self):
+        context = lazyjson.loads(DOCUMENT)
+        nested = context['nested']
+        self.assertEqual(list(nested.keys()), ['inner'])
+        self.assertTrue('value' in nested['inner'])
+        self.assertEqual(nested.get('missing', 5), 5)
+
+        pages = context['pages']
+        self.assertEqual(len(pages), 2)
+        self.assertEqual([page['name'] for page in pages], [u'a', u'b'])
+        pages.append(1)
+        self.assertEqual(len(pages), 3)
+
+    def test_threads(self):
+        """
+        Test that threads reading a container as it is decoded see all of it.
+
+        """
+        names = ['n%d' % n for n in range(2000)]
+        document = u'[{%s}]' % u', '.join([u'"%s": [1]' % name for name in names])
+        for attempt in range(5):
+            obj = lazyjson.loads(document)[0]
+            results = []
+
+            def read():
+                results.append(len(obj))
+                results.append(len(obj[names[-1]]))
+
+            threads = [threading.Thread(target=read) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(sorted(results), [1] * 8 + [2000] * 8)
+
+    def test_decode(self):
+        context = lazyjson.decode(lazyjson.loads(DOCUMENT))
+        self.assertEqual(json.loads(json.dumps(context)), json.loads(DOCUMENT[1:]))
+
+    def test_render(self):
+        context = lazyjson.loads(DOCUMENT)
+        template = (u"{{title}}: {{nested.inner.value}} "
+                    u"{{#pages}}{{name}}({{#tags}}{{.}}{{/tags}}){{/pages}}"
+                    u"{{^none}}none{{/none}}{{#empty}}empty{{/empty}}")
+        actual = Renderer().render(template, context)
+        self.assertEqual(actual, u"Caf\xe9 &quot;A&quot; &amp; B: deep a(x{y])b()none")
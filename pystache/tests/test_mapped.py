@@ -0,0 +1,131 @@
+# coding: utf-8
+
+"""
+Unit tests of mapped.py.
+
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from pystache.fragments import MemoryCache
+from pystache.mapped import parse_file, _MappedText
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+TEMPLATE = (u"<h1>{{title}}</h1> caf\xe9\r\n"
+            u"{{#items}}\r\n"
+            u"  <li>{{name}}</li>\r\n"
+            u"{{/items}}\r\n"
+            u"{{=<% %>=}}\n"
+            u"<%#lambda%>{{x}} \xe9<%/lambda%>|<%! comment %>end")
+
+CONTEXT = {'title': u'A & B', 'items': [{'name': u'a'}, {'name': u'\xe9'}],
+           'lambda': lambda text: text.upper()}
+
+
+class BytesFile(object):
+
+    """A file-like object that records what is written to it."""
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, piece):
+        self.pieces.append(piece)
+
+
+class MappedTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.renderer = Renderer(file_encoding='utf-8', partials={})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _write(self, text, encoding='utf-8', name='template'):
+        path = os.path.join(self.temp_dir, name + '.mustache')
+        f = open(path, 'wb')
+        try:
+            f.write(text.encode(encoding))
+        finally:
+            f.close()
+        return path
+
+    def test_parse_file(self):
+        parsed = parse_file(self._write(TEMPLATE), 'utf-8')
+        self.assertEqual(type(parsed._parse_tree[0]), _MappedText)
+
+        expected = self.renderer.render(parse(TEMPLATE), CONTEXT)
+        self.assertEqual(self.renderer.render(parsed, CONTEXT), expected)
+        self.assertEqual(expected,
+                         u"<h1>A &amp; B</h1> caf\xe9\r\n  <li>a</li>\r\n  <li>\xe9</li>\r\n"
+                         u"{{X}} \xc9|end")
+
+    def test_parse_file__empty(self):
+        parsed = parse_file(self._write(u''), 'utf-8')
+        self.assertEqual(self.renderer.render(parsed), u'')
+
+    def test_parse_file__other_encoding(self):
+        """
+        Test a file in an encoding that is not ASCII-compatible.
+
+        """
+        parsed = parse_file(self._write(TEMPLATE, 'utf-16'), 'utf-16')
+        self.assertEqual(self.renderer.render(parsed, CONTEXT),
+                         self.renderer.render(parse(TEMPLATE), CONTEXT))
+
+    def test_render_bytes(self):
+        parsed = self.renderer.map_template(self._write(TEMPLATE))
+        for encoding in ['utf-8', 'latin-1']:
+            expected = self.renderer.render_bytes(parse(TEMPLATE), CONTEXT, encoding)
+            self.assertEqual(self.renderer.render_bytes(parsed, CONTEXT, encoding), expected)
+
+    def test_render_bytes__file(self):
+        """
+        Test that literal text is written from the map without copies.
+
+        """
+        parsed = self.renderer.map_template(self._write(TEMPLATE))
+        f = BytesFile()
+        self.assertEqual(self.renderer.render_bytes(parsed, CONTEXT, file=f), None)
+
+        expected = self.renderer.render_bytes(parse(TEMPLATE), CONTEXT)
+        self.assertEqual(u''.encode('ascii').join([bytes(piece) for piece in f.pieces]),
+                         expected)
+        self.assertNotEqual(type(f.pieces[0]), type(expected))
+
+    def test_pickle(self):
+        parsed = self.renderer.map_template(self._write(TEMPLATE))
+        parsed = pickle.loads(pickle.dumps(parsed))
+        self.assertEqual(self.renderer.render(parsed, CONTEXT),
+                         self.renderer.render(parse(TEMPLATE), CONTEXT))
+
+    def test_repr(self):
+        """
+        Test that templates that differ only in literal text have
+        different fingerprints and fragment cache keys.
+
+        """
+        first = self.renderer.map_template(self._write(u'{{#nav}}a {{x}}{{/nav}}', name='a'))
+        second = self.renderer.map_template(self._write(u'{{#nav}}b {{x}}{{/nav}}', name='b'))
+        self.assertNotEqual(repr(first), repr(second))
+        self.assertEqual(repr(first), repr(parse_file(self._write(u'{{#nav}}a {{x}}{{/nav}}',
+                                                                  name='c'), 'utf-8')))
+        # The digest of the text is computed once.
+        literal = first._parse_tree[0].parsed._parse_tree[0]
+        self.assertEqual(type(literal), _MappedText)
+        self.assertTrue(literal._digest is not None)
+
+        context = {'nav': True, 'x': 1}
+        self.assertNotEqual(self.renderer.render_tracked(first, context).fingerprint,
+                            self.renderer.render_tracked(second, context).fingerprint)
+
+        renderer = Renderer(fragment_cache=MemoryCache(), cached_sections=['nav'])
+        self.assertEqual(renderer.render(first, context), u'a 1')
+        self.assertEqual(renderer.render(second, context), u'b 1')
@@ -0,0 +1,91 @@
+# coding: utf-8
+
+"""
+Unit tests of parallel.py.
+
+"""
+
+import multiprocessing
+import unittest
+
+from pystache.parallel import render_parallel, RenderError
+from pystache.parser import parse
+from pystache.renderer import Renderer
+from pystache.tests.data.views import SayHello
+
+
+def _upper(u):
+    # A module-level function so that it can be pickled.
+    return u.upper()
+
+
+class RenderParallelTests(unittest.TestCase):
+
+    """Tests render_parallel()."""
+
+    def test_order(self):
+        """
+        Test that results are in the order of the contexts.
+
+        """
+        contexts = [{'n': n} for n in range(50)]
+        actual = list(render_parallel('<{{n}}>', contexts, workers=2, chunksize=3))
+        self.assertEqual(actual, ['<%s>' % n for n in range(50)])
+
+    def test_parsed_template_and_renderer(self):
+        """
+        Test passing a ParsedTemplate and a configured Renderer.
+
+        """
+        renderer = Renderer(partials={'p': '{{#items}}({{.}}){{/items}}'},
+                            escape=_upper)
+        template = parse(u'{{name}}{{>p}}')
+        contexts = [{'name': 'a', 'items': [1, 2]}, {'name': 'b'}]
+
+        actual = list(render_parallel(template, contexts, workers=2, renderer=renderer))
+        self.assertEqual(actual, ['A(1)(2)', 'B'])
+
+    def test_object_template(self):
+        actual = list(render_parallel(SayHello(), [{}, {'to': 'Mars'}], workers=1))
+        self.assertEqual(actual, ['Hello, World', 'Hello, Mars'])
+
+    def test_no_workers_until_iterated(self):
+        """
+        Test that an iterator that is never started leaves no workers.
+
+        """
+        results = render_parallel('{{n}}', [{'n': 1}], workers=2)
+        self.assertEqual(multiprocessing.active_children(), [])
+        self.assertEqual(list(results), ['1'])
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def _render_strict(self, errors):
+        renderer = Renderer(missing_tags='strict')
+        contexts = [{'n': 1}, {}, {'n': 3}]
+        return render_parallel('{{n}}', contexts, workers=2, chunksize=1,
+                               renderer=renderer, errors=errors)
+
+    def test_errors__raise(self):
+        results = self._render_strict('raise')
+        self.assertEqual(results.next(), '1')
+        try:
+            results.next()
+        except RenderError, err:
+            self.assertEqual(err.index, 1)
+            self.assertEqual(err.type_name, 'KeyNotFoundError')
+            self.assertTrue('KeyNotFoundError' in err.traceback_text)
+        else:
+            raise AssertionError("RenderError not raised")
+
+    def test_errors__return(self):
+        results = list(self._render_strict('return'))
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], '1')
+        self.assertTrue(isinstance(results[1], RenderError))
+        self.assertEqual(results[2], '3')
+
+    def test_errors__skip(self):
+        self.assertEqual(list(self._render_strict('skip')), ['1', '3'])
+
+    def test_errors__invalid(self):
+        self.assertRaises(Exception, render_parallel, '', [], errors='foo')
@@ -5,10 +5,17 @@ Unit tests of parser.py.
 
 """
 
+import pickle
 import unittest
 
+from pystache import defaults
+from pystache.context import ContextStack
 from pystache.defaults import DELIMITERS
 from pystache.parser import _compile_template_re as make_re
+from pystache import parser
+from pystache.parser import (parse, _BlockNode, _ConditionalNode, _InvertedNode, _ParentNode,
+                             _SectionNode)
+from pystache.renderer import Renderer
 
 
 class RegularExpressionTestCase(unittest.TestCase):
@@ -25,3 +32,296 @@ class RegularExpressionTestCase(unittest.TestCase):
 
         self.assertEqual(match.start(), 1)
 
+
+class ParsedTemplateTestCase(unittest.TestCase):
+
+    """Tests the ParsedTemplate instances returned by parse()."""
+
+    def test_get_keys(self):
+        parsed = parse(u"{{a}} {{{b.c}}} {{#d}}{{e}}{{^f}}{{a}}{{/f}}{{/d}}{{>g}}{{!h}}")
+        self.assertEqual(parsed.get_keys(), ['a', 'b.c', 'd', 'e', 'f'])
+
+    def test_get_keys__no_tags(self):
+        self.assertEqual(parse(u"foo").get_keys(), [])
+
+    def test_repr__comment(self):
+        """
+        Test that repr() supports nodes without a key.
+
+        """
+        self.assertEqual(repr(parse(u"{{!h}}")), "[_CommentNode()]")
+
+    def _render(self, parsed, context):
+        renderer = Renderer()
+        return parsed.render(renderer._make_render_engine(), ContextStack(context))
+
+    def test_render__format(self):
+        """
+        Test rendering a template of only variable tags through a format
+        string.
+
+        """
+        parsed = parse(u"{{=<% %>=}}100% <%a%> & <%{b}%><%! c %>%s")
+        self.assertEqual(self._render(parsed, {'a': '<', 'b': '<'}), u"100% &lt; & <%s")
+        tree = parsed._parse_tree
+        self.assertEqual(parsed._format,
+                         (u"%s100%% %s & %s%s%%s", [tree[0], tree[2], tree[4], tree[5]]))
+
+        # Lambdas still render as templates.
+        self.assertEqual(self._render(parsed, {'a': lambda: '{{b}}', 'b': 'x'}),
+                         u"100% x & x%s")
+
+    def test_render__format_not_used(self):
+        parsed = parse(u"{{a}}{{#b}}{{a}}{{/b}}")
+        self.assertEqual(self._render(parsed, {'a': 1, 'b': True}), u"11")
+        self.assertEqual(parsed._format, False)
+        # The section's template has only a variable tag.
+        self.assertEqual(parsed._parse_tree[1].parsed._format[0], u"%s")
+
+
+class NodeTestCase(unittest.TestCase):
+
+    """Tests the node objects in parse trees."""
+
+    template = u"{{a}}{{{b}}}{{#c}}{{^d}}{{>e}}{{/d}}{{/c}}{{!f}}{{=<% %>=}}"
+
+    def test_slots(self):
+        """
+        Test that nodes do not have a __dict__.
+
+        """
+        parsed = parse(self.template)
+        nodes = parsed._parse_tree + parsed._parse_tree[2].parsed._parse_tree
+        for node in nodes:
+            self.assertFalse(hasattr(node, '__dict__'), repr(node))
+        self.assertFalse(hasattr(parsed, '__dict__'))
+
+    def test_pickle(self):
+        parsed = parse(self.template)
+        for protocol in (0, 2):
+            actual = pickle.loads(pickle.dumps(parsed, protocol))
+            self.assertEqual(repr(actual), repr(parsed))
+
+        renderer = Renderer(partials={'e': u'E'})
+        actual = pickle.loads(pickle.dumps(parsed))
+        self.assertEqual(renderer.render(actual, {'c': True}), u'E')
+
+    def test_conditional(self):
+        """
+        Test that a section and an inverted section on the same key fuse.
+
+        """
+        template = u"{{#a}}x{{/a}}\n{{^a}}y{{/a}}{{#b}}x{{/b}}{{^b}}y{{/b}}{{^c}}{{/c}}"
+        tree = parse(template)._parse_tree
+
+        self.assertEqual([type(node) for node in tree],
+                         [_SectionNode, unicode, _InvertedNode, _ConditionalNode,
+                          _InvertedNode])
+        self.assertEqual(parse(template).get_keys(), ['a', 'b', 'c'])
+
+    def test_conditional__standalone(self):
+        template = u"{{#a}}\nx\n{{/a}}\n{{^a}}\ny\n{{/a}}\n"
+        tree = parse(template)._parse_tree
+        self.assertTrue(isinstance(tree[0], _ConditionalNode))
+        self.assertEqual(Renderer().render(template, a=False), u'y\n')
+
+    def test_section_text(self):
+        """
+        Test that a section keeps only its own text, and that the sections
+        nested in it share that text.
+
+        """
+        template = u"abc {{#s}}x{{#t}}{{y}}{{/t}}{{/s}} {{#s}}z{{/s}} {{^u}}{{#v}}w{{/v}}{{/u}}"
+        first, second, third = [node for node in parse(template)._parse_tree
+                                if type(node) is not unicode]
+        nested = first.parsed._parse_tree[1]
+        inside_inverted = third.parsed_section._parse_tree[0]
+
+        self.assertEqual(first.get_text(), u'x{{#t}}{{y}}{{/t}}')
+        self.assertEqual(nested.get_text(), u'{{y}}')
+        self.assertEqual(second.get_text(), u'z')
+        self.assertEqual(inside_inverted.get_text(), u'w')
+        self.assertTrue(nested.text.source is first.text)
+
+
+class ParseCacheTestCase(unittest.TestCase):
+
+    """Tests the cache option of parse()."""
+
+    def test_cached(self):
+        parsed = parse(u'a{{b}}', cache=True)
+        self.assertTrue(parse(u'a{{b}}', cache=True) is parsed)
+        self.assertFalse(parse(u'a{{b}}') is parsed)
+
+    def test_key__delimiters(self):
+        parsed = parse(u'<%b%>{{c}}', cache=True)
+        other = parse(u'<%b%>{{c}}', ['<%', '%>'], cache=True)
+        self.assertEqual(parsed.get_keys(), ['c'])
+        self.assertEqual(other.get_keys(), ['b'])
+
+    def test_key__default_delimiters(self):
+        """
+        Test that the key reflects changes to defaults.DELIMITERS.
+
+        """
+        parsed = parse(u'{{b}}[[c]]', cache=True)
+        original = defaults.DELIMITERS
+        defaults.DELIMITERS = ('[[', ']]')
+        try:
+            other = parse(u'{{b}}[[c]]', cache=True)
+        finally:
+            defaults.DELIMITERS = original
+        self.assertEqual(parsed.get_keys(), ['b'])
+        self.assertEqual(other.get_keys(), ['c'])
+
+    def test_size(self):
+        original = parser.PARSE_CACHE_SIZE
+        parser.PARSE_CACHE_SIZE = 3
+        try:
+            for n in range(10):
+                parse(u'{{%d}}' % n, cache=True)
+                self.assertTrue(len(parser._parse_cache) <= 3)
+        finally:
+            parser.PARSE_CACHE_SIZE = original
+
+    def test_inheritance_not_cached_flattened(self):
+        partials = {'parent': u'({{$a}}{{/a}})'}
+        template = u'{{<parent}}{{/parent}}'
+        self.assertEqual(repr(parse(template, resolve_partial=partials.get, cache=True)),
+                         repr([u'(', u')']))
+        partials['parent'] = u'[{{$a}}{{/a}}]'
+        self.assertEqual(repr(parse(template, resolve_partial=partials.get, cache=True)),
+                         repr([u'[', u']']))
+
+
+class InheritanceTestCase(unittest.TestCase):
+
+    """Tests parent tags and blocks, as in the spec's inheritance module."""
+
+    def _render(self, template, partials, context=None):
+        renderer = Renderer(partials=partials)
+        return renderer.render(template, context or {})
+
+    def test_parse__flattened(self):
+        """
+        Test that parsing with resolve_partial leaves no parents or blocks.
+
+        """
+        partials = {'parent': u'<{{$a}}default{{/a}}{{#s}}{{$b}}x{{/b}}{{/s}}>'}
+        parsed = parse(u'{{<parent}}{{$b}}{{y}}{{/b}}{{/parent}}',
+                       resolve_partial=partials.get)
+
+        self.assertEqual(parsed.get_keys(), ['s', 'y'])
+        for node in parsed._parse_tree:
+            self.assertFalse(isinstance(node, (_BlockNode, _ParentNode)))
+
+    def test_parse__not_flattened(self):
+        parsed = parse(u'{{<parent}}{{$a}}x{{/a}}{{/parent}}')
+        self.assertTrue(isinstance(parsed._parse_tree[0], _ParentNode))
+
+    def test_default(self):
+        self.assertEqual(self._render(u'{{$title}}Default{{/title}}', {}), u'Default')
+
+    def test_override(self):
+        partials = {'super': u'...{{$title}}Default{{/title}}...'}
+        actual = self._render(u'{{<super}}{{$title}}sub{{/title}}{{/super}}', partials)
+        self.assertEqual(actual, u'...sub...')
+
+    def test_parent_without_overrides(self):
+        partials = {'super': u'...{{$title}}Default{{/title}}...'}
+        self.assertEqual(self._render(u'{{<super}}{{/super}}', partials), u'...Default...')
+
+    def test_text_inside_parent_ignored(self):
+        partials = {'parent': u'{{$foo}}default content{{/foo}}'}
+        template = u'{{<parent}} ignored {{$foo}}override{{/foo}} {{x}} {{/parent}}'
+        self.assertEqual(self._render(template, partials), u'override')
+
+    def test_multilevel(self):
+        partials = {'parent': u'{{<older}}{{$a}}p{{/a}}{{/older}}',
+                    'older': u'{{<grandParent}}{{$a}}o{{/a}}{{/grandParent}}',
+                    'grandParent': u'{{$a}}g{{/a}}|{{$b}}g{{/b}}'}
+        self.assertEqual(self._render(u'{{<parent}}{{/parent}}', partials), u'p|g')
+        actual = self._render(u'{{<parent}}{{$a}}c{{/a}}{{$b}}c{{/b}}{{/parent}}', partials)
+        self.assertEqual(actual, u'c|c')
+
+    def test_block_scope(self):
+        """
+        Test that a block renders in the context of the parent's location.
+
+        """
+        partials = {'parent': u'{{#nested}}{{$block}}You say {{fruit}}.{{/block}}{{/nested}}'}
+        template = u'{{<parent}}{{$block}}I say {{fruit}}.{{/block}}{{/parent}}'
+        context = {'fruit': 'apples', 'nested': {'fruit': 'bananas'}}
+        self.assertEqual(self._render(template, partials, context), u'I say bananas.')
+
+    def test_recursion(self):
+        partials = {'parent': u'{{$foo}}default content{{/foo}} {{$bar}}{{<parent2}}{{/parent2}}{{/bar}}',
+                    'parent2': u"{{$foo}}parent2 default content{{/foo}} "
+                               u"{{<parent}}{{$bar}}don't recurse{{/bar}}{{/parent}}"}
+        template = u'{{<parent}}{{$foo}}override{{/foo}}{{/parent}}'
+        actual = self._render(template, partials)
+        self.assertEqual(actual, u"override override override don't recurse")
+
+    def test_standalone_parent__indented(self):
+        partials = {'parent': u'a\n{{$b}}b{{/b}}\n'}
+        template = u'<\n  {{<parent}}\n  {{/parent}}\n>'
+        self.assertEqual(self._render(template, partials), u'<\n  a\n  b\n>')
+
+    def test_standalone_tags_on_one_line(self):
+        """
+        Test that a line of parent and block tags is standalone.
+
+        """
+        partials = {'parent': u'one\ntwo\n', 'super': u'{{$a}}x{{/a}}'}
+        self.assertEqual(self._render(u'Hi,\n  {{<parent}}{{/parent}}\n', partials),
+                         u'Hi,\n  one\n  two\n')
+        template = u'{{<super}}{{$a}}\npeaked\n\n:(\n{{/a}}{{/super}}'
+        self.assertEqual(self._render(template, partials), u'peaked\n\n:(\n')
+
+    def test_block_reindentation(self):
+        """
+        Test that overriding content takes the indentation of a standalone
+        block tag in place of its own.
+
+        """
+        template = u'{{<parent}}{{$block}}\n    one\n      {{x}}\n{{/block}}\n{{/parent}}\n'
+        partials = {'parent': u'Hi,\n  {{$block}}\n  {{/block}}\n'}
+        self.assertEqual(self._render(template, partials, {'x': 'two'}),
+                         u'Hi,\n  one\n    two\n')
+        partials = {'parent': u'Hi,\n{{$block}}\n    default\n{{/block}}\n'}
+        self.assertEqual(self._render(template, partials, {'x': 'two'}),
+                         u'Hi,\none\n  two\n')
+        # Blocks that are not standalone are not reindented.
+        partials = {'parent': u'Hi, {{$block}}{{/block}}.'}
+        self.assertEqual(self._render(template, partials, {'x': 'two'}),
+                         u'Hi,     one\n      two\n.')
+
+    def test_in_partial(self):
+        """
+        Test parent tags in partials, which are parsed at render time.
+
+        """
+        partials = {'page': u'{{<layout}}{{$body}}{{name}}{{/body}}{{/layout}}',
+                    'layout': u'[{{$body}}{{/body}}]'}
+        actual = self._render(u'{{#items}}{{>page}}{{/items}}', partials,
+                              {'items': [{'name': 'a'}, {'name': 'b'}]})
+        self.assertEqual(actual, u'[a][b]')
+
+    def test_render_parsed_without_flattening(self):
+        partials = {'super': u'({{$a}}x{{/a}})'}
+        parsed = parse(u'{{<super}}{{$a}}y{{/a}}{{/super}}')
+        self.assertEqual(self._render(parsed, partials), u'(y)')
+
+        # The flattened tree is reused while the parent stays the same.
+        node = parsed._parse_tree[0]
+        flattened = node._flattened[1]
+        self.assertEqual(self._render(parsed, partials), u'(y)')
+        self.assertTrue(node._flattened[1] is flattened)
+        partials['super'] = u'[{{$a}}x{{/a}}]'
+        self.assertEqual(self._render(parsed, partials), u'[y]')
+
+    def test_parse__flattened_cached(self):
+        partials = {'super': u'({{$a}}x{{/a}})'}
+        template = u'{{<super}}{{$a}}y{{/a}}{{/super}}'
+        parsed = parse(template, resolve_partial=partials.get, cache=True)
+        self.assertTrue(parse(template, resolve_partial=partials.get, cache=True) is parsed)
@@ -8,6 +8,7 @@ Unit tests of renderengine.py.
 import sys
 import unittest
 
+from pystache.common import Safe, SectionLambda
 from pystache.context import ContextStack, KeyNotFoundError
 from pystache import defaults
 from pystache.parser import ParsingError
@@ -672,6 +673,126 @@ class RenderTests(unittest.TestCase, AssertStringMixin, AssertExceptionMixin):
         context = {'planet': 'Earth', 'dot': '~{{.}}~', 'lambda': (lambda text: "#{{%s}}#" % text)}
         self._assert_render(u'#~{{.}}~#', template, context)
 
+    def test_section__section_lambda(self):
+        """
+        Test a SectionLambda, which receives a handle to the parsed section.
+
+        """
+        texts = []
+
+        def wrap(section):
+            texts.append(section.text)
+            return u'[%s]' % section.render()
+
+        template = '{{#items}}{{#wrap}}<{{name}}>{{/wrap}}{{/items}}'
+        context = {'items': [{'name': 'a'}, {'name': 'b'}], 'wrap': SectionLambda(wrap)}
+        self._assert_render(u'[<a>][<b>]', template, context)
+        self.assertEqual(texts, [u'<{{name}}>', u'<{{name}}>'])
+
+    def test_section__section_lambda__output_not_rendered(self):
+        context = {'lambda': SectionLambda(lambda section: u'{{x}}'), 'x': 'y'}
+        self._assert_render(u'{{x}}', '{{#lambda}}{{/lambda}}', context)
+
+    def test_section__section_lambda__render_template(self):
+        """
+        Test rendering another template in place of the section.
+
+        """
+        translations = {u'Hi {{name}}': u'Hola {{name}}'}
+        translate = SectionLambda(lambda section: section.render(translations[section.text]))
+
+        template = '{{=<% %>=}}<%#t%>Hi {{name}}<%/t%>'
+        context = {'t': translate, 'name': 'Al'}
+        # The template is rendered with the section's delimiters.
+        self._assert_render(u'Hola {{name}}', template, context)
+
+        template = '{{#t}}Hi {{name}}{{/t}}'
+        self._assert_render(u'Hola Al', template, context)
+
+    def test_section_and_inverted(self):
+        """
+        Test a section followed by an inverted section on the same key.
+
+        """
+        template = '{{#x}}<{{.}}>{{/x}}{{^x}}none{{/x}}'
+        self._assert_render(u'<a><b>', template, {'x': ['a', 'b']})
+        self._assert_render(u'<1>', template, {'x': 1})
+        self._assert_render(u'none', template, {'x': []})
+        self._assert_render(u'none', template, {'x': None})
+        self._assert_render(u'hi', template, {'x': lambda text: 'hi'})
+
+    def test_section_and_inverted__resolved_once(self):
+        engine = self._engine()
+        names = []
+        resolve_context = engine.resolve_context
+
+        def resolve(stack, name):
+            names.append(name)
+            return resolve_context(stack, name)
+
+        engine.resolve_context = resolve
+        template = '{{#x}}a{{/x}}{{^x}}b{{/x}}{{#x}}c{{/x}}'
+        self._assert_render(u'ac', template, {'x': True}, engine=engine)
+        self.assertEqual(names, ['x', 'x'])
+
+    def test_section_and_inverted__missing_strict(self):
+        engine = self._engine()
+        template = '{{#x}}a{{/x}}{{^x}}b{{/x}}'
+        self.assertRaises(KeyNotFoundError, engine.render, unicode(template), ContextStack())
+
+    def _counting_engine(self, names):
+        """
+        Return an engine that appends each name it resolves to names.
+
+        """
+        engine = self._engine()
+        resolve_context = engine.resolve_context
+
+        def resolve(stack, name):
+            names.append(name)
+            return resolve_context(stack, name)
+
+        engine.resolve_context = resolve
+        return engine
+
+    def test_section__outer_names_hoisted(self):
+        """
+        Test that outer names in a list section are resolved once.
+
+        """
+        names = []
+        engine = self._counting_engine(names)
+        template = '{{#items}}{{name}}{{sep}}{{{a.b}}}{{/items}}'
+        context = {'items': [{'name': 'x'}, {'name': 'y'}, {'name': 'z'}],
+                   'sep': '&', 'a': {'b': '<'}}
+
+        self._assert_render(u'x&amp;<y&amp;<z&amp;<', template, context, engine=engine)
+        self.assertEqual(names.count('sep'), 1)
+        self.assertEqual(names.count('a.b'), 1)
+        self.assertEqual(names.count('name'), 3)
+
+    def test_section__outer_names_not_hoisted(self):
+        """
+        Test names that an item could define.
+
+        """
+        template = '{{#items}}{{sep}}{{/items}}'
+        self._assert_render(u'--;', template, {'items': [{}, {}, {'sep': ';'}], 'sep': '-'})
+
+        class Item(object):
+            sep = '+'
+
+        self._assert_render(u'-+', template, {'items': [{}, Item()], 'sep': '-'})
+
+    def test_section__outer_names_hoisted__values(self):
+        """
+        Test hoisting names whose values are lambdas or Safe strings.
+
+        """
+        template = '{{#items}}{{f}}{{s}}{{/items}}'
+        context = {'items': [{'n': 1}, {'n': 2}], 'f': lambda: '{{n}}', 's': Safe(u'<b>')}
+        self._assert_render(u'1<b>2<b>', template, context)
+
     def test_comment__multiline(self):
         """
         Check that multiline comments are permitted.
@@ -7,15 +7,20 @@ Unit tests of template.py.
 
 import codecs
 import os
+import pickle
 import sys
+import threading
+import time
 import unittest
 
 from examples.simple import Simple
 from pystache import Renderer
+from pystache import Safe
 from pystache import TemplateSpec
 from pystache.common import TemplateNotFoundError
 from pystache.context import ContextStack, KeyNotFoundError
 from pystache.loader import Loader
+from pystache.parser import parse
 
 from pystache.tests.common import get_data_path, AssertStringMixin, AssertExceptionMixin
 from pystache.tests.data.views import SayHello
@@ -320,6 +325,16 @@ class RendererTests(unittest.TestCase, AssertStringMixin):
         renderer.render('Hi {{person}}', context=context, foo="bar")
         self.assertEqual(context, {})
 
+    def test_render__safe(self):
+        """
+        Test that Safe values are not escaped, in any kind of tag.
+
+        """
+        renderer = Renderer()
+        context = {'safe': Safe(u'<b>'), 'unsafe': u'<b>'}
+        actual = renderer.render(u'{{safe}} {{{safe}}} {{unsafe}}', context)
+        self.assertEqual(actual, u'<b> <b> &lt;b&gt;')
+
     def test_render__nonascii_template(self):
         """
         Test passing a non-unicode template with non-ascii characters.
@@ -458,6 +473,333 @@ class RendererTests(unittest.TestCase, AssertStringMixin):
         self.assertEqual(renderer1.render('{{value}}', value=None), 'None')
         self.assertEqual(renderer2.render('{{value}}', value=None), '')
 
+    def test_render_iter(self):
+        """
+        Test that render_iter() yields pieces that join to render()'s output.
+
+        """
+        renderer = self._renderer()
+        template = 'Hi {{#people}}{{name}} {{/people}}!'
+        context = {'people': [{'name': 'Al'}, {'name': 'Bo'}]}
+
+        pieces = list(renderer.render_iter(template, context))
+        self.assertEqual(pieces, ['Hi ', 'Al ', 'Bo ', '!'])
+        self.assertEqual(''.join(pieces), renderer.render(template, context))
+
+    def test_render_iter__lazy(self):
+        """
+        Test that render_iter() renders as the iterator is consumed.
+
+        """
+        renderer = self._renderer()
+        calls = []
+
+        class View(object):
+            def first(self):
+                calls.append('first')
+                return 'a'
+            def second(self):
+                calls.append('second')
+                return 'b'
+
+        pieces = renderer.render_iter('{{first}}{{second}}', View())
+        self.assertEqual(calls, [])
+        self.assertEqual(pieces.next(), 'a')
+        self.assertEqual(calls, ['first'])
+        self.assertEqual(list(pieces), ['b'])
+
+    def test_render_iter__object(self):
+        """
+        Test that render_iter() accepts an object, like render().
+
+        """
+        renderer = self._renderer()
+        pieces = renderer.render_iter(SayHello())
+        self.assertEqual(''.join(pieces), 'Hello, World')
+
+    def test_render_many(self):
+        """
+        Test that render_many() renders each context in order.
+
+        """
+        renderer = self._renderer()
+        template = 'Hi {{name}}{{#items}}, {{.}}{{/items}}'
+        contexts = [{'name': 'Al', 'items': [1, 2]}, None,
+                    ContextStack({'name': 'Bo'}), {'name': 'Cy'}]
+
+        actual = list(renderer.render_many(template, contexts))
+        expected = [renderer.render(template, context) for context in contexts]
+        self.assertEqual(actual, ['Hi Al, 1, 2', 'Hi ', 'Hi Bo', 'Hi Cy'])
+        self.assertEqual(actual, expected)
+
+    def test_render_many__lazy(self):
+        """
+        Test that render_many() accepts and returns iterators.
+
+        """
+        renderer = self._renderer()
+        contexts = ({'n': n} for n in xrange(1000000))
+
+        results = renderer.render_many('{{n}}', contexts)
+        self.assertEqual(results.next(), '0')
+        self.assertEqual(results.next(), '1')
+
+    def test_render_many__object(self):
+        """
+        Test that render_many() puts an object template below each context.
+
+        """
+        renderer = self._renderer()
+        actual = list(renderer.render_many(SayHello(), [{}, {'to': 'Mars'}]))
+        self.assertEqual(actual, ['Hello, World', 'Hello, Mars'])
+
+    def test_render_bytes(self):
+        """
+        Test that render_bytes() returns the encoded rendering.
+
+        """
+        renderer = Renderer(partials={'p': u'({{name}})'})
+        template = (u"caf\xe9 {{name}} {{{name}}} {{#items}}[{{.}}]{{/items}}"
+                    u"{{^none}}none{{/none}} {{>p}} {{#lambda}}x{{/lambda}}")
+        context = {'name': u'<\u2603>', 'items': [1, 2], 'none': [],
+                   'lambda': lambda text: text + u'\xe9'}
+
+        actual = renderer.render_bytes(template, context)
+        expected = renderer.render(template, context).encode('utf-8')
+        self.assertEqual(type(actual), type(expected))
+        self.assertEqual(actual, expected)
+
+        actual = renderer.render_bytes(template, context, encoding='utf-16-le')
+        self.assertEqual(actual.decode('utf-16-le'), renderer.render(template, context))
+
+    def test_render_bytes__byte_order_mark(self):
+        """
+        Test that encodings that add a byte order mark are rejected.
+
+        """
+        renderer = Renderer()
+        self.assertRaises(Exception, renderer.render_bytes, u'a{{b}}', encoding='utf-16')
+
+    def test_render_bytes__chunks(self):
+        renderer = Renderer()
+        actual = renderer.render_bytes(u'a{{b}}c', {'b': 'B'}, chunks=True)
+        self.assertEqual(actual, [u'a'.encode('ascii'), u'B'.encode('ascii'),
+                                  u'c'.encode('ascii')])
+
+    def test_render_bytes__literals_encoded_once(self):
+        """
+        Test that a ParsedTemplate's literals are encoded only once.
+
+        """
+        renderer = Renderer()
+        parsed = parse(u'caf\xe9 {{name}}')
+
+        first = renderer.render_bytes(parsed, {'name': 'Al'}, chunks=True)
+        second = renderer.render_bytes(parsed, {'name': 'Bo'}, chunks=True)
+        self.assertEqual(first[0], u'caf\xe9 '.encode('utf-8'))
+        self.assertTrue(second[0] is first[0])
+
+    def test_render_bytes__byte_string_passthrough(self):
+        """
+        Test that byte strings in the output encoding are not re-encoded.
+
+        """
+        renderer = Renderer(string_encoding='utf-8')
+        value = u'caf\xe9'.encode('utf-8')
+
+        for template in (u'{{name}}', u'{{{name}}}'):
+            actual = renderer.render_bytes(template, {'name': value}, chunks=True)
+            self.assertTrue(actual[0] is value)
+
+        # Byte strings that need escaping are still escaped.
+        value = u'<caf\xe9>'.encode('utf-8')
+        actual = renderer.render_bytes(u'{{name}}', {'name': value})
+        self.assertEqual(actual, u'&lt;caf\xe9&gt;'.encode('utf-8'))
+
+    def test_render_bytes__byte_string_other_encoding(self):
+        """
+        Test that byte strings in another encoding are converted.
+
+        """
+        renderer = Renderer(string_encoding='latin-1')
+        value = u'caf\xe9'.encode('latin-1')
+        actual = renderer.render_bytes(u'{{name}} {{{name}}}', {'name': value})
+        self.assertEqual(actual, u'caf\xe9 caf\xe9'.encode('utf-8'))
+
+    def test_render_bytes__custom_escape(self):
+        renderer = Renderer(string_encoding='utf-8', escape=lambda u: u.upper())
+        actual = renderer.render_bytes(u'{{name}}', {'name': u'al'.encode('utf-8')})
+        self.assertEqual(actual, u'AL'.encode('utf-8'))
+
+    def test_pickle(self):
+        """
+        Test that instances can be pickled, e.g. to send to another process.
+
+        """
+        renderer = Renderer(partials={'p': 'Hi {{name}}'}, missing_tags='strict')
+        renderer = pickle.loads(pickle.dumps(renderer, pickle.HIGHEST_PROTOCOL))
+
+        self.assertEqual(renderer.render('<{{>p}}>', name='Al'), '<Hi Al>')
+        self.assertEqual(renderer.missing_tags, 'strict')
+        self.assertTrue(renderer.context is None)
+
+    def test_context__cleared_after_render(self):
+        """
+        Test that the context property does not outlive the render.
+
+        """
+        renderer = Renderer()
+        seen = []
+
+        class View(object):
+            def name(self):
+                seen.append(renderer.context.get('greeting'))
+                return 'world'
+
+        actual = renderer.render('{{greeting}}, {{name}}', View(), greeting='hello')
+        self.assertEqual(actual, 'hello, world')
+        self.assertEqual(seen, ['hello'])
+        self.assertTrue(renderer.context is None)
+
+    def test_render__shared_across_threads(self):
+        """
+        Test that concurrent renders on one instance do not share a context.
+
+        """
+        renderer = Renderer()
+        errors = []
+
+        class View(object):
+            def __init__(self, number):
+                self.number = number
+            def check(self):
+                # Give the other threads a chance to run mid-render.
+                time.sleep(0.001)
+                return renderer.context.get('number') == self.number
+
+        def run(number):
+            for i in range(20):
+                actual = renderer.render('{{#check}}ok{{/check}}', View(number))
+                if actual != 'ok':
+                    errors.append(number)
+
+        threads = [threading.Thread(target=run, args=(n, )) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+
+class _ThreadExecutor(object):
+
+    """
+    A minimal executor that runs each submitted call in a new thread.
+
+    """
+
+    class _Future(object):
+
+        def __init__(self, func, args):
+            self._result = None
+            self._thread = threading.Thread(target=self._run, args=(func, args))
+            self._thread.start()
+
+        def _run(self, func, args):
+            self._result = func(*args)
+
+        def result(self):
+            self._thread.join()
+            return self._result
+
+    def submit(self, func, *args):
+        return self._Future(func, args)
+
+
+class RendererPrefetchTests(unittest.TestCase):
+
+    """Tests rendering with the prefetch_executor option."""
+
+    def _view(self, calls):
+
+        class View(object):
+            def _call(self, name):
+                time.sleep(0.1)
+                calls.append(name)
+                return name.upper()
+            def a(self):
+                return self._call('a')
+            def b(self):
+                return self._call('b')
+            def c(self):
+                return self._call('c')
+
+        return View()
+
+    def test_prefetch__concurrent(self):
+        """
+        Test that context methods are called concurrently before rendering.
+
+        """
+        calls = []
+        renderer = Renderer(prefetch_executor=_ThreadExecutor())
+        start = time.time()
+        actual = renderer.render('{{a}} {{#b}}{{c}}{{/b}} {{a}}', self._view(calls))
+        elapsed = time.time() - start
+
+        self.assertEqual(actual, 'A C A')
+        self.assertEqual(sorted(calls), ['a', 'b', 'c'])
+        self.assertTrue(elapsed < 0.25, elapsed)
+
+    def test_prefetch__shadowing(self):
+        """
+        Test that section items still take precedence over prefetched values.
+
+        """
+        renderer = Renderer(prefetch_executor=_ThreadExecutor())
+        template = '{{name}}:{{#items}}{{name}},{{/items}}{{#other}}{{name}}{{/other}}'
+        context = {'name': 'top', 'items': [{'name': 'x'}, {}], 'other': {'name': 'y'}}
+
+        actual = renderer.render(template, context)
+        self.assertEqual(actual, 'top:x,top,y')
+
+    def test_prefetch__missing_and_dotted_names(self):
+        renderer = Renderer(prefetch_executor=_ThreadExecutor())
+        template = '[{{missing}}][{{person.name}}][{{person.missing}}]'
+
+        actual = renderer.render(template, person={'name': 'Al'})
+        self.assertEqual(actual, '[][Al][]')
+
+    def test_prefetch__implicit_iterator(self):
+        """
+        Test that the current item is the context rather than the values
+        prefetched.
+
+        """
+        renderer = Renderer(prefetch_executor=_ThreadExecutor())
+        template = u'{{.}}|{{#.}}x{{/.}}{{^.}}y{{/.}}|{{#items}}{{.}}{{/items}}'
+
+        self.assertEqual(renderer.render(template, {'items': [1, 2]}, 'ctx'), u'ctx|x|12')
+        self.assertEqual(renderer.render(template, 0), u'0|y|')
+        self.assertEqual(renderer.render(u'{{.}}{{a}}'), u'')
+        self.assertEqual(renderer.render_tracked(template, {'items': [1]}, 'ctx').output,
+                         u'ctx|x|1')
+
+    def test_prefetch__context_property(self):
+        """
+        Test that the current context is available to prefetched methods.
+
+        """
+        renderer = Renderer(prefetch_executor=_ThreadExecutor())
+
+        class View(object):
+            def greeting(self):
+                return renderer.context.get('name')
+
+        actual = renderer.render('{{greeting}}', View(), name='Al')
+        self.assertEqual(actual, 'Al')
+
 
 # By testing that Renderer.render() constructs the right RenderEngine,
 # we no longer need to exercise all rendering code paths through
@@ -656,6 +998,55 @@ class Renderer_MakeRenderEngineTests(unittest.TestCase, AssertStringMixin, Asser
         self.assertEqual(escape(u"foo"), unicode.__name__)
         self.assertEqual(escape(MyUnicode("foo")), MyUnicode.__name__)
 
+    def test__escape__default__cached(self):
+        """
+        Test that the default escape function's return values are cached.
+
+        """
+        engine = Renderer()._make_render_engine()
+
+        first = engine.escape(u'<b>')
+        self.assertEqual(first, u'&lt;b&gt;')
+        self.assertTrue(engine.escape(u'<b>') is first)
+
+    def test__escape__custom__not_cached(self):
+        """
+        Test that a custom escape function is called for every string.
+
+        """
+        calls = []
+        def escape(u):
+            calls.append(u)
+            return u.upper()
+
+        engine = Renderer(escape=escape)._make_render_engine()
+
+        self.assertEqual(engine.escape(u'<b>'), u'<B>')
+        self.assertEqual(engine.escape(u'<b>'), u'<B>')
+        self.assertEqual(len(calls), 2)
+
+    def test__escape__safe(self):
+        """
+        Test that Safe strings are returned as is, without escaping.
+
+        """
+        for escape in (None, lambda u: u.upper()):
+            engine = Renderer(escape=escape)._make_render_engine()
+            safe = Safe(u'<b>')
+            self.assertTrue(engine.escape(safe) is safe)
+
+    def test__escape__html_method(self):
+        """
+        Test that strings with an __html__() method are not escaped.
+
+        """
+        class Markup(unicode):
+            def __html__(self):
+                return unicode(self)
+
+        engine = Renderer()._make_render_engine()
+        self.assertEqual(engine.escape(Markup(u'<b>')), u'<b>')
+
     def test__escape__returns_unicode(self):
         """
         Test that literal returns unicode (and not a subclass).
@@ -0,0 +1,111 @@
+# coding: utf-8
+
+"""
+Unit tests of specializer.py.
+
+"""
+
+import unittest
+
+from pystache.common import Safe
+from pystache.parser import parse
+from pystache.renderer import Renderer
+from pystache.specializer import specialize
+
+
+class SpecializeTests(unittest.TestCase):
+
+    def _assert_specialized(self, template, static, dynamic, expected_keys,
+                            renderer=None):
+        """
+        Assert that specializing gives the same rendering as rendering
+        with the static and dynamic contexts together.
+
+        """
+        if renderer is None:
+            renderer = Renderer()
+        residual = specialize(parse(template), static, renderer)
+
+        self.assertEqual(residual.get_keys(), expected_keys)
+        expected = renderer.render(template, static, dynamic)
+        self.assertEqual(renderer.render(residual, dynamic), expected)
+
+        return residual
+
+    def test_variables(self):
+        residual = self._assert_specialized(u'{{site}} {{{html}}} {{a.b}} {{user}} {{n}}',
+                                            {'site': 'S&P', 'html': '<b>', 'a': {'b': 1},
+                                             'n': 0},
+                                            {'user': 'Al'}, ['user'])
+        self.assertEqual(residual._parse_tree[0], u'S&amp;P <b> 1 ')
+
+    def test_variables__safe(self):
+        residual = self._assert_specialized(u'{{html}} {{user}}', {'html': Safe(u'<b>')},
+                                            {'user': 'Al'}, ['user'])
+        self.assertTrue(type(residual._parse_tree[0]) is unicode)
+
+    def test_sections(self):
+        template = (u'{{#beta}}B{{/beta}}{{#off}}X{{/off}}{{^off}}not off{{/off}}'
+                    u'{{#links}}<a href="{{url}}">{{user}}</a>{{/links}}')
+        static = {'beta': True, 'off': False, 'links': [{'url': '/a'}, {'url': '/b'}]}
+        self._assert_specialized(template, static, {'user': 'Al'}, ['user'])
+
+    def test_dynamic_section(self):
+        """
+        Test that static names are evaluated inside per-request sections.
+
+        """
+        template = u'{{#items}}{{site}}:{{name}}{{^done}}{{todo}}{{/done}} {{/items}}'
+        static = {'site': 'S', 'todo': 'T'}
+        dynamic = {'items': [{'name': 'a', 'done': True}, {'name': 'b'}]}
+        self._assert_specialized(template, static, dynamic, ['items', 'name', 'done'])
+
+    def test_section_and_inverted(self):
+        template = u'{{#beta}}b{{/beta}}{{^beta}}-{{/beta}} {{#items}}{{.}}{{/items}}{{^items}}none{{/items}}'
+        residual = self._assert_specialized(template, {'beta': False}, {'items': [1, 2]},
+                                            ['items', '.'])
+        self.assertEqual(residual._parse_tree[0], u'- ')
+        self.assertEqual(Renderer().render(residual, {'items': []}), u'- none')
+
+    def test_dot(self):
+        template = u'{{#tags}}{{.}},{{/tags}}{{#items}}{{.}}{{/items}}'
+        self._assert_specialized(template, {'tags': ['x', 'y']}, {'items': [1, 2]},
+                                 ['items', '.'])
+
+    def test_partials(self):
+        renderer = Renderer(partials={'head': u'  <title>{{site}}</title>\n',
+                                      'user': u'{{user}}'})
+        template = u'<head>\n  {{>head}}</head>{{>user}}'
+        self._assert_specialized(template, {'site': 'S'}, {'user': 'Al'}, ['user'],
+                                 renderer=renderer)
+
+    def test_recursive_partial(self):
+        renderer = Renderer(partials={'node': u'{{name}}({{#kids}}{{>node}}{{/kids}})'})
+        template = u'{{>node}}'
+        residual = specialize(template, {'site': 'S'}, renderer)
+
+        context = {'name': 'a', 'kids': [{'name': 'b', 'kids': []}]}
+        self.assertEqual(renderer.render(residual, context), u'a(b())')
+
+    def test_lambda_kept(self):
+        template = u'{{greet}} {{#wrap}}{{user}}{{/wrap}}'
+        static = {'greet': lambda: u'Hi', 'wrap': lambda text: u'<' + text + u'>'}
+        residual = specialize(template, static)
+
+        self.assertEqual(residual.get_keys(), ['greet', 'wrap', 'user'])
+        self.assertEqual(Renderer().render(residual, static, {'user': 'Al'}), u'Hi <Al>')
+
+    def test_no_static_context(self):
+        self._assert_specialized(u'{{a}}{{#b}}{{.}}{{/b}}', None, {'a': 1, 'b': [2]},
+                                 ['a', 'b', '.'])
+
+    def test_dot__top_level(self):
+        """
+        Test that "." outside sections over static data is left for the
+        per-request context.
+
+        """
+        template = u'{{.}}|{{#.}}a{{/.}}{{^.}}b{{/.}}'
+        residual = self._assert_specialized(template, {}, 'x', ['.'])
+        self.assertEqual(Renderer().render(residual, 0), u'0|b')
+        self._assert_specialized(template, {'site': 'S'}, 0, ['.'])
@@ -0,0 +1,134 @@
+# coding: utf-8
+
+"""
+Unit tests of tables.py.
+
+"""
+
+import array
+import unittest
+
+from pystache.common import PystacheError
+from pystache.compiler import compile
+from pystache.renderer import Renderer
+from pystache.specializer import specialize
+from pystache.tables import ColumnTable, RowTable
+
+
+class FakeDtype(object):
+
+    def __init__(self, names):
+        self.names = names
+
+
+class FakeStructuredArray(object):
+
+    """
+    Imitates a NumPy structured array, whose truth value is ambiguous.
+
+    """
+
+    def __init__(self, **fields):
+        self.dtype = FakeDtype(tuple(sorted(fields)))
+        self._fields = fields
+
+    def __len__(self):
+        return len(self._fields[self.dtype.names[0]])
+
+    def _get_truth_value(self):
+        raise ValueError("The truth value of an array is ambiguous.")
+
+    # The first is for Python 2, and the second for Python 3.
+    __nonzero__ = _get_truth_value
+    __bool__ = _get_truth_value
+
+    def __getitem__(self, name):
+        return self._fields[name]
+
+    def __iter__(self):
+        raise Exception("Rows should not be iterated.")
+
+
+class TableTests(unittest.TestCase):
+
+    def _render(self, template, context):
+        return Renderer().render(template, context)
+
+    def test_column_table(self):
+        table = ColumnTable({'name': ['a', 'b&'], 'n': array.array('i', [1, 2])})
+        self.assertEqual(len(table), 2)
+        actual = self._render(u'{{#rows}}{{name}}={{n}}{{sep}}{{/rows}}',
+                              {'rows': table, 'sep': ';', 'n': 0})
+        self.assertEqual(actual, u'a=1;b&amp;=2;')
+
+    def test_column_table__lazy(self):
+        """
+        Test that only the columns a template references are converted.
+
+        """
+        table = ColumnTable({'a': [1], 'b': [2]})
+        self._render(u'{{#rows}}{{a}}{{/rows}}', {'rows': table})
+        self.assertEqual(list(table._lists.keys()), ['a'])
+
+    def test_column_table__lengths(self):
+        self.assertRaises(PystacheError, ColumnTable, {'a': [1, 2], 'b': [1]})
+
+    def test_column_table__empty(self):
+        table = ColumnTable({'a': []})
+        actual = self._render(u'{{#rows}}x{{/rows}}{{^rows}}none{{/rows}}', {'rows': table})
+        self.assertEqual(actual, u'none')
+
+    def test_row_table(self):
+        table = RowTable([('a', 1), ('b', 2)], ['name', 'n'])
+        actual = self._render(u'{{#rows}}{{name}}{{n}}{{other}}{{/rows}}',
+                              {'rows': table, 'other': '.'})
+        self.assertEqual(actual, u'a1.b2.')
+
+    def test_nested(self):
+        table = ColumnTable({'name': ['a', 'b'], 'tags': [['x'], []],
+                             'user': [{'id': 1}, {'id': 2}]})
+        actual = self._render(u'{{#rows}}{{user.id}}{{#tags}}{{.}}{{name}}{{/tags}};{{/rows}}',
+                              {'rows': table})
+        self.assertEqual(actual, u'1xa;2;')
+
+    def test_structured_array(self):
+        data = FakeStructuredArray(name=['a', 'b'], n=[1, 2])
+        actual = self._render(u'{{#rows}}{{name}}{{n}}{{/rows}}', {'rows': data})
+        self.assertEqual(actual, u'a1b2')
+
+    def test_structured_array__inverted(self):
+        """
+        Test that structured arrays are coerced before any truth test.
+
+        """
+        data = FakeStructuredArray(name=['a', 'b'])
+        empty = FakeStructuredArray(name=[])
+        template = u'{{#rows}}{{name}}{{/rows}}{{^rows}}none{{/rows}}'
+        self.assertEqual(self._render(template, {'rows': data}), u'ab')
+        self.assertEqual(self._render(template, {'rows': empty}), u'none')
+        self.assertEqual(self._render(u'{{^rows}}none{{/rows}}', {'rows': data}), u'')
+        self.assertEqual(Renderer().render_bytes(template, {'rows': empty}),
+                         u'none'.encode('ascii'))
+        residual = specialize(u'{{^rows}}none{{/rows}}', {'rows': empty})
+        self.assertEqual(Renderer().render(residual), u'none')
+
+    def test_structured_array__compiled(self):
+        renderer = Renderer(jit_threshold=0)
+        data = FakeStructuredArray(name=['a', 'b'])
+        empty = FakeStructuredArray(name=[])
+        for template in [u'{{#rows}}{{name}}{{/rows}}{{^rows}}none{{/rows}}.',
+                         u'{{^rows}}none{{/rows}}.']:
+            parsed = renderer._parse(template)
+            for i in range(3):
+                self.assertEqual(renderer.render(parsed, {'rows': empty}), u'none.')
+                renderer.render(parsed, {'rows': data})
+        self.assertTrue(parsed._jit.render is not None)
+
+        compiled = compile(u'{{#rows}}{{name}}{{/rows}}{{^rows}}none{{/rows}}', {'rows': None})
+        self.assertEqual(compiled.render({'rows': data}), u'ab')
+        self.assertEqual(compiled.render({'rows': empty}), u'none')
+
+    def test_specialize(self):
+        residual = specialize(u'{{#rows}}{{name}}{{user}}{{/rows}}',
+                              {'rows': ColumnTable({'name': ['a', 'b']})})
+        self.assertEqual(Renderer().render(residual, {'user': '!'}), u'a!b!')
@@ -0,0 +1,231 @@
+# coding: utf-8
+
+"""
+Unit tests of tracking.py and Renderer.render_tracked().
+
+"""
+
+import unittest
+
+from pystache.fragments import MemoryCache
+from pystache.parser import parse
+from pystache.renderer import Renderer
+
+
+class RenderTrackedTests(unittest.TestCase):
+
+    def _render(self, template, context, renderer=None):
+        if renderer is None:
+            renderer = Renderer()
+        return renderer.render_tracked(template, context)
+
+    def test_output(self):
+        result = self._render(u'Hi {{name}}', {'name': 'Al'})
+        self.assertEqual(result.output, u'Hi Al')
+
+    def test_dependencies(self):
+        template = u'{{title}}{{#items}}{{name}}{{/items}}{{^empty}}-{{/empty}}{{a.b}}'
+        context = {'title': 'T', 'items': [{'name': 'x'}, {'name': 'y'}],
+                   'empty': [], 'a': {'b': 1}}
+        result = self._render(template, context)
+
+        self.assertEqual(result.dependencies,
+                         [('title', 'T'), ('items', context['items']), ('name', 'x'),
+                          ('name', 'y'), ('empty', []), ('a.b', 1)])
+        self.assertEqual(result.get_names(), ['title', 'items', 'name', 'empty', 'a.b'])
+
+    def test_partials(self):
+        renderer = Renderer(partials={'p': u'({{name}})'})
+        result = self._render(u'{{>p}}{{>p}}', {'name': 'Al'}, renderer)
+
+        self.assertEqual(result.output, u'(Al)(Al)')
+        self.assertEqual(result.partials, {'p': u'({{name}})'})
+
+    def test_fingerprint__stable(self):
+        template = u'{{#items}}{{name}}{{/items}}'
+        first = self._render(template, {'items': [{'name': 'x'}]})
+        second = self._render(template, {'items': [{'name': 'x'}]})
+        self.assertEqual(first.fingerprint, second.fingerprint)
+
+        second = self._render(parse(template), {'items': [{'name': 'x'}]})
+        self.assertEqual(first.fingerprint, second.fingerprint)
+
+    def test_fingerprint__changes(self):
+        template = u'{{#items}}{{name}}{{/items}}'
+        fingerprint = self._render(template, {'items': [{'name': 'x'}]}).fingerprint
+
+        contexts = [{'items': [{'name': 'y'}]},
+                    {'items': [{'name': 'x'}, {'name': 'x'}]},
+                    {'items': [{'name': 'x', 'other': 1}]}]
+        fingerprints = [self._render(template, context).fingerprint for context in contexts]
+
+        self.assertNotEqual(fingerprints[0], fingerprint)
+        self.assertNotEqual(fingerprints[1], fingerprint)
+        # The fingerprint only depends on the values that the render used.
+        self.assertEqual(fingerprints[2], fingerprint)
+
+        other = self._render(u'<{{#items}}{{name}}{{/items}}>', {'items': [{'name': 'x'}]})
+        self.assertNotEqual(other.fingerprint, fingerprint)
+
+    def test_fingerprint__interpolated_containers(self):
+        """
+        Test that the fingerprint covers lists and dictionaries rendered as
+        strings.
+
+        """
+        for template, contexts in [(u'{{items}}', [{'items': [1, 2]}, {'items': [3, 4]}]),
+                                   (u'{{#p}}{{.}}{{/p}}', [{'p': {'a': 1}}, {'p': {'a': 2}}])]:
+            first, second = [self._render(template, context) for context in contexts]
+            self.assertNotEqual(first.output, second.output)
+            self.assertNotEqual(first.fingerprint, second.fingerprint)
+
+    def test_fingerprint__objects(self):
+        class Person(object):
+            def __init__(self, name):
+                self._name = name
+
+            def name(self):
+                return self._name
+
+        template = u'{{#person}}{{name}}{{/person}}'
+        first = self._render(template, {'person': Person('Al')})
+        second = self._render(template, {'person': Person('Al')})
+        third = self._render(template, {'person': Person('Bo')})
+
+        self.assertEqual(first.fingerprint, second.fingerprint)
+        self.assertNotEqual(first.fingerprint, third.fingerprint)
+
+    def test_fragment_cache_not_used(self):
+        """
+        Test that cached sections still record their dependencies.
+
+        """
+        renderer = Renderer(fragment_cache=MemoryCache(), cached_sections=['nav'])
+        template = u'{{#nav}}{{title}}{{/nav}}'
+
+        first = self._render(template, {'nav': {'title': 'a'}}, renderer)
+        second = self._render(template, {'nav': {'title': 'a'}}, renderer)
+        self.assertEqual(second.get_names(), ['nav', 'title'])
+        self.assertEqual(first.fingerprint, second.fingerprint)
+
+
+class RerenderTests(unittest.TestCase):
+
+    def _spy_renderer(self):
+        """
+        Return a renderer and a list to which its str_coerce() appends
+        each value it renders.
+
+        """
+        rendered = []
+
+        class SpyRenderer(Renderer):
+            def str_coerce(self, val):
+                rendered.append(val)
+                return str(val)
+
+        return SpyRenderer(), rendered
+
+    def test_rerender(self):
+        renderer, rendered = self._spy_renderer()
+        template = u'<h1>{{title}}</h1><ul>{{#items}}<li>{{n}}</li>{{/items}}</ul>{{count}}'
+
+        first = renderer.render_tracked(template, {'title': 'T', 'items': [{'n': 1}], 'count': 1})
+        self.assertEqual(first.changed, [(0, len(first.output))])
+        del rendered[:]
+
+        second = renderer.rerender(first, {'title': 'T', 'items': [{'n': 1}], 'count': 22})
+        self.assertEqual(second.output, u'<h1>T</h1><ul><li>1</li></ul>22')
+        # Only the count was rendered again.
+        self.assertEqual(rendered, [22])
+        start = second.output.index(u'22')
+        self.assertEqual(second.changed, [(start, start + 2)])
+
+        third = renderer.rerender(second, {'title': 'T', 'items': [{'n': 1}, {'n': 2}],
+                                           'count': 22})
+        self.assertEqual(third.output, u'<h1>T</h1><ul><li>1</li><li>2</li></ul>22')
+        start = third.output.index(u'<li>')
+        self.assertEqual(third.changed, [(start, start + len(u'<li>1</li><li>2</li>'))])
+
+    def test_rerender__same_output_not_changed(self):
+        """
+        Test that a tag rendered again with the same output is not reported.
+
+        """
+        renderer = Renderer()
+        first = renderer.render_tracked(u'{{#a}}x{{/a}}', {'a': True})
+        second = renderer.rerender(first, {'a': 1})
+        self.assertEqual(second.output, u'x')
+        self.assertEqual(second.changed, [])
+
+    def test_rerender__dependencies_and_fingerprint(self):
+        """
+        Test that a rerender gives the same result as a tracked render.
+
+        """
+        renderer = Renderer(partials={'p': u'{{b}}'})
+        template = u'{{a}}{{>p}}{{c}}'
+
+        first = renderer.render_tracked(template, {'a': 1, 'b': 2, 'c': 3})
+        second = renderer.rerender(first, {'a': 1, 'b': 2, 'c': 4})
+        expected = renderer.render_tracked(template, {'a': 1, 'b': 2, 'c': 4})
+
+        self.assertEqual(second.dependencies, expected.dependencies)
+        self.assertEqual(second.partials, expected.partials)
+        self.assertEqual(second.fingerprint, expected.fingerprint)
+
+    def test_rerender__outer_name_in_section(self):
+        renderer = Renderer()
+        template = u'{{#items}}{{.}}{{sep}}{{/items}}'
+
+        first = renderer.render_tracked(template, {'items': [1, 2], 'sep': ','})
+        second = renderer.rerender(first, {'items': [1, 2], 'sep': ';'})
+        self.assertEqual(second.output, u'1;2;')
+
+    def test_rerender__parent_tags(self):
+        """
+        Test rerendering an unflattened template with a parent tag.
+
+        """
+        renderer = Renderer(partials={'layout': u'<h1>{{title}}</h1>'})
+        template = parse(u'{{<layout}}{{/layout}}x')
+
+        first = renderer.render_tracked(template, {'title': 'A'})
+        second = renderer.rerender(first, {'title': 'B'})
+        self.assertEqual(second.output, u'<h1>B</h1>x')
+        self.assertEqual(second.changed, [(0, 10)])
+
+    def test_methods_called_once(self):
+        """
+        Test that tracking does not call view methods a second time.
+
+        """
+        calls = []
+
+        class View(object):
+            def title(self):
+                calls.append('title')
+                return 'T'
+
+        renderer = Renderer()
+        first = renderer.render_tracked(u'{{title}}{{#title}}!{{/title}}', View())
+        self.assertEqual(first.output, u'T!')
+        self.assertEqual(calls, ['title', 'title'])
+
+        del calls[:]
+        second = renderer.rerender(first, View())
+        self.assertEqual(second.output, u'T!')
+        self.assertEqual(calls, ['title', 'title'])
+
+    def test_rerender__objects_rendered_again(self):
+        class Person(object):
+            def __init__(self, name):
+                self.name = name
+
+        renderer = Renderer()
+        template = u'{{#person}}{{name}}{{/person}}'
+
+        first = renderer.render_tracked(template, {'person': Person('Al')})
+        second = renderer.rerender(first, {'person': Person('Bo')})
+        self.assertEqual(second.output, u'Bo')
+        self.assertEqual(second.changed, [(0, 2)])
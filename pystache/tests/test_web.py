@@ -0,0 +1,170 @@
+# coding: utf-8
+
+"""
+Unit tests of web.py.
+
+"""
+
+import httplib
+import threading
+import unittest
+from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+from pystache.asyncrender import asyncio
+from pystache.tests.test_asyncrender import AsyncTestCase
+from pystache.web import iter_chunks, TemplateResponse
+
+
+def _b(u):
+    return u.encode('utf-8')
+
+
+class _QuietHandler(WSGIRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class IterChunksTests(unittest.TestCase):
+
+    def test_no_markers(self):
+        actual = list(iter_chunks([_b(u'a'), _b(u'b')], []))
+        self.assertEqual(actual, [_b(u'ab')])
+
+    def test_marker(self):
+        pieces = [_b(u'<head>'), _b(u'x</head><body>'), _b(u'y'), _b(u'</body>')]
+        actual = list(iter_chunks(pieces, [_b(u'</head>')]))
+        self.assertEqual(actual, [_b(u'<head>x</head>'), _b(u'<body>y</body>')])
+
+    def test_marker__repeated_in_piece(self):
+        actual = list(iter_chunks([_b(u'a|b|c')], [_b(u'|')]))
+        self.assertEqual(actual, [_b(u'a|'), _b(u'b|'), _b(u'c')])
+
+    def test_marker__at_end(self):
+        actual = list(iter_chunks([_b(u'a|'), _b(u'b|')], [_b(u'|')]))
+        self.assertEqual(actual, [_b(u'a|'), _b(u'b|')])
+
+
+class WSGITests(unittest.TestCase):
+
+    """Tests TemplateResponse.wsgi() using a local wsgiref server."""
+
+    def _request(self, response, headers=None):
+        """
+        Serve the given response for one request, and return the
+        httplib.HTTPResponse instance for that request.
+
+        """
+        if headers is None:
+            headers = {}
+        server = make_server('127.0.0.1', 0, response.wsgi, handler_class=_QuietHandler)
+        self.addCleanup(server.server_close)
+
+        thread = threading.Thread(target=server.handle_request)
+        thread.start()
+        self.addCleanup(thread.join)
+
+        connection = httplib.HTTPConnection('127.0.0.1', server.server_port, timeout=10)
+        self.addCleanup(connection.close)
+        connection.request('GET', '/', headers=headers)
+
+        return connection.getresponse()
+
+    def test_buffered(self):
+        response = TemplateResponse(u'Hi {{name}}', {'name': u'☃'})
+        http_response = self._request(response)
+
+        body = http_response.read()
+        self.assertEqual(http_response.status, 200)
+        self.assertEqual(body, _b(u'Hi ☃'))
+        self.assertEqual(http_response.getheader('Content-Length'), str(len(body)))
+        self.assertEqual(http_response.getheader('Content-Type'), 'text/html; charset=utf-8')
+        self.assertTrue(http_response.getheader('ETag'))
+
+    def test_buffered__not_modified(self):
+        response = TemplateResponse(u'Hi {{name}}', {'name': 'Al'})
+        etag = self._request(response).getheader('ETag')
+
+        http_response = self._request(response, {'If-None-Match': etag})
+        self.assertEqual(http_response.status, 304)
+        self.assertEqual(http_response.read(), _b(u''))
+
+    def test_streaming(self):
+        """
+        Test that the output before a flush point is sent before the rest
+        is rendered.
+
+        """
+        released = threading.Event()
+        waited = []
+
+        def body():
+            waited.append(released.wait(10))
+            return 'body'
+
+        template = u'<head>{{title}}</head><p>{{body}}</p>'
+        response = TemplateResponse(template, {'title': 'T', 'body': body},
+                                    flush_after=['</head>'])
+        http_response = self._request(response)
+
+        head = _b(u'<head>T</head>')
+        self.assertEqual(http_response.read(len(head)), head)
+        self.assertEqual(waited, [])
+
+        released.set()
+        self.assertEqual(http_response.read(), _b(u'<p>body</p>'))
+        self.assertEqual(waited, [True])
+        self.assertEqual(http_response.getheader('Content-Length'), None)
+
+
+class ASGITests(AsyncTestCase):
+
+    """Tests TemplateResponse.asgi()."""
+
+    def _serve(self, response, headers=None):
+        if headers is None:
+            headers = []
+        messages = []
+
+        def send(message):
+            messages.append(message)
+            return asyncio.sleep(0)
+
+        scope = {'type': 'http', 'headers': headers}
+        self.loop.run_until_complete(response.asgi(scope, None, send))
+
+        return messages
+
+    def test_buffered(self):
+        messages = self._serve(TemplateResponse(u'Hi {{name}}', {'name': 'Al'}))
+
+        self.assertEqual(len(messages), 2)
+        start, body = messages
+        self.assertEqual(start['status'], 200)
+        headers = dict(start['headers'])
+        self.assertEqual(headers[_b(u'content-length')], _b(u'5'))
+        self.assertEqual(body['body'], _b(u'Hi Al'))
+        self.assertFalse(body['more_body'])
+
+        messages = self._serve(TemplateResponse(u'Hi {{name}}', {'name': 'Al'}),
+                               [(_b(u'if-none-match'), headers[_b(u'etag')])])
+        self.assertEqual(messages[0]['status'], 304)
+
+    def test_streaming(self):
+        response = TemplateResponse(u'<head></head>{{#items}}<p>{{.}}</p>{{/items}}',
+                                    {'items': [1, 2]}, flush_after=['</head>', '</p>'],
+                                    status=404)
+        messages = self._serve(response)
+
+        self.assertEqual(messages[0]['status'], 404)
+        bodies = [message['body'] for message in messages[1:]]
+        self.assertEqual(bodies, [_b(u'<head></head>'), _b(u'<p>1</p>'), _b(u'<p>2</p>'), _b(u'')])
+        self.assertFalse(messages[-1]['more_body'])
+
+    def test_streaming__exception(self):
+        def fail():
+            raise ValueError('foo')
+
+        response = TemplateResponse(u'<head></head>{{fail}}', {'fail': fail},
+                                    flush_after=['</head>'])
+        self.assertRaises(ValueError, self._serve, response)
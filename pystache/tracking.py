@@ -0,0 +1,345 @@
+# coding: utf-8
+
+"""
+Provides the dependency tracking behind Renderer.render_tracked().
+
+A tracked render records each name it resolves against the context stack
+(for variable tags and sections alike), the value it found, the string
+that each value interpolated as is (i.e. not a string) converted to, and
+each partial it loads.  It then computes a fingerprint from the template,
+the partials, and those values and strings.  Two renders with the same fingerprint have
+the same output, so a fingerprint can serve as an HTTP ETag, or to tell
+whether a cached page is stale, without comparing renderings.
+
+A tracked render also records the range of the output that each top-level
+tag produced, with a digest of the values the tag depends on.  This lets
+Renderer.rerender() reuse the output of the tags whose values did not
+change, and report the ranges of the output that did change.
+
+"""
+
+from pystache.context import _BUILTIN_MODULE, _get_value, _NOT_FOUND, RowCursor
+from pystache.fragments import digest, get_sources, _SCALAR_TYPES
+
+
+class _UserCode(Exception):
+
+    """Raised when resolving a name would call user code."""
+
+    pass
+
+
+def _get_data(item, part):
+    """
+    Return the value of a name in a context stack item or _NOT_FOUND,
+    without calling user code.
+
+    """
+    if isinstance(item, (dict, RowCursor)):
+        return _get_value(item, part)
+    if type(item).__module__ == _BUILTIN_MODULE:
+        return _NOT_FOUND
+    # Then the item is an object, and getting the attribute could call a
+    # method (e.g. of a view).
+    raise _UserCode()
+
+
+def _resolve_data(stack, name):
+    """
+    Resolve a name against a context stack as ContextStack.get() does, but
+    raising _UserCode instead of calling user code.
+
+    Returns _NOT_FOUND if the name is missing.
+
+    """
+    items = stack._stack
+    if name == '.':
+        try:
+            return stack.top()
+        except IndexError:
+            return _NOT_FOUND
+
+    parts = name.split('.')
+    for item in reversed(items):
+        value = _get_data(item, parts[0])
+        if value is not _NOT_FOUND:
+            break
+    else:
+        return _NOT_FOUND
+
+    for part in parts[1:]:
+        value = _get_data(value, part)
+        if value is _NOT_FOUND:
+            break
+    return value
+
+
+def _summarize(value):
+    """
+    Return a digestible summary of a resolved value.
+
+    Containers and objects are summarized by their type and size rather
+    than by their contents, since the rendering process resolves the
+    parts of them that it uses, and those are recorded separately.
+
+    """
+    if type(value) in _SCALAR_TYPES:
+        return value
+    if isinstance(value, (list, tuple)):
+        return ('list', len(value))
+    if isinstance(value, dict):
+        return ('dict', len(value))
+    if callable(value):
+        return ('callable', )
+    return ('object', type(value).__name__, bool(value))
+
+
+class Fragment(object):
+
+    """
+    The part of a tracked rendering produced by one top-level tag.
+
+    Attributes:
+
+      index: the index of the tag in the parsed template.
+
+      start, end: the range of the output that the tag produced.
+
+      key: a digest of the values that the tag depends on, or None if
+        the values cannot be digested (see fragments.digest()).
+
+      dependencies: the (name, value) pairs that rendering the tag
+        resolved.
+
+      partials: the names of the partials that rendering the tag loaded.
+
+      strings: the strings that rendering the tag converted values to.
+
+    """
+
+    def __init__(self, index, start, end, key, dependencies, partials, strings):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.key = key
+        self.dependencies = dependencies
+        self.partials = partials
+        self.strings = strings
+
+    def __repr__(self):
+        return "%s(index=%d, start=%d, end=%d)" % (self.__class__.__name__, self.index,
+                                                   self.start, self.end)
+
+
+class RenderResult(object):
+
+    """
+    The result of a tracked render.
+
+    Attributes:
+
+      output: the rendering, as a unicode string.
+
+      dependencies: the list of (name, value) pairs resolved, in order.
+        A name is resolved each time it is used, so the list can contain
+        a name more than once, e.g. once per section item.
+
+      partials: a dictionary mapping the name of each partial loaded to
+        its template string.
+
+      fingerprint: a hex digest of the template, the partials, and the
+        resolved values.
+
+      fragments: the list of Fragment instances for the top-level tags.
+
+      changed: the list of (start, end) ranges of the output that differ
+        from the previous rendering, for a result of Renderer.rerender().
+        For a first rendering, the range of the whole output.
+
+      parsed: the ParsedTemplate instance rendered.
+
+      prefix: the tuple of context items that Renderer.rerender() puts
+        below the new context (e.g. the object of an object template).
+
+    """
+
+    def __init__(self, output, dependencies, partials, fingerprint, fragments,
+                 changed, parsed, prefix):
+        self.output = output
+        self.dependencies = dependencies
+        self.partials = partials
+        self.fingerprint = fingerprint
+        self.fragments = fragments
+        self.changed = changed
+        self.parsed = parsed
+        self.prefix = prefix
+
+    def __repr__(self):
+        return "%s(fingerprint=%s)" % (self.__class__.__name__, repr(self.fingerprint))
+
+    def get_names(self):
+        """
+        Return the names resolved, without duplicates and in order.
+
+        """
+        names = []
+        seen = set()
+        for name, value in self.dependencies:
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+        return names
+
+
+class Tracker(object):
+
+    """
+    Records the names and partials that a RenderEngine resolves.
+
+    """
+
+    def __init__(self, engine):
+        """
+        Wrap the resolve functions of the given engine to record what
+        they resolve.
+
+        Fragment caching is turned off for the engine, since a cached
+        section would not resolve the names it references.
+
+        """
+        self.dependencies = []
+        self.partials = {}
+        # The names of the partials loaded, in order and with repeats.
+        self.partial_names = []
+        # The strings that values converted to (e.g. the string a list
+        # interpolated as is renders as), which the summaries of the
+        # values resolved do not cover.
+        self.strings = []
+
+        resolve_context = engine.resolve_context
+        resolve_partial = engine.resolve_partial
+        to_str = engine.to_str
+        dependencies = self.dependencies
+        partials = self.partials
+        partial_names = self.partial_names
+        strings = self.strings
+
+        def track_context(stack, name):
+            value = resolve_context(stack, name)
+            dependencies.append((name, value))
+            return value
+
+        def track_str(value):
+            string = to_str(value)
+            strings.append(string)
+            return string
+
+        def track_partial(name):
+            template = resolve_partial(name)
+            partials[name] = template
+            partial_names.append(name)
+            return template
+
+        # Computing fragment keys should not count as using the partials.
+        self._resolve_partial = resolve_partial
+
+        engine.resolve_context = track_context
+        engine.resolve_partial = track_partial
+        engine.to_str = track_str
+        engine.fragments = None
+
+    def make_key(self, node, stack):
+        """
+        Return a digest of the values that rendering a node depends on, or
+        None if they cannot be digested.
+
+        The values are looked up without calling user code (e.g. the
+        methods of a view), so that rendering calls it only once.  A node
+        whose values would require calling user code has no key.
+
+        """
+        keys, partials = get_sources(node, self._resolve_partial)
+        values = []
+        try:
+            for key in keys:
+                value = _resolve_data(stack, key)
+                if value is _NOT_FOUND:
+                    values.append((key, ))
+                else:
+                    values.append((key, value))
+        except _UserCode:
+            return None
+
+        return digest(partials, values)
+
+    def reuse(self, fragment, previous):
+        """
+        Record the dependencies of a fragment of a previous result.
+
+        """
+        self.dependencies.extend(fragment.dependencies)
+        for name in fragment.partials:
+            self.partials[name] = previous.partials[name]
+        self.partial_names.extend(fragment.partials)
+        self.strings.extend(fragment.strings)
+
+    def render(self, engine, stack, parsed, prefix, previous=None):
+        """
+        Render a ParsedTemplate, and return a RenderResult.
+
+        Arguments:
+
+          previous: a RenderResult for the same ParsedTemplate whose
+            fragments to reuse where their keys match.
+
+        """
+        old_fragments = {}
+        if previous is not None:
+            for fragment in previous.fragments:
+                old_fragments[fragment.index] = fragment
+
+        pieces, fragments, changed = [], [], []
+        position = 0
+
+        for index, node in enumerate(parsed._parse_tree):
+            if type(node) is unicode:
+                pieces.append(node)
+                position += len(node)
+                continue
+
+            key = self.make_key(node, stack)
+            old = old_fragments.get(index)
+
+            if key is not None and old is not None and old.key == key:
+                output = previous.output[old.start:old.end]
+                dependencies, partial_names = old.dependencies, old.partials
+                strings = old.strings
+                self.reuse(old, previous)
+            else:
+                dependencies_start = len(self.dependencies)
+                partials_start = len(self.partial_names)
+                strings_start = len(self.strings)
+
+                output = node.render(engine, stack)
+
+                dependencies = self.dependencies[dependencies_start:]
+                partial_names = self.partial_names[partials_start:]
+                strings = self.strings[strings_start:]
+                if old is not None and output != previous.output[old.start:old.end]:
+                    changed.append((position, position + len(output)))
+
+            end = position + len(output)
+            fragments.append(Fragment(index, position, end, key, dependencies, partial_names,
+                                      strings))
+            pieces.append(output)
+            position = end
+
+        output = u''.join(pieces)
+        if previous is None and output:
+            changed = [(0, len(output))]
+
+        summaries = [(name, _summarize(value)) for name, value in self.dependencies]
+        fingerprint = digest(repr(parsed), self.partials, summaries, self.strings)
+
+        return RenderResult(output, self.dependencies, self.partials, fingerprint,
+                            fragments, changed, parsed, prefix)
@@ -0,0 +1,340 @@
+# coding: utf-8
+
+"""
+Exposes a TemplateResponse class to serve a rendering over WSGI or ASGI.
+
+A response either renders the whole page before sending it, in which
+case it adds Content-Length and ETag headers (and answers a matching
+If-None-Match request header with 304 Not Modified), or it streams the
+page in chunks that end at given flush points.  For example, to let the
+browser fetch the stylesheets and scripts in the head of a page while
+the body is still rendering:
+
+    response = TemplateResponse(template, context, flush_after=['</head>'])
+
+    # In a WSGI application:
+    return response.wsgi(environ, start_response)
+
+    # In an ASGI application:
+    await response.asgi(scope, receive, send)
+
+The ASGI support requires asyncio (Python 3.5 or later).
+
+"""
+
+try:
+    # The hashlib module is new in Python 2.5.
+    from hashlib import md5
+except ImportError:
+    from md5 import new as md5
+
+from httplib import responses
+
+from pystache.asyncrender import _AsyncIterator, _check_asyncio, _get_loop, asyncio
+from pystache.context import ContextStack
+from pystache.renderer import Renderer
+
+
+_EMPTY_BYTES = u''.encode('ascii')
+
+
+def _find_flush(piece, markers):
+    """
+    Return the index just after the first flush point in piece, or -1.
+
+    """
+    end = -1
+    for marker in markers:
+        index = piece.find(marker)
+        if index < 0:
+            continue
+        index += len(marker)
+        if end < 0 or index < end:
+            end = index
+    return end
+
+
+def iter_chunks(pieces, markers):
+    """
+    Join byte string pieces into chunks that end at flush points.
+
+    Returns an iterator that yields a chunk whenever a piece contains one
+    of the given byte string markers.  The chunk ends just after the
+    marker.  The remaining pieces are yielded as a final chunk.
+
+    A marker is found only if it lies within a single piece.  For a
+    rendering, this means within a single stretch of literal template
+    text or a single tag value.
+
+    """
+    buffer = []
+    for piece in pieces:
+        end = _find_flush(piece, markers)
+        while end >= 0:
+            buffer.append(piece[:end])
+            yield _EMPTY_BYTES.join(buffer)
+            buffer = []
+            piece = piece[end:]
+            end = _find_flush(piece, markers)
+        if piece:
+            buffer.append(piece)
+    if buffer:
+        yield _EMPTY_BYTES.join(buffer)
+
+
+def _make_etag(body):
+    return '"%s"' % md5(body).hexdigest()
+
+
+def _is_etag_match(if_none_match, etag):
+    """
+    Return whether the value of an If-None-Match header matches an ETag.
+
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison.
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == '*' or tag == etag:
+            return True
+    return False
+
+
+def _make_status_line(status):
+    return '%d %s' % (status, responses.get(status, ''))
+
+
+class TemplateResponse(object):
+
+    """
+    An HTTP response whose body is the rendering of a template.
+
+    An instance renders its template once, when it is served.
+
+    """
+
+    def __init__(self, template, context=None, renderer=None, flush_after=None,
+                 status=200, headers=None, content_type='text/html', encoding='utf-8'):
+        """
+        Arguments:
+
+          template: a template, as for Renderer.render().
+
+          context: the context, as for Renderer.render_bytes().
+
+          renderer: the Renderer instance with which to render.  Defaults
+            to a default Renderer.
+
+          flush_after: a list of strings after which to send the output
+            rendered so far, e.g. ['</head>'].  Defaults to None, for
+            rendering the whole page before sending it.  See iter_chunks()
+            for where a flush point can be found.
+
+          status: the integer HTTP status code.  Defaults to 200.
+
+          headers: a list of additional (name, value) header pairs.
+
+          content_type: the media type of the Content-Type header.  The
+            charset parameter is added from the encoding.
+
+          encoding: the name of the encoding of the response body.
+            Defaults to UTF-8.
+
+        """
+        if renderer is None:
+            renderer = Renderer()
+        if flush_after is None:
+            flush_after = []
+        if headers is None:
+            headers = []
+
+        # Empty markers would split the output at every position.
+        markers = [marker.encode(encoding) for marker in flush_after if marker]
+
+        self.context = context
+        self.content_type = content_type
+        self.encoding = encoding
+        self.headers = headers
+        self.markers = markers
+        self.renderer = renderer
+        self.status = status
+        self.template = template
+
+    def is_streaming(self):
+        """
+        Return whether the response is sent in chunks at flush points.
+
+        """
+        return bool(self.markers)
+
+    def _get_headers(self):
+        # The str() call is for Python 2, where WSGI requires headers of
+        # type str and the encoding may be given as unicode.
+        content_type = str('%s; charset=%s' % (self.content_type, self.encoding))
+        return [('Content-Type', content_type)] + list(self.headers)
+
+    def render(self):
+        """
+        Return the body of the response as a single byte string.
+
+        """
+        return self.renderer.render_bytes(self.template, self.context, self.encoding)
+
+    def iter_render(self):
+        """
+        Return an iterator over the chunks of the body of the response.
+
+        Each chunk ends at a flush point, except the last.
+
+        """
+        renderer = self.renderer
+        parsed, prefix = renderer._get_parsed(self.template, ())
+        stack = ContextStack.create(*(prefix + (self.context, )))
+        engine = renderer._make_render_engine(self.encoding)
+
+        iter_func = lambda engine, stack: parsed.iter_render_bytes(engine, stack)
+        pieces = renderer._iter_with(iter_func, engine, stack)
+
+        return iter_chunks(pieces, self.markers)
+
+    def _render_buffered(self, if_none_match):
+        """
+        Render the whole body, and return a (status, headers, body) tuple.
+
+        """
+        body = self.render()
+        etag = _make_etag(body)
+
+        if self.status == 200 and _is_etag_match(if_none_match, etag):
+            return 304, [('ETag', etag)], _EMPTY_BYTES
+
+        headers = self._get_headers()
+        headers.append(('Content-Length', str(len(body))))
+        headers.append(('ETag', etag))
+
+        return self.status, headers, body
+
+    def wsgi(self, environ, start_response):
+        """
+        Serve the response as a WSGI application.
+
+        Returns the WSGI iterable.  When streaming, the server sends each
+        chunk as the iterable yields it.
+
+        """
+        if not self.is_streaming():
+            status, headers, body = self._render_buffered(environ.get('HTTP_IF_NONE_MATCH'))
+            start_response(_make_status_line(status), headers)
+            return [body]
+
+        start_response(_make_status_line(self.status), self._get_headers())
+        return self.iter_render()
+
+    def asgi(self, scope, receive, send):
+        """
+        Serve the response as an ASGI application, and return an awaitable.
+
+        The template is rendered on the event loop's default executor, so
+        that rendering does not block the event loop.
+
+        """
+        _check_asyncio()
+        loop = _get_loop()
+        writer = _ASGIWriter(loop, send)
+
+        if not self.is_streaming():
+            if_none_match = None
+            for name, value in scope.get('headers', []):
+                if name.lower() == 'if-none-match'.encode('ascii'):
+                    if_none_match = value.decode('latin-1')
+
+            def on_rendered(future):
+                if not writer.check(future):
+                    return
+                status, headers, body = future.result()
+                writer.send(_make_start_message(status, headers),
+                            lambda: writer.send(_make_body_message(body, False), writer.finish))
+
+            rendered = loop.run_in_executor(None, self._render_buffered, if_none_match)
+            rendered.add_done_callback(on_rendered)
+
+            return writer.done
+
+        chunks = _AsyncIterator(loop, self.iter_render())
+
+        def send_next():
+            chunks.__anext__().add_done_callback(on_chunk)
+
+        def on_chunk(future):
+            if not future.cancelled() and isinstance(future.exception(), StopAsyncIteration):
+                writer.send(_make_body_message(_EMPTY_BYTES, False), writer.finish)
+                return
+            if writer.check(future):
+                writer.send(_make_body_message(future.result(), True), send_next)
+
+        # This stops the rendering if the response fails (e.g. because the
+        # client disconnected), and does nothing once it has finished.
+        writer.done.add_done_callback(lambda future: chunks.aclose())
+
+        writer.send(_make_start_message(self.status, self._get_headers()), send_next)
+
+        return writer.done
+
+
+def _make_start_message(status, headers):
+    headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+               for name, value in headers]
+    return {'type': 'http.response.start', 'status': status, 'headers': headers}
+
+
+def _make_body_message(body, more_body):
+    return {'type': 'http.response.body', 'body': body, 'more_body': more_body}
+
+
+class _ASGIWriter(object):
+
+    """
+    Sends ASGI messages one after another without using coroutines.
+
+    The done attribute is a future that completes when the response is
+    finished, or fails with the first error.
+
+    """
+
+    def __init__(self, loop, send):
+        self._send = send
+        self.done = loop.create_future()
+
+    def check(self, future):
+        """
+        Return whether the given future succeeded, and fail done otherwise.
+
+        """
+        if self.done.done():
+            return False
+        if future.cancelled():
+            self.done.cancel()
+            return False
+        error = future.exception()
+        if error is not None:
+            self.done.set_exception(error)
+            return False
+        return True
+
+    def send(self, message, then):
+        """
+        Send a message, and call then() once it is sent.
+
+        """
+        def on_sent(future):
+            if self.check(future):
+                then()
+
+        asyncio.ensure_future(self._send(message)).add_done_callback(on_sent)
+
+    def finish(self):
+        if not self.done.done():
+            self.done.set_result(None)